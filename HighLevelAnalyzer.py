@@ -2,10 +2,29 @@
 # For more information and documentation, please go to https://support.saleae.com/extensions/high-level-analyzer-extensions
 # for SX126x --- https://www.semtech.com/products/wireless-rf/lora-connect/sx1262
 
-from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, StringSetting, NumberSetting, ChoicesSetting
+try:
+    from saleae.analyzers import HighLevelAnalyzer, AnalyzerFrame, StringSetting, NumberSetting, ChoicesSetting
+except ImportError:
+    # outside of Logic 2, e.g. batch.py
+    from headless import HighLevelAnalyzer, AnalyzerFrame, StringSetting, NumberSetting, ChoicesSetting
 import ctypes
+from bisect import bisect_right
+import re
 import types
 from enum import Enum
+from shadow import BufferShadow, ConfigShadow, changesString
+from airtime import timeOnAir
+from dutycycle import DutyCycle, plans
+from latency import Latency, frameTypes as latencyTypes
+from polling import PollRuns, pollOpcodes
+from redundant import Redundant, opcodes as redundantOpcodes
+from memo import LruCache
+from energy import Energy, loadCurrents
+from lorawan import LoRaWAN, loadKeys
+from columns import ColumnWriter
+from index import IndexWriter
+from linkquality import LinkQuality, frameTypes as linkTypes, levelNames as linkBuckets
+from diagnostics import Diagnostics, DEBUG, WARNING, ERROR, levels as diagnosticLevels
 c_uint8 = ctypes.c_uint8
 c_uint16 = ctypes.c_uint16
 
@@ -89,11 +108,165 @@ class SleepConfig( ctypes.Union ):
                  ("asByte", c_uint8    )
                 ]
 
+def _statusToString(arg):
+    status = Status()
+    status.asByte = arg
+    if status.chipMode == 2:
+        chipMode = 'STBY_RC'
+    elif status.chipMode == 3:
+        chipMode = 'STBY_XOSC'
+    elif status.chipMode == 4:
+        chipMode = 'FS'
+    elif status.chipMode == 5:
+        chipMode = 'RX'
+    elif status.chipMode == 6:
+        chipMode = 'TX'
+    else:
+        chipMode = str(status.chipMode)
+
+    if status.cmdStatus == 2:
+        cmdStatus = 'dataAvail'
+    elif status.cmdStatus == 3:
+        cmdStatus = 'cmdTimeout'
+    elif status.cmdStatus == 4:
+        cmdStatus = 'cmdErr'
+    elif status.cmdStatus == 5:
+        cmdStatus = 'fail'
+    elif status.cmdStatus == 6:
+        cmdStatus = 'cmdTxDone'
+    else:
+        cmdStatus = str(status.cmdStatus)
+
+    return '(' + chipMode + ' ' + cmdStatus + ')'
+
+def _irqFlagsToString(word):
+    flags = IrqFlags()
+    flags.asWord = word
+    my_str = ''
+    if flags.TxDone == 1:
+        my_str = my_str + 'TxDone '
+    if flags.RxDone == 1:
+        my_str = my_str + 'RxDone '
+    if flags.PreambleDetected == 1:
+        my_str = my_str + 'PreambleDetected '
+    if flags.SyncWordValid == 1:
+        my_str = my_str + 'SyncWordValid '
+    if flags.HeaderValid == 1:
+        my_str = my_str + 'HeaderValid '
+    if flags.HeaderErr == 1:
+        my_str = my_str + 'HeaderErr '
+    if flags.CrcErr == 1:
+        my_str = my_str + 'CrcErr '
+    if flags.CadDone == 1:
+        my_str = my_str + 'CadDone '
+    if flags.CadDetected == 1:
+        my_str = my_str + 'CadDetected '
+    if flags.Timeout == 1:
+        my_str = my_str + 'Timeout '
+    if flags.RFU != 0:
+        my_str = my_str + 'RFU '
+    if flags.LrFhssHop == 1:
+        my_str = my_str + 'LrFhssHop '
+    if flags.RFU15 == 1:
+        my_str = my_str + 'RFU15 '
+    return my_str
+
+def _fskRxStatusToString(arg):
+    frs = FskRxStatus()
+    frs.asByte = arg
+    my_str = ''
+    if frs.sent == 1:
+        my_str = my_str + 'pkt_sent '
+    if frs.recevied == 1:
+        my_str = my_str + 'pkt_recevied '
+    if frs.abort_err == 1:
+        my_str = my_str + 'abort_err '
+    if frs.length_err == 1:
+        my_str = my_str + 'length_err '
+    if frs.crc_err == 1:
+        my_str = my_str + 'crc_err '
+    if frs.adrs_err == 1:
+        my_str = my_str + 'adrs_err '
+    if frs.sync_err == 1:
+        my_str = my_str + 'sync_err '
+    if frs.preamble_err == 1:
+        my_str = my_str + 'preamble_err '
+    return my_str
+
+IRQ_TX_DONE = 0x0001
+
+# Hla.memoTable flags: memoized, key includes the MISO, key includes the packet type
+MEMO = 1
+MEMO_MISO = 2
+MEMO_PT = 4
+
+# lookup tables built once at import, so decoding a status byte or IRQ word is
+# an index instead of a ctypes union and a chain of tests per transaction.
+# IRQ words are split in two bytes: bits 0..7 are the low fragment, bits 8..15
+# the high fragment; the flag order within the string is unchanged.
+STATUS_STR = tuple(_statusToString(b) for b in range(256))
+FSK_RX_STATUS_STR = tuple(_fskRxStatusToString(b) for b in range(256))
+IRQ_LO_STR = tuple(_irqFlagsToString(b) for b in range(256))
+IRQ_HI_STR = tuple(_irqFlagsToString(b << 8) for b in range(256))
+
 # #define US_TO_SEMTEC_TICKS(X)                       (((X) * SEMTECH_TUS_IN_MSEC)/US_IN_MSEC)
 # #define US_TO_SEMTEC_TICKS(X)                       (((X) * 64                 )/1000      )
 
+def registerIndex(regDict):
+    # Sorted, non-overlapping intervals over the register map, for a binary
+    # search per register of a burst. Returns the interval starts and, for each
+    # one, (end, name, decoder, register start address).
+    registers = []
+    for addr, obj in regDict.items():
+        obj, size = obj if isinstance(obj, tuple) else (obj, 1)
+        if isinstance(obj, str):
+            registers.append((addr, addr + size, obj, None))
+        else:
+            registers.append((addr, addr + size, obj.__name__, obj))
+    bounds = sorted({r[0] for r in registers} | {r[1] for r in registers})
+    starts = []
+    intervals = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        inside = [r for r in registers if r[0] <= lo and hi <= r[1]]
+        if not inside:
+            continue
+        start, end, name, decoder = min(inside, key=lambda r: r[1] - r[0])
+        if intervals and intervals[-1][3] == start and intervals[-1][0] == lo:
+            intervals[-1] = (hi,) + intervals[-1][1:]
+        else:
+            starts.append(lo)
+            intervals.append((hi, name, decoder, start))
+    return starts, intervals
+
+
 # High level analyzers must subclass the HighLevelAnalyzer class.
 class Hla(HighLevelAnalyzer):
+    duty_cycle = ChoicesSetting(['off'] + list(plans), label='Duty cycle limit')
+    duty_cycle_window = NumberSetting(label='Duty cycle window (s, 0 for one hour)', min_value=0)
+    collapse_polling = ChoicesSetting(['off', 'on'], label='Collapse repeated polling')
+    verbosity = ChoicesSetting(['full', 'brief'], label='Frame detail')
+    show_config = ChoicesSetting(['on', 'off'], label='Show configuration commands')
+    show_control = ChoicesSetting(['on', 'off'], label='Show TX/RX control commands')
+    show_status = ChoicesSetting(['on', 'off'], label='Show IRQ/status polling')
+    show_registers = ChoicesSetting(['on', 'off'], label='Show register access')
+    show_buffer = ChoicesSetting(['on', 'off'], label='Show buffer access')
+    energy = ChoicesSetting(['off', 'on'], label='Radio mode timeline and charge')
+    energy_currents = StringSetting(label='Current table (JSON file, empty for SX1262 typical values)')
+    lorawan = ChoicesSetting(['off', 'on'], label='Decode LoRaWAN frames in TX/RX packets')
+    lorawan_keys = StringSetting(label='LoRaWAN key file (JSON, DevAddr: session keys)')
+    link_quality = ChoicesSetting(['off', 'on'], label='Link quality summary frames')
+    link_quality_bucket = ChoicesSetting(['1min', '1s', '10s', '10min', '1h'], label='Link quality frame period')
+    memoize = ChoicesSetting(['on', 'off'], label='Cache decoded repeated transactions')
+    diagnostics = ChoicesSetting(['warning', 'error', 'info', 'debug', 'off'], label='Diagnostics level')
+    # a choice rather than a number, so the default is 10 and not 0 (no limit)
+    diagnostics_rate = ChoicesSetting(['10', '1', '100', '1000', '0'],
+                                      label='Diagnostics per category per capture second (0 for no limit)')
+    diagnostics_file = StringSetting(label='Diagnostics file (empty for the console)')
+    # batch.py only (--columns, --index): the last rows are written by
+    # flush(), and Logic 2 has no end of capture call
+    columns_dir = ''
+    index_dir = ''
+
     fsk_bwDict = {
         0x1f: 4800,
         0x17: 5800,
@@ -118,21 +291,15 @@ class Hla(HighLevelAnalyzer):
         0x09: 467000,
     }
 
-    def LoRaConfig0(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def LoRaConfig0(self, data, is_write):
+        val = data[0]
         bws = { 5:500, 4:250, 3:125, 2:62, 1:31, 0:15 }
         bw = val >> 4
         sf = val & 0x0f
-        return 'LoRaConfig0 '+bws.get(bw, '?'+hex(bw)+'?')+'KHz sf'+str(sf)
+        return 'LoRaConfig0 '+str(bws.get(bw, '?'+hex(bw)+'?'))+'KHz sf'+str(sf)
 
-    def LoRaConfig1(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def LoRaConfig1(self, data, is_write):
+        val = data[0]
         if val & 0x80:
             _str = 'implicit '
         else:
@@ -149,20 +316,20 @@ class Hla(HighLevelAnalyzer):
         _str = _str + 'txcr:'+str(txcr)
         return 'LoRaConfig1 '+_str
 
-    def LoRaStatus0(self, is_write):
+    def LoRaStatus0(self, data, is_write):
         if is_write:
             _str = 'READ-ONLY'
         else:
-            val = self.ba_miso[4]
+            val = data[0]
             _str = ' ppm_offset:'+str(val>>7) # mux sel
             _str = _str + ' CR'+str((val >> 4) & 0x7)
         return 'LoRaStatus0 rx_header '+_str
 
-    def LoRaStatus1(self, is_write):
+    def LoRaStatus1(self, data, is_write):
         if is_write:
             _str = 'READ-ONLY'
-        else: # TODO read of more than 1byte to get est_freq_error
-            val = self.ba_miso[4]
+        else:
+            val = data[0]
             _str = ''
             if val & 0x80:
                 _str = _str + 'range_result '
@@ -170,14 +337,20 @@ class Hla(HighLevelAnalyzer):
             _str = _str + 'rf_en_request='+str(rf_en_request)+' '
             if val & 0x10:
                 _str = _str + 'header_crc16_en '
-            self.est_freq_error = (val & 0x0f) << 16
+            if len(data) >= 3:
+                # 20 bit two's complement, with the next two registers
+                est = ((val & 0x0f) << 16) | (data[1] << 8) | data[2]
+                if est & 0x80000:
+                    est -= 0x100000
+                self.est_freq_error = est
+                _str = _str + 'est_freq_error='+str(est)
         return 'LoRaStatus1 '+_str
 
-    def LoRaStatus2(self, is_write):
+    def LoRaStatus2(self, data, is_write):
         if is_write:
             _str = 'READ-ONLY'
         else:
-            val = self.ba_miso[4]
+            val = data[0]
             _str = ''
             if val & 2:
                 _str = _str + 'max_bin_pos_changed '
@@ -185,11 +358,8 @@ class Hla(HighLevelAnalyzer):
                 _str = _str + 'last_frame_side_detected '
         return 'LoRaStatus2 '+_str
 
-    def SideDetCtrl0(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def SideDetCtrl0(self, data, is_write):
+        val = data[0]
         if val & 0x80:
             _str = 'enabled'
         else:
@@ -200,11 +370,8 @@ class Hla(HighLevelAnalyzer):
         _str = _str + ' ppm_offset:'+str(val & 0x03)
         return 'SideDetCtrl0 ' + _str
 
-    def SideDetCtrl1(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def SideDetCtrl1(self, data, is_write):
+        val = data[0]
         _str = 'ppm_offset_hc:'+str(val >> 6)+' '
         if val & 0x20:
             _str = _str + 'chirp_invert '
@@ -213,40 +380,33 @@ class Hla(HighLevelAnalyzer):
         self.side_det_f_to_time_inv = (val & 3) << 8
         return 'SideDetCtrl1 '+_str
 
-    def SideDetCtrl2(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def SideDetCtrl2(self, data, is_write):
+        val = data[0]
         return 'SideDetCtrl2 f_to_time_inv='+str(self.side_det_f_to_time_inv | val)
 
-    def SideDetCtrl3(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def SideDetCtrl3(self, data, is_write):
+        val = data[0]
         return 'SideDetCtrl3 acc_peak_to_noise='+str(val)
 
-    def TxClampConfig(self, is_write):
-        if is_write:
-            val = self.ba_mosi[3]
-        else:
-            val = self.ba_miso[4]
+    def TxClampConfig(self, data, is_write):
+        val = data[0]
         return 'TxClampConfig ('+hex(val)+')'
 
+    # start address: name or decoder, or (name or decoder, size in bytes) for
+    # registers wider than one byte. Ranges may nest, the innermost one wins.
     regDict = {
-        # 0x200 to 0x3ff is data ram
+        0x200: ('DataRam', 0x200),
         0x29f: 'RetentionListBaseAddress',
         0x580: "dio_out_en", # OUT_DIS_REG
         0x581: "dio_out_val",
         0x583: "dio_in_en", # IN_EN_REG
         0x587: "dio_alt_cfg", # BITBANG_B_REG
         0x680: "BitbangA",
-        0x6b8: 'WhiteningSeedBase',
+        0x6b8: ('WhiteningSeedBase', 2),
         0x6bb: 'PayloadLength', # RxTxPldLen
-        0x6bc: 'CrcSeedBase',
-        0x6be: 'CrcPolyBase',
-        0x6c0: 'SyncWord',
+        0x6bc: ('CrcSeedBase', 2),
+        0x6be: ('CrcPolyBase', 2),
+        0x6c0: ('SyncWord', 8),
         0x6cd: 'GfskNodeAddress',
         0x6ce: 'GfskBroadcastAddress',
         0x703: LoRaConfig0,
@@ -256,7 +416,7 @@ class Hla(HighLevelAnalyzer):
         0x740: 'LoRaSyncMSB', # LoRa Config22
         0x741: 'LoRaSyncLSB', # LoRa Config23
         0x749: LoRaStatus0, # LR_HEADER_CR
-        0x76b: LoRaStatus1, # LR_HEADER_CRC
+        0x76b: (LoRaStatus1, 3), # LR_HEADER_CRC, est_freq_error in the low nibble and the next two
         0x796: LoRaStatus2,
         0x797: SideDetCtrl0,
         0x7c8: 'SideDetectFrameSynchPeak1Pos',
@@ -266,7 +426,7 @@ class Hla(HighLevelAnalyzer):
         0x79a: SideDetCtrl3,
         0x802: 'txAddrPtr',
         0x803: 'rxAddrPtr',
-        0x819: 'RngBaseAddress',
+        0x819: ('RngBaseAddress', 4),
         0x889: 'TxModulation',
         0x8ac: 'RxGain',
         0x8d8: TxClampConfig,
@@ -278,6 +438,7 @@ class Hla(HighLevelAnalyzer):
         0x912: 'XTBtrim',
         0x944: 'EvtClr',
     }
+    regStarts, regIntervals = registerIndex(regDict)
 
     lora_bws = {
         0x00: 7.81,
@@ -293,67 +454,36 @@ class Hla(HighLevelAnalyzer):
     }
 
     def parseStatus(self, arg):
-        status = Status()
-        status.asByte = arg
-        if status.chipMode == 2:
-            chipMode = 'STBY_RC'
-        elif status.chipMode == 3:
-            chipMode = 'STBY_XOSC'
-        elif status.chipMode == 4:
-            chipMode = 'FS'
-        elif status.chipMode == 5:
-            chipMode = 'RX'
-        elif status.chipMode == 6:
-            chipMode = 'TX'
-        else:
-            chipMode = str(status.chipMode)
-
-        if status.cmdStatus == 2:
-            cmdStatus = 'dataAvail'
-        elif status.cmdStatus == 3:
-            cmdStatus = 'cmdTimeout'
-        elif status.cmdStatus == 4:
-            cmdStatus = 'cmdErr'
-        elif status.cmdStatus == 5:
-            cmdStatus = 'fail'
-        elif status.cmdStatus == 6:
-            cmdStatus = 'cmdTxDone'
-        else:
-            cmdStatus = str(status.cmdStatus)
-
-        return '(' + chipMode + ' ' + cmdStatus + ')'
+        return STATUS_STR[arg]
+
+    def pulseShape(self, pulseShape):
+        if pulseShape == 0:
+            return 'noFilter'
+        elif pulseShape == 8:
+            return 'BT 0.3'
+        elif pulseShape == 9:
+            return 'BT 0.5'
+        elif pulseShape == 0x0a:
+            return 'BT 0.7'
+        elif pulseShape == 0x0b:
+            return 'BT 1.0'
+        return hex(pulseShape)
 
     def SetModulationParams(self):
+        # cmdDict only checks the shortest (LoRa, BPSK) length
         if self.pt == PacketType.FSK:
-            br = int.from_bytes(bytearray(self.ba_mosi[1:4]), 'big')
-            bps = 32 * 32000000 / br
-            my_str = str(bps) + 'bps '
-            pulseShape = self.ba_mosi[4]
-            if pulseShape == 0:
-                my_str = my_str + 'noFilter'
-            elif pulseShape == 8:
-                my_str = my_str + 'BT 0.3'
-            elif pulseShape == 9:
-                my_str = my_str + 'BT 0.5'
-            elif pulseShape == 0x0a:
-                my_str = my_str + 'BT 0.7'
-            elif pulseShape == 0x0b:
-                my_str = my_str + 'BT 1.0'
-            else:
-                my_str = my_str + hex(pulseShape)
-            try:
-                bw = self.fsk_bwDict[self.ba_mosi[5]]
-                my_str = my_str + ' bw=' + str(bw) + 'Hz '
-            except Exception as error:
-                my_str = my_str + ' BW(' + hex(self.ba_mosi[5]) + ' ' + str(error) + ') '
-            fdev = int.from_bytes(bytearray(self.ba_mosi[6:9]), 'big')
-            hz = fdev*32000000/(1<<25)
-            my_str = my_str + ' fdev=' + str(round(hz)) + "Hz"
+            if len(self.ba_mosi) < 9:
+                return self.truncated()
+            br = int.from_bytes(self.ba_mosi[1:4], 'big')
+            bw = self.fsk_bwDict.get(self.ba_mosi[5], hex(self.ba_mosi[5]))
+            fdev = int.from_bytes(self.ba_mosi[6:9], 'big')
+            return 'SetModulationParamsFSK', {
+                'bps': 32 * 32000000 / br,
+                'pulse_shape': self.pulseShape(self.ba_mosi[4]),
+                'bw_hz': bw,
+                'fdev_hz': round(fdev*32000000/(1<<25)),
+            }
         elif self.pt == PacketType.LORA:
-            sf = self.ba_mosi[1]
-            my_str = 'SF' + str(sf)
-            bw = self.ba_mosi[2]
-            my_str = my_str + ' bw ' + str(self.lora_bws[bw]) + 'KHz'
             cr = self.ba_mosi[3]
             if cr == 1:
                 crStr = '4/5'
@@ -365,7 +495,6 @@ class Hla(HighLevelAnalyzer):
                 crStr = '4/8'
             else:
                 crStr = hex(cr)
-            my_str = my_str + ' CR' + crStr
             ldro = self.ba_mosi[4]
             if ldro == 0:
                 ldroStr = 'OFF'
@@ -373,28 +502,22 @@ class Hla(HighLevelAnalyzer):
                 ldroStr = 'ON'
             else:
                 ldroStr = hex(ldro)
-            my_str = my_str + ' LDRO ' + ldroStr
+            return 'SetModulationParamsLoRa', {
+                'sf': self.ba_mosi[1],
+                'bw': self.ba_mosi[2],
+                'bw_khz': self.lora_bws[self.ba_mosi[2]],
+                'cr': cr,
+                'cr_str': crStr,
+                'ldro': ldro,
+                'ldro_str': ldroStr,
+            }
         elif self.pt == PacketType.BPSK:
-            br = int.from_bytes(bytearray(self.ba_mosi[1:4]), 'big')
-            bps = 32 * 32000000 / br
-            my_str = str(bps) + 'bps '
-            pulseShape = self.ba_mosi[4]
-            if pulseShape == 0:
-                my_str = my_str + 'noFilter'
-            elif pulseShape == 8:
-                my_str = my_str + 'BT 0.3'
-            elif pulseShape == 9:
-                my_str = my_str + 'BT 0.5'
-            elif pulseShape == 0x0a:
-                my_str = my_str + 'BT 0.7'
-            elif pulseShape == 0x0b:
-                my_str = my_str + 'BT 1.0'
-            else:
-                my_str = my_str + hex(pulseShape)
-        else:
-            my_str = 'TODO pktType ' + str(self.pt)
-
-        return 'SetModulationParams ' + my_str
+            br = int.from_bytes(self.ba_mosi[1:4], 'big')
+            return 'SetModulationParamsBPSK', {
+                'bps': 32 * 32000000 / br,
+                'pulse_shape': self.pulseShape(self.ba_mosi[4]),
+            }
+        return 'SetModulationParams', {'packet_type': str(self.pt)}
 
     def SetPacketParams(self):
         if self.pt == PacketType.NONE:
@@ -408,25 +531,21 @@ class Hla(HighLevelAnalyzer):
                 self.pt = PacketType.BPSK
 
         if self.pt == PacketType.FSK:
-            preambleLength = int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big')
-            my_str = 'tx_preamble ' + str(preambleLength)
+            if len(self.ba_mosi) < 10:
+                return self.truncated()
             detect = self.ba_mosi[3]
             if detect == 0:
                 n_bits = 'OFF'
             elif detect == 4:
                 n_bits = '8'
             elif detect == 5:
-                n_bits = '16 '
+                n_bits = '16'
             elif detect == 6:
                 n_bits = '24'
             elif detect == 7:
                 n_bits = '32'
             else:
                 n_bits = '?'
-            my_str = my_str + ' detect ' + n_bits + 'bits '
-
-            syncWordBits = self.ba_mosi[4]
-            my_str = my_str + ' syncWord ' + str(syncWordBits) + 'bits '
 
             addrComp = self.ba_mosi[5]
             if addrComp == 0:
@@ -437,16 +556,6 @@ class Hla(HighLevelAnalyzer):
                 addrFilt = 'node & bcast'
             else:
                 addrFilt = '?'
-            my_str = my_str + ' addrFilt ' + addrFilt
-
-            varLen = self.ba_mosi[6]
-            if varLen == 0:
-                my_str = my_str + ' fixLen'
-            else:
-                my_str = my_str + ' varLen'
-
-            payLen = self.ba_mosi[7]
-            my_str = my_str + ' payLen ' + str(payLen )
 
             crcType = self.ba_mosi[8]
             if crcType == 1:
@@ -461,19 +570,33 @@ class Hla(HighLevelAnalyzer):
                 crc = '2_BYTE_INV'
             else:
                 crc = hex(crcType)
-            my_str = my_str + ' CRC ' + str(crc)
+
             dcFree = self.ba_mosi[9]
             if dcFree == 0:
-                my_str = my_str + ' dcFree_OFF'
+                dcFreeStr = 'OFF'
             elif dcFree == 1:
-                my_str = my_str + ' dcFree_WHITENING'
+                dcFreeStr = 'WHITENING'
             elif dcFree == 2:
-                my_str = my_str + ' dcFree_MANCHESTER'
+                dcFreeStr = 'MANCHESTER'
             else:
-                my_str = my_str + ' dcFree_' + hex(dcFree)
+                dcFreeStr = hex(dcFree)
+
+            return 'SetPacketParamsFSK', {
+                'preamble_len': int.from_bytes(self.ba_mosi[1:3], 'big'),
+                'detect': n_bits,
+                'sync_word_bits': self.ba_mosi[4],
+                'addr_comp': addrComp,
+                'addr_filt': addrFilt,
+                'var_len': self.ba_mosi[6],
+                'len_mode': 'fixLen' if self.ba_mosi[6] == 0 else 'varLen',
+                'payload_len': self.ba_mosi[7],
+                'crc_type': crcType,
+                'crc': crc,
+                'dc_free': dcFreeStr,
+            }
         elif self.pt == PacketType.LORA:
-            preambleLength = int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big')
-            my_str = 'preamble ' + str(preambleLength)
+            if len(self.ba_mosi) < 7:
+                return self.truncated()
             headerType = self.ba_mosi[3]
             if headerType == 0:
                 hdrStr = 'varLen'
@@ -481,9 +604,6 @@ class Hla(HighLevelAnalyzer):
                 hdrStr = 'fixrLen'
             else:
                 hdrStr = hex(headerType)
-            my_str = my_str + ' header ' + hdrStr
-            payLen = self.ba_mosi[4]
-            my_str = my_str + ' payLen' + str(payLen)
             crcOn = self.ba_mosi[5]
             if crcOn == 0:
                 crcStr = 'OFF'
@@ -491,7 +611,6 @@ class Hla(HighLevelAnalyzer):
                 crcStr = 'ON'
             else:
                 crcStr = hex(crcOn)
-            my_str = my_str + ' CRC_' + crcStr
             iqInv= self.ba_mosi[6]
             if iqInv == 0:
                 iqStr = 'STD'
@@ -499,37 +618,49 @@ class Hla(HighLevelAnalyzer):
                 iqStr = 'INV'
             else:
                 iqStr = hex(iqInv)
-            my_str = my_str + ' IQ ' + iqStr
+            return 'SetPacketParamsLoRa', {
+                'preamble_len': int.from_bytes(self.ba_mosi[1:3], 'big'),
+                'header_type': headerType,
+                'header': hdrStr,
+                'payload_len': self.ba_mosi[4],
+                'crc_on': crcOn,
+                'crc': crcStr,
+                'iq': iqStr,
+            }
         elif self.pt == PacketType.BPSK:
-            payLen = self.ba_mosi[1]
-            my_str = 'payLen ' + str(payLen) + 'bytes (note: ramp_up/down_delay and pld_len_in_bits written to reg 0x00F0)'
-        else:
-            my_str = 'TODO pktType ' + str(self.pt) + ', mosi length ' + str(len(self.ba_mosi))
-
-        return 'SetPacketParams ' + my_str
+            return 'SetPacketParamsBPSK', {'payload_len': self.ba_mosi[1]}
+        return 'SetPacketParams', {'packet_type': str(self.pt), 'length': len(self.ba_mosi)}
 
     def SetRfFrequency(self):
-        frf = int.from_bytes(bytearray(self.ba_mosi[1:5]), 'big')
+        frf = int.from_bytes(self.ba_mosi[1:5], 'big')
         # Convert from PLL steps to Hz using sx126x_convert_freq_in_hz_to_pll_step() inverse
         # SX126X_XTAL_FREQ = 32000000, SX126X_PLL_STEP_SHIFT_AMOUNT = 14
         # SX126X_PLL_STEP_SCALED = 32000000 >> (25 - 14) = 32000000 >> 11 = 15625
         freq_hz = (frf * 15625) >> 14
-        freq_mhz = freq_hz / 1000000.0
-        return 'SetRfFrequency ' + str(frf) + ' (%.3fMHz)' % freq_mhz
+        return 'SetRfFrequency', {
+            'frf': frf,
+            'freq_hz': freq_hz,
+            'freq_mhz': round(freq_hz / 1000000.0, 3),
+            'freq_mhz_str': '%.3f' % (freq_hz / 1000000.0),
+        }
 
     def SetCadParams(self):
-        cadSymbolNum = self.ba_mosi[1]
-        cadDetPeak = self.ba_mosi[2]
-        cadDetMin = self.ba_mosi[3]
+        timeout = int.from_bytes(self.ba_mosi[5:7], 'big')
         cadExitMode = self.ba_mosi[4]
-        cadTimeout = int.from_bytes(bytearray(self.ba_mosi[5:7]), 'big')
         if cadExitMode == 0:
             exitStr = 'CAD_ONLY'
         elif cadExitMode == 1:
             exitStr = 'CAD_RX'
         else:
             exitStr = hex(cadExitMode)
-        return 'SetCadParams cadSymbolNum ' + str(1<<cadSymbolNum) + ', cadDetPeak ' + str(cadDetPeak) + ', cadDetMin ' + str(cadDetMin) + ', exit ' + exitStr + ', timeout ' + hex(cadTimeout)
+        return 'SetCadParams', {
+            'cad_symbol_num': 1 << self.ba_mosi[1],
+            'cad_det_peak': self.ba_mosi[2],
+            'cad_det_min': self.ba_mosi[3],
+            'exit': exitStr,
+            'timeout': timeout,
+            'timeout_hex': hex(timeout),
+        }
 
     def SetPacketType(self):
         if self.ba_mosi[1] == 0:
@@ -544,7 +675,7 @@ class Hla(HighLevelAnalyzer):
         else:
             self.pt = PacketType.NONE
             my_str = str(self.ba_mosi[1])
-        return 'SetPacketType ' + my_str
+        return 'SetPacketType', {'packet_type': my_str}
 
     def GetPacketType(self):
         if self.ba_miso[2] == 0:
@@ -559,129 +690,116 @@ class Hla(HighLevelAnalyzer):
         else:
             self.pt = PacketType.NONE
             my_str = str(self.ba_mosi[1])
-        return 'GetPacketType ' + my_str
+        return 'GetPacketType', {'packet_type': my_str}
 
     def irqFlagsToString(self, word):
-        flags = IrqFlags()
-        flags.asWord = word
-        my_str = ''
-        if flags.TxDone == 1:
-            my_str = my_str + 'TxDone '
-        if flags.RxDone == 1:
-            my_str = my_str + 'RxDone '
-        if flags.PreambleDetected == 1:
-            my_str = my_str + 'PreambleDetected '
-        if flags.SyncWordValid == 1:
-            my_str = my_str + 'SyncWordValid '
-        if flags.HeaderValid == 1:
-            my_str = my_str + 'HeaderValid '
-        if flags.HeaderErr == 1:
-            my_str = my_str + 'HeaderErr '
-        if flags.CrcErr == 1:
-            my_str = my_str + 'CrcErr '
-        if flags.CadDone == 1:
-            my_str = my_str + 'CadDone '
-        if flags.CadDetected == 1:
-            my_str = my_str + 'CadDetected '
-        if flags.Timeout == 1:
-            my_str = my_str + 'Timeout '
-        if flags.RFU != 0:
-            my_str = my_str + 'RFU '
-        if flags.LrFhssHop == 1:
-            my_str = my_str + 'LrFhssHop '
-        if flags.RFU15 == 1:
-            my_str = my_str + 'RFU15 '
-        return my_str
+        return IRQ_LO_STR[word & 0xff] + IRQ_HI_STR[word >> 8]
 
 
     def GetIrqStatus(self):
-        str = self.irqFlagsToString(int.from_bytes(bytearray(self.ba_miso[2:4]), 'big'))
-        return 'GetIrqStatus ' + str
+        irq = int.from_bytes(self.ba_miso[2:4], 'big')
+        return 'GetIrqStatus', {'irq': irq, 'flags': self.irqFlagsToString(irq)}
 
     def GetRxBufferStatus(self):
-        PayloadLengthRx = self.ba_miso[2]
-        RxStartBufferPointer = self.ba_miso[3]
-        return 'GetRxBufferStatus ' + str(PayloadLengthRx) + 'bytes at ' + str(RxStartBufferPointer)
+        return 'GetRxBufferStatus', {'payload_len': self.ba_miso[2], 'rx_start': self.ba_miso[3]}
 
     def GetPacketStatus(self):
         if self.pt == PacketType.FSK:
-            frs = FskRxStatus()
-            frs.asByte = self.ba_miso[2]
-            RssiSync = self.ba_miso[3]
-            RssiAvg  = self.ba_miso[4]
-            my_str = 'rssi:' + str(RssiSync/-2) + 'dBm, ' + str(RssiAvg/-2) + 'dBm '
-            if frs.sent == 1:
-                my_str = my_str + 'pkt_sent '
-            if frs.recevied == 1:
-                my_str = my_str + 'pkt_recevied '
-            if frs.abort_err == 1:
-                my_str = my_str + 'abort_err '
-            if frs.length_err == 1:
-                my_str = my_str + 'length_err '
-            if frs.crc_err == 1:
-                my_str = my_str + 'crc_err '
-            if frs.adrs_err == 1:
-                my_str = my_str + 'adrs_err '
-            if frs.sync_err == 1:
-                my_str = my_str + 'sync_err '
-            if frs.preamble_err == 1:
-                my_str = my_str + 'preamble_err '
+            return 'GetPacketStatusFSK', {
+                'rx_status': self.ba_miso[2],
+                'flags': FSK_RX_STATUS_STR[self.ba_miso[2]],
+                'rssi_sync': self.ba_miso[3]/-2,
+                'rssi_avg': self.ba_miso[4]/-2,
+            }
         elif self.pt == PacketType.LORA:
-            RssiPkt  = self.ba_miso[2]
-            SnrPkt  = self.ba_miso[3]
-            SignalRssiPkt  = self.ba_miso[4]
-            my_str = 'rssi:' + str(RssiPkt/-2) + 'dBm SNR='+str(SnrPkt/4)+'dB signal='+str(SignalRssiPkt/-2) + 'dBm '
-        else:
-            my_str = 'TODO pktType ' + str(self.pt)
-        return 'GetPacketStatus ' + my_str
+            return 'GetPacketStatusLoRa', {
+                'rssi': self.ba_miso[2]/-2,
+                'snr': self.ba_miso[3]/4,
+                'signal_rssi': self.ba_miso[4]/-2,
+            }
+        return 'GetPacketStatus', {'packet_type': str(self.pt)}
 
     def ClearIrqStatus(self):
-        str = self.irqFlagsToString(int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big'))
-        return 'ClearIrqStatus ' + str
+        irq = int.from_bytes(self.ba_mosi[1:3], 'big')
+        return 'ClearIrqStatus', {'irq': irq, 'flags': self.irqFlagsToString(irq)}
+
+    def registerString(self, addr, is_write, data):
+        # names (or decoded values) of the registers of a burst of data
+        # starting at addr, or of addr alone when there is no data
+        starts = self.regStarts
+        intervals = self.regIntervals
+        n = len(data)
+        parts = []
+        i = 0
+        while True:
+            pos = addr + i
+            k = bisect_right(starts, pos) - 1
+            if k >= 0 and pos < intervals[k][0]:
+                end, name, decoder, start = intervals[k]
+                if pos != start:
+                    name = name + '+' + hex(pos - start)
+                elif decoder is not None and i < n:
+                    name = decoder(self, data[i:i + end - pos], is_write)
+                parts.append('at ' + hex(pos) + ' ' + name)
+            else:
+                # not in the map, up to the next register
+                end = starts[k + 1] if k + 1 < len(starts) else pos + n
+                parts.append(hex(pos))
+            i += end - pos
+            if i >= n:
+                return ', '.join(parts)
 
     def ReadRegister(self):
-        addr = int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big')
+        addr = int.from_bytes(self.ba_mosi[1:3], 'big')
         array_alpha = self.ba_miso[4:]
-        data_str = ''.join('{:02x}'.format(x) for x in array_alpha)
-        try:
-            obj = self.regDict[addr]
-            if isinstance(obj, types.FunctionType):
-                regStr = 'at ' + hex(addr) + ' ' + obj(self, False)
-            else:
-                regStr = 'at ' + hex(addr) + ' ' + obj
-        except Exception as error:
-            regStr = hex(addr) + ' regDict:' + str(error)
-        return 'ReadRegister ' + regStr + ' --> ' + data_str
+        return 'ReadRegister', {
+            'addr': addr,
+            'reg': self.registerString(addr, False, array_alpha),
+            'value': array_alpha[0] if len(array_alpha) > 0 else -1,
+            'length': len(array_alpha),
+            'data': array_alpha.hex(),
+        }
 
     def ReadBuffer(self):
         # MOSI: opCode(0x1E), OFFSET, NOP   , NOP        , NOP          , NOP          , ... NOP
         # MISO: RFU         , STATUS, STATUS, BUF[offset], BUF[offset+1], BUF[offset+2], ... BUF[offset+n]
-        return 'ReadBuffer ' + str(len(self.ba_mosi)-3) + 'bytes'
+        return 'ReadBuffer', {'offset': self.ba_mosi[1] if len(self.ba_mosi) > 1 else 0, 'length': len(self.ba_mosi)-3}
 
     def WriteRegister(self):
-        addr = int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big')
+        addr = int.from_bytes(self.ba_mosi[1:3], 'big')
         array_alpha = self.ba_mosi[3:]
-        data_str = ''.join('{:02x}'.format(x) for x in array_alpha)
-        try:
-            if isinstance(self.regDict[addr], types.FunctionType):
-                regStr = 'at ' + hex(addr) + ' ' + self.regDict[addr](self, True)
-            else:
-                regStr = 'at ' + hex(addr) + ' ' + self.regDict[addr]
-        except Exception as error:
-            regStr = hex(addr) + ' regDict:' + str(error)
-        if addr != 0x911 and addr != 0x889 and addr != 0x6c0 and addr != 0x8e7 and addr != 0x6bb:
-            print('writereg ', hex(addr), ', ', data_str)
-        return 'WriteRegister ' + regStr + " <-- " + data_str
+        data_str = array_alpha.hex()
+        self.diag.log(DEBUG, 'writereg', self.seconds(self.nss_fall_time), '%s <-- %s', hex(addr), data_str)
+        return 'WriteRegister', {
+            'addr': addr,
+            'reg': self.registerString(addr, True, array_alpha),
+            'value': array_alpha[0] if len(array_alpha) > 0 else -1,
+            'length': len(array_alpha),
+            'data': data_str,
+        }
 
     def WriteBuffer(self):
-        return 'WriteBuffer offset=' + str(self.ba_mosi[1]) + ', ' + str(len(self.ba_mosi)-2) + 'bytes'
+        return 'WriteBuffer', {'offset': self.ba_mosi[1], 'length': len(self.ba_mosi)-2}
 
     def SetDioIrqParams(self):
-        irqMask = int.from_bytes(bytearray(self.ba_mosi[1:3]), 'big')
-        dio1_mask = int.from_bytes(bytearray(self.ba_mosi[3:5]), 'big')
-        dio2_mask = int.from_bytes(bytearray(self.ba_mosi[5:7]), 'big')
-        dio3_mask = int.from_bytes(bytearray(self.ba_mosi[7:9]), 'big')
-        return 'SetDioIrqParams ' + hex(irqMask) + ' DIO1 ' + hex(dio1_mask) + ' DIO2 ' + hex(dio2_mask) + ' DIO3 ' + hex(dio3_mask)
+        irqMask = int.from_bytes(self.ba_mosi[1:3], 'big')
+        dio1_mask = int.from_bytes(self.ba_mosi[3:5], 'big')
+        dio2_mask = int.from_bytes(self.ba_mosi[5:7], 'big')
+        dio3_mask = int.from_bytes(self.ba_mosi[7:9], 'big')
+        return 'SetDioIrqParams', {
+            'irq_mask': irqMask,
+            'dio1_mask': dio1_mask,
+            'dio2_mask': dio2_mask,
+            'dio3_mask': dio3_mask,
+            'irq_mask_hex': hex(irqMask),
+            'dio1_mask_hex': hex(dio1_mask),
+            'dio2_mask_hex': hex(dio2_mask),
+            'dio3_mask_hex': hex(dio3_mask),
+            'irq_flags': self.irqFlagsToString(irqMask),
+            'dio1_flags': self.irqFlagsToString(dio1_mask),
+            'dio2_flags': self.irqFlagsToString(dio2_mask),
+            'dio3_flags': self.irqFlagsToString(dio3_mask),
+        }
 
     def SetStandby(self):
         if self.ba_mosi[1] == 0:
@@ -690,35 +808,29 @@ class Hla(HighLevelAnalyzer):
             cfg = 'STDBY_XOSC'
         else:
             cfg = hex(self.ba_mosi[1])
-        return 'SetStandby ' + cfg
+        return 'SetStandby', {'standby': cfg}
 
     def SetRx(self):
-        timeout = int.from_bytes(bytearray(self.ba_mosi[1:4]), 'big')
+        timeout = int.from_bytes(self.ba_mosi[1:4], 'big')
         if timeout == 0xffffff:
-            _str = 'continuous'
+            return 'SetRxContinuous', {'timeout': timeout}
         elif timeout == 0:
-            _str = 'single'
-        else:
-            ms = timeout / 64
-            _str = str(ms) + 'ms'
-        return 'SetRx ' + _str
+            return 'SetRxSingle', {'timeout': timeout}
+        return 'SetRx', {'timeout': timeout, 'timeout_ms': timeout / 64}
 
     def SetTx(self):
-        timeout = int.from_bytes(bytearray(self.ba_mosi[1:4]), 'big')
-        ms = timeout / 64
-        return 'SetTx ' + str(ms) + 'ms'
+        timeout = int.from_bytes(self.ba_mosi[1:4], 'big')
+        return 'SetTx', {'timeout': timeout, 'timeout_ms': timeout / 64}
 
     def SetSleep(self):
         cfg = SleepConfig()
         cfg.asByte = self.ba_mosi[1]
-        my_str = 'SetSleep '
-        if cfg.rtc_wakeup == 1:
-            my_str = 'RTC wakeup '
-        if cfg.warm_start == 1:
-            my_str = my_str + 'warm-start' # device config retention
-        else:
-            my_str = my_str + 'cold-start'
-        return my_str
+        return 'SetSleep', {
+            'rtc_wakeup': cfg.rtc_wakeup == 1,
+            'warm_start': cfg.warm_start == 1,
+            'wakeup': 'RTC wakeup ' if cfg.rtc_wakeup == 1 else '',
+            'start': 'warm-start' if cfg.warm_start == 1 else 'cold-start',   # device config retention
+        }
 
     def StopTimerOnPreamble(self):
         en = self.ba_mosi[1]
@@ -728,7 +840,7 @@ class Hla(HighLevelAnalyzer):
             descr = 'stop on preamble'
         else:
             descr = hex(en)
-        return 'StopTimerOnPreamble ' + descr
+        return 'StopTimerOnPreamble', {'stop_on': descr}
 
     def SetTxParams(self):
         txp = self.ba_mosi[1]
@@ -755,10 +867,15 @@ class Hla(HighLevelAnalyzer):
             us = 3400
         else:
             us = 0 # ?
-        return 'SetTxParams ' + str(dBm) + 'dBm' + ' ramp ' + str(us) + 'μs'
+        return 'SetTxParams', {'power_dbm': dBm, 'ramp_us': us}
 
     def SetBufferBaseAddress(self):
-        return 'SetBufferBaseAddress TX=' + hex(self.ba_mosi[1]) + ' RX=' + hex(self.ba_mosi[2])
+        return 'SetBufferBaseAddress', {
+            'tx_base': self.ba_mosi[1],
+            'rx_base': self.ba_mosi[2],
+            'tx_base_hex': hex(self.ba_mosi[1]),
+            'rx_base_hex': hex(self.ba_mosi[2]),
+        }
 
     def CalImg(self):
         freq1 = self.ba_mosi[1]
@@ -787,7 +904,7 @@ class Hla(HighLevelAnalyzer):
             str2 = '902-928'
         else:
             str2 = hex(freq2)
-        return 'CalImg ' + str(str1) + ' ' + str(str2)
+        return 'CalImg', {'freq1': str1, 'freq2': str2}
 
     def Calibrate(self):
         calibParam = self.ba_mosi[1]
@@ -804,7 +921,7 @@ class Hla(HighLevelAnalyzer):
             outStr += "ADC_bulk_P "
         if calibParam & (1 << 5):
             outStr += "IMAGE "
-        return "Calibrate " + outStr[:-1]
+        return 'Calibrate', {'calib_param': calibParam, 'blocks': outStr[:-1]}
 
     def SetRxTxFallbackMode(self):
         fallbackMode = {
@@ -812,27 +929,29 @@ class Hla(HighLevelAnalyzer):
             0x30: "STDBY_XOSC",
             0x20: "STDBY_RC",
         }
-        return 'SetRxTxFallbackMode ' + fallbackMode[self.ba_mosi[1]]
+        return 'SetRxTxFallbackMode', {'fallback': fallbackMode[self.ba_mosi[1]]}
 
     def ResetStats(self):
-        return "ResetStats"
+        return 'ResetStats', {}
 
     def ClearDeviceErrors(self):
-        return "ClearDeviceErrors status=" + hex(self.ba_miso[1]) + hex(self.ba_miso[2])
+        return 'ClearDeviceErrors', {}
 
     def GetStats(self):
-        return "GetStats status=" + hex(self.ba_miso[1]) + " numPktReceived=" + str(self.ba_miso[2]) + " numPktCrcErrors=" \
-            + str(self.ba_miso[3])
+        return 'GetStats', {'num_pkt_received': self.ba_miso[2], 'num_pkt_crc_errors': self.ba_miso[3]}
 
     def GetRssiInst(self):
-        return "GetRssiInst status=" + hex(self.ba_miso[1]) + " rssi=" + str(-1 * self.ba_miso[2] / 2) + "dBM"
+        return 'GetRssiInst', {'rssi': -1 * self.ba_miso[2] / 2}
 
     def GetDeviceErrors(self):
-        return "GetDeviceErrors status=" + hex(self.ba_miso[1]) + "OpError=" + hex(self.ba_miso[2] + (self.ba_miso[3] << 8))
+        op_error = self.ba_miso[2] + (self.ba_miso[3] << 8)
+        return 'GetDeviceErrors', {'op_error': op_error, 'op_error_hex': hex(op_error)}
 
     def SetRxDutyCycle(self):
-        return "SetRxDutyCycle rxPeriod=" + str((self.ba_mosi[1] << 16) + (self.ba_mosi[2] << 8) + self.ba_mosi[3]) + " sleepPeriod=" \
-            + str((self.ba_mosi[4] << 16) + (self.ba_mosi[5] << 8) + self.ba_mosi[6])
+        return 'SetRxDutyCycle', {
+            'rx_period': (self.ba_mosi[1] << 16) + (self.ba_mosi[2] << 8) + self.ba_mosi[3],
+            'sleep_period': (self.ba_mosi[4] << 16) + (self.ba_mosi[5] << 8) + self.ba_mosi[6],
+        }
 
     def SetDIO3AsTcxoCtrl(self):
         tcxoV = {
@@ -845,25 +964,25 @@ class Hla(HighLevelAnalyzer):
             0x06: "3.0V",
             0x07: "3.3V",
         }
-        return "SetDIO3AsTcxoCtrl tcxoVoltage=" + tcxoV[self.ba_mosi[1]] + " delay=" \
-            + str((self.ba_mosi[2] << 16) + (self.ba_mosi[3] << 8) + self.ba_mosi[4])
+        return 'SetDIO3AsTcxoCtrl', {
+            'voltage': tcxoV[self.ba_mosi[1]],
+            'delay': (self.ba_mosi[2] << 16) + (self.ba_mosi[3] << 8) + self.ba_mosi[4],
+        }
 
     def SetFs(self):
-        return "SetFs"
+        return 'SetFs', {}
 
     def SetCad(self):
-        return "SetCad"
+        return 'SetCad', {}
 
     def SetTxContinuousWave(self):
-        return "SetTxContinuousWave"
+        return 'SetTxContinuousWave', {}
 
     def SetTxInfinitePreamble(self):
-        return "SetTxInfinitePreamble"
+        return 'SetTxInfinitePreamble', {}
 
 
     def SetPaConfig(self):
-        paDuty = self.ba_mosi[1]
-        hpMax = self.ba_mosi[2]
         self.devSel = self.ba_mosi[3]
         if self.devSel == 0:
             devStr = 'SX1262'
@@ -871,8 +990,13 @@ class Hla(HighLevelAnalyzer):
             devStr = 'SX1261'
         else:
             devStr = str(self.devSel)
-        paLut = self.ba_mosi[4]
-        return 'SetPaConfig paDuty ' + str(paDuty) + ' hpMax ' + str(hpMax) + ' ' + devStr + ' ' + str(paLut)
+        return 'SetPaConfig', {
+            'pa_duty': self.ba_mosi[1],
+            'hp_max': self.ba_mosi[2],
+            'device_sel': self.devSel,
+            'device': devStr,
+            'pa_lut': self.ba_mosi[4],
+        }
 
     def SetRegulatorMode(self):
         en = self.ba_mosi[1]
@@ -882,7 +1006,7 @@ class Hla(HighLevelAnalyzer):
             my_str = 'DC-DC'
         else:
             my_str = hex(en)
-        return 'SetRegulatorMode ' + my_str
+        return 'SetRegulatorMode', {'regulator': my_str}
 
     def SetDIO2AsRfSwitchCtrl(self):
         en = self.ba_mosi[1]
@@ -892,102 +1016,630 @@ class Hla(HighLevelAnalyzer):
             my_str = 'ON'
         else:
             my_str = hex(en)
-        return 'SetDIO2AsRfSwitchCtrl ' + my_str
+        return 'SetDIO2AsRfSwitchCtrl', {'enable': my_str}
 
     def SetLoRaSymbNumTimeout(self):
-        return 'SetLoRaSymbNumTimeout ' + str(self.ba_mosi[1])
+        return 'SetLoRaSymbNumTimeout', {'symb_num': self.ba_mosi[1]}
 
     def GetStatus(self):
-        return 'GetStatus'
+        return 'GetStatus', {}
 
+    # opcode: (handler, minimum MOSI length, minimum MISO length). Handlers whose
+    # length depends on the packet type check it themselves
     cmdDict = {
-        0x00: ResetStats,
-        0x02: ClearIrqStatus,
-        0x07: ClearDeviceErrors,
-        0x08: SetDioIrqParams,
-        0x0d: WriteRegister,
-        0x0e: WriteBuffer,
-        0x10: GetStats,
-        0x11: GetPacketType,
-        0x12: GetIrqStatus,
-        0x13: GetRxBufferStatus,
-        0x14: GetPacketStatus,
-        0x15: GetRssiInst,
-        0x17: GetDeviceErrors,
-        0x1d: ReadRegister,
-        0x1e: ReadBuffer,
-        0x80: SetStandby,
-        0x82: SetRx,
-        0x83: SetTx,
-        0x84: SetSleep,
-        0x86: SetRfFrequency,
-        0x88: SetCadParams,
-        0x89: Calibrate,
-        0x8a: SetPacketType,
-        0x8b: SetModulationParams,
-        0x8c: SetPacketParams,
-        0x8e: SetTxParams,
-        0x8f: SetBufferBaseAddress,
-        0x93: SetRxTxFallbackMode,
-        0x94: SetRxDutyCycle,
-        0x95: SetPaConfig,
-        0x96: SetRegulatorMode,
-        0x97: SetDIO3AsTcxoCtrl,
-        0x98: CalImg,
-        0x9d: SetDIO2AsRfSwitchCtrl,
-        0x9f: StopTimerOnPreamble,
-        0xa0: SetLoRaSymbNumTimeout,
-        0xc0: GetStatus,
-        0xc1: SetFs,
-        0xc5: SetCad,
-        0xd1: SetTxContinuousWave,
-        0xD2: SetTxInfinitePreamble,
+        0x00: (ResetStats,            1, 0),
+        0x02: (ClearIrqStatus,        3, 0),
+        0x07: (ClearDeviceErrors,     0, 3),
+        0x08: (SetDioIrqParams,       9, 0),
+        0x0d: (WriteRegister,         3, 0),
+        0x0e: (WriteBuffer,           2, 0),
+        0x10: (GetStats,              0, 4),
+        0x11: (GetPacketType,         2, 3),
+        0x12: (GetIrqStatus,          0, 4),
+        0x13: (GetRxBufferStatus,     0, 4),
+        0x14: (GetPacketStatus,       0, 5),
+        0x15: (GetRssiInst,           0, 3),
+        0x17: (GetDeviceErrors,       0, 4),
+        0x1d: (ReadRegister,          3, 0),
+        0x1e: (ReadBuffer,            1, 0),
+        0x80: (SetStandby,            2, 0),
+        0x82: (SetRx,                 4, 0),
+        0x83: (SetTx,                 4, 0),
+        0x84: (SetSleep,              2, 0),
+        0x86: (SetRfFrequency,        5, 0),
+        0x88: (SetCadParams,          7, 0),
+        0x89: (Calibrate,             2, 0),
+        0x8a: (SetPacketType,         2, 0),
+        0x8b: (SetModulationParams,   5, 0),
+        0x8c: (SetPacketParams,       2, 0),
+        0x8e: (SetTxParams,           3, 0),
+        0x8f: (SetBufferBaseAddress,  3, 0),
+        0x93: (SetRxTxFallbackMode,   2, 0),
+        0x94: (SetRxDutyCycle,        7, 0),
+        0x95: (SetPaConfig,           5, 0),
+        0x96: (SetRegulatorMode,      2, 0),
+        0x97: (SetDIO3AsTcxoCtrl,     5, 0),
+        0x98: (CalImg,                3, 0),
+        0x9d: (SetDIO2AsRfSwitchCtrl, 2, 0),
+        0x9f: (StopTimerOnPreamble,   2, 0),
+        0xa0: (SetLoRaSymbNumTimeout, 2, 0),
+        0xc0: (GetStatus,             1, 0),
+        0xc1: (SetFs,                 1, 0),
+        0xc5: (SetCad,                1, 0),
+        0xd1: (SetTxContinuousWave,   1, 0),
+        0xD2: (SetTxInfinitePreamble, 1, 0),
     }
 
+    # command classes, shown or not by the show_<class> settings
+    cmdClasses = {
+        'config': (0x08, 0x86, 0x88, 0x89, 0x8a, 0x8b, 0x8c, 0x8e, 0x8f, 0x93, 0x95, 0x96, 0x97, 0x98,
+                   0x9d, 0x9f, 0xa0),
+        'control': (0x80, 0x82, 0x83, 0x84, 0x94, 0xc1, 0xc5, 0xd1, 0xd2),
+        'status': (0x00, 0x02, 0x07, 0x10, 0x11, 0x12, 0x13, 0x14, 0x15, 0x17, 0xc0),
+        'registers': (0x0d, 0x1d),
+        'buffer': (0x0e, 0x1e),
+    }
+
+    # handlers with side effects (decoder attributes, diagnostics): never
+    # memoized, the others only depend on the packet type and the bytes
+    sideEffectCmds = frozenset((
+        0x0d,   # WriteRegister: register decoders, diagnostics
+        0x11,   # GetPacketType
+        0x1d,   # ReadRegister: register decoders (SideDetCtrl1, LoRaStatus1)
+        0x8a,   # SetPacketType
+        0x8c,   # SetPacketParams: packet type from length
+        0x95,   # SetPaConfig: devSel
+    ))
+
+    # handlers reading the packet type
+    ptCmds = frozenset((0x14, 0x8b))
+
+    # handlers which change decoder state (see seedCmds) or feed the analyses:
+    # run even when their class is hidden
+    stateCmds = frozenset((
+        0x02,   # ClearIrqStatus: TxDone of the pending SetTx, IRQ service latency
+        0x08,   # SetDioIrqParams
+        0x0d,   # WriteRegister: SideDetCtrl1, register shadow
+        0x0e,   # WriteBuffer: data buffer shadow
+        0x11,   # GetPacketType
+        0x12,   # GetIrqStatus: TxDone of the pending SetTx, IRQ service latency
+        0x10,   # GetStats: link quality
+        0x13,   # GetRxBufferStatus: received packet location
+        0x14,   # GetPacketStatus: link quality
+        0x15,   # GetRssiInst: link quality
+        0x1d,   # ReadRegister: SideDetCtrl1, LoRaStatus1
+        0x1e,   # ReadBuffer: data buffer shadow
+        0x82,   # SetRx: start of a turnaround
+        0x83,   # SetTx: start of a transmission
+        0x80,   # SetStandby: radio mode
+        0x84,   # SetSleep: cold start loses the written configuration, radio mode
+        0x86,   # SetRfFrequency
+        0x88,   # SetCadParams
+        0x8a,   # SetPacketType
+        0x8b,   # SetModulationParams
+        0x8c,   # SetPacketParams: packet type from length, when not yet known
+        0x8e,   # SetTxParams
+        0x8f,   # SetBufferBaseAddress
+        0x93,   # SetRxTxFallbackMode
+        0x95,   # SetPaConfig
+        0x96,   # SetRegulatorMode
+        0x97,   # SetDIO3AsTcxoCtrl
+        0x9d,   # SetDIO2AsRfSwitchCtrl
+        0x94,   # SetRxDutyCycle: radio mode
+        0x9f,   # StopTimerOnPreamble
+        0xa0,   # SetLoRaSymbNumTimeout
+        0xc1,   # SetFs: radio mode
+        0xc5,   # SetCad: radio mode
+        0xd1,   # SetTxContinuousWave: radio mode
+        0xd2,   # SetTxInfinitePreamble: radio mode
+    ))
+    # handlers later transactions are decoded with: the attributes in
+    # stateAttrs, the configuration and data buffer shadows, the last values
+    # written and the pending SetTx (and the polls for its TxDone, see seeds()).
+    # The first pass of a sharded decode only runs these, the analyses start
+    # afresh in each shard and are merged.
+    seedCmds = redundantOpcodes | frozenset((
+        0x0e,   # WriteBuffer
+        0x11,   # GetPacketType
+        0x13,   # GetRxBufferStatus
+        0x1d,   # ReadRegister
+        0x1e,   # ReadBuffer
+        0x83,   # SetTx
+    ))
+    txDoneCmds = frozenset((0x02, 0x12))
+    stateAttrs = ('pt', 'devSel', 'side_det_f_to_time_inv', 'est_freq_error', 't0', 'tx_start', 'tx_toa', 'tx_freq')
+
+    # Frame types and their format templates. Handlers return the frame type and
+    # its data fields, the display string is only built from the template when
+    # a frame is shown (by Logic 2) or exported as text (render()).
     result_types = {
-        'mytype': {
-            'format': 'Output type: {{type}}, Input type: {{data.input_type}}'
-        },
-        'match': { 'format': '{{data.string}}'}
+        'match': {'format': '{{data.string}}'},
+        'cmdError': {'format': '{{data.string}} {{data.status}}'},
+        'brief': {'format': '{{data.string}} {{data.status}}'},
+        'ResetStats': {'format': 'ResetStats {{data.status}}'},
+        'ClearIrqStatus': {'format': 'ClearIrqStatus {{data.flags}} {{data.status}}'},
+        'ClearDeviceErrors': {'format': 'ClearDeviceErrors {{data.status}}'},
+        'SetDioIrqParams': {'format': 'SetDioIrqParams {{data.irq_mask_hex}} DIO1 {{data.dio1_mask_hex}} DIO2 {{data.dio2_mask_hex}} DIO3 {{data.dio3_mask_hex}} {{data.status}} {{data.changes}}'},
+        'WriteRegister': {'format': 'WriteRegister {{data.reg}} <-- {{data.data}} {{data.status}} {{data.changes}}'},
+        'WriteBuffer': {'format': 'WriteBuffer offset={{data.offset}}, {{data.length}}bytes {{data.status}}'},
+        'GetStats': {'format': 'GetStats numPktReceived={{data.num_pkt_received}} numPktCrcErrors={{data.num_pkt_crc_errors}} {{data.status}}'},
+        'GetPacketType': {'format': 'GetPacketType {{data.packet_type}} {{data.status}}'},
+        'GetIrqStatus': {'format': 'GetIrqStatus {{data.flags}} {{data.status}}'},
+        'GetRxBufferStatus': {'format': 'GetRxBufferStatus {{data.payload_len}}bytes at {{data.rx_start}} {{data.status}}'},
+        'GetPacketStatus': {'format': 'GetPacketStatus TODO pktType {{data.packet_type}} {{data.status}}'},
+        'GetPacketStatusFSK': {'format': 'GetPacketStatus rssi:{{data.rssi_sync}}dBm, {{data.rssi_avg}}dBm {{data.flags}} {{data.status}}'},
+        'GetPacketStatusLoRa': {'format': 'GetPacketStatus rssi:{{data.rssi}}dBm SNR={{data.snr}}dB signal={{data.signal_rssi}}dBm {{data.status}}'},
+        'GetRssiInst': {'format': 'GetRssiInst rssi={{data.rssi}}dBm {{data.status}}'},
+        'GetDeviceErrors': {'format': 'GetDeviceErrors OpError={{data.op_error_hex}} {{data.status}}'},
+        'ReadRegister': {'format': 'ReadRegister {{data.reg}} --> {{data.data}} {{data.status}}'},
+        'ReadBuffer': {'format': 'ReadBuffer {{data.length}}bytes {{data.status}}'},
+        'SetStandby': {'format': 'SetStandby {{data.standby}} {{data.status}}'},
+        'SetRx': {'format': 'SetRx {{data.timeout_ms}}ms {{data.status}}'},
+        'SetRxContinuous': {'format': 'SetRx continuous {{data.status}}'},
+        'SetRxSingle': {'format': 'SetRx single {{data.status}}'},
+        'SetTx': {'format': 'SetTx {{data.timeout_ms}}ms{{data.airtime}} {{data.status}}'},
+        'SetSleep': {'format': 'SetSleep {{data.wakeup}}{{data.start}} {{data.status}}'},
+        'SetRfFrequency': {'format': 'SetRfFrequency {{data.frf}} ({{data.freq_mhz_str}}MHz) {{data.status}} {{data.changes}}'},
+        'SetCadParams': {'format': 'SetCadParams cadSymbolNum {{data.cad_symbol_num}}, cadDetPeak {{data.cad_det_peak}}, cadDetMin {{data.cad_det_min}}, exit {{data.exit}}, timeout {{data.timeout_hex}} {{data.status}} {{data.changes}}'},
+        'Calibrate': {'format': 'Calibrate {{data.blocks}} {{data.status}}'},
+        'SetPacketType': {'format': 'SetPacketType {{data.packet_type}} {{data.status}} {{data.changes}}'},
+        'SetModulationParams': {'format': 'SetModulationParams TODO pktType {{data.packet_type}} {{data.status}}'},
+        'SetModulationParamsFSK': {'format': 'SetModulationParams {{data.bps}}bps {{data.pulse_shape}} bw={{data.bw_hz}}Hz fdev={{data.fdev_hz}}Hz {{data.status}} {{data.changes}}'},
+        'SetModulationParamsLoRa': {'format': 'SetModulationParams SF{{data.sf}} bw {{data.bw_khz}}KHz CR{{data.cr_str}} LDRO {{data.ldro_str}} {{data.status}} {{data.changes}}'},
+        'SetModulationParamsBPSK': {'format': 'SetModulationParams {{data.bps}}bps {{data.pulse_shape}} {{data.status}} {{data.changes}}'},
+        'SetPacketParams': {'format': 'SetPacketParams TODO pktType {{data.packet_type}}, mosi length {{data.length}} {{data.status}}'},
+        'SetPacketParamsFSK': {'format': 'SetPacketParams tx_preamble {{data.preamble_len}} detect {{data.detect}}bits syncWord {{data.sync_word_bits}}bits addrFilt {{data.addr_filt}} {{data.len_mode}} payLen {{data.payload_len}} CRC {{data.crc}} dcFree_{{data.dc_free}} {{data.status}} {{data.changes}}'},
+        'SetPacketParamsLoRa': {'format': 'SetPacketParams preamble {{data.preamble_len}} header {{data.header}} payLen{{data.payload_len}} CRC_{{data.crc}} IQ {{data.iq}} {{data.status}} {{data.changes}}'},
+        'SetPacketParamsBPSK': {'format': 'SetPacketParams payLen {{data.payload_len}}bytes (note: ramp_up/down_delay and pld_len_in_bits written to reg 0x00F0) {{data.status}} {{data.changes}}'},
+        'SetTxParams': {'format': 'SetTxParams {{data.power_dbm}}dBm ramp {{data.ramp_us}}μs {{data.status}} {{data.changes}}'},
+        'SetBufferBaseAddress': {'format': 'SetBufferBaseAddress TX={{data.tx_base_hex}} RX={{data.rx_base_hex}} {{data.status}} {{data.changes}}'},
+        'SetRxTxFallbackMode': {'format': 'SetRxTxFallbackMode {{data.fallback}} {{data.status}} {{data.changes}}'},
+        'SetRxDutyCycle': {'format': 'SetRxDutyCycle rxPeriod={{data.rx_period}} sleepPeriod={{data.sleep_period}} {{data.status}}'},
+        'SetPaConfig': {'format': 'SetPaConfig paDuty {{data.pa_duty}} hpMax {{data.hp_max}} {{data.device}} {{data.pa_lut}} {{data.status}} {{data.changes}}'},
+        'SetRegulatorMode': {'format': 'SetRegulatorMode {{data.regulator}} {{data.status}} {{data.changes}}'},
+        'SetDIO3AsTcxoCtrl': {'format': 'SetDIO3AsTcxoCtrl tcxoVoltage={{data.voltage}} delay={{data.delay}} {{data.status}} {{data.changes}}'},
+        'CalImg': {'format': 'CalImg {{data.freq1}} {{data.freq2}} {{data.status}}'},
+        'SetDIO2AsRfSwitchCtrl': {'format': 'SetDIO2AsRfSwitchCtrl {{data.enable}} {{data.status}} {{data.changes}}'},
+        'StopTimerOnPreamble': {'format': 'StopTimerOnPreamble {{data.stop_on}} {{data.status}} {{data.changes}}'},
+        'SetLoRaSymbNumTimeout': {'format': 'SetLoRaSymbNumTimeout {{data.symb_num}} {{data.status}} {{data.changes}}'},
+        'GetStatus': {'format': 'GetStatus {{data.status}}'},
+        'SetFs': {'format': 'SetFs {{data.status}}'},
+        'SetCad': {'format': 'SetCad {{data.status}}'},
+        'SetTxContinuousWave': {'format': 'SetTxContinuousWave {{data.status}}'},
+        'SetTxInfinitePreamble': {'format': 'SetTxInfinitePreamble {{data.status}}'},
+        # payloads reconstructed from the data buffer shadow
+        'TxPacket': {'format': 'TX packet {{data.length}}bytes at {{data.offset}}{{data.airtime}}: {{data.payload_hex}}'},
+        'RxPacket': {'format': 'RX packet {{data.length}}bytes at {{data.offset}}: {{data.payload_hex}}'},
+        # LoRaWAN frames in those packets
+        'LoRaWAN': {'format': 'LoRaWAN {{data.mtype}} DevAddr {{data.dev_addr}} FCnt {{data.fcnt}} {{data.fctrl}} FOpts [{{data.fopts}}] FPort {{data.fport}} {{data.crypt}} {{data.frm_payload}} MIC {{data.mic}} {{data.mic_check}}'},
+        'LoRaWANJoin': {'format': 'LoRaWAN {{data.mtype}} JoinEUI {{data.join_eui}} DevEUI {{data.dev_eui}} DevNonce {{data.dev_nonce}} MIC {{data.mic}} {{data.mic_check}}'},
+        'LoRaWANOther': {'format': 'LoRaWAN {{data.mtype}} {{data.length}}bytes MIC {{data.mic}}'},
+        # analyses enabled by the settings
+        'PollRun': {'format': 'Polling {{data.poll_type}} x{{data.count}} at {{data.rate_hz}}Hz for {{data.span_ms}}ms, {{data.bus_percent}}% of bus {{data.flags}}{{data.status}}'},
+        'LinkQuality': {'format': 'Link quality {{data.bucket_s}}s from {{data.start_s}}s: {{data.summary}}'},
+        'DutyCycle': {'format': 'Duty cycle over budget in {{data.band}}: {{data.used_s}}s of {{data.budget_s}}s ({{data.percent}}% > {{data.limit_percent}}%) in {{data.window_s}}s'},
     }
 
     def __init__(self):
         self.idx = 0
         self.pt = PacketType.NONE
         self.side_det_f_to_time_inv = 0
+        self.t0 = None      # start of the first transaction, decoder times are seconds since then
+        self.shadow = ConfigShadow()
+        self.buffer = BufferShadow()
+        self.tx_start = None    # time of the SetTx waiting for its TxDone
+        self.tx_toa = None      # computed time on air of that transmission, seconds
+        self.tx_freq = None     # and its frequency
+        self.diag = Diagnostics(diagnosticLevels[self.diagnostics], float(self.diagnostics_rate),
+                                path=self.diagnostics_file or None)
+        self.latency = Latency()
+        self.timeline = None
+        if self.energy == 'on':
+            self.timeline = Energy(loadCurrents(self.energy_currents) if self.energy_currents else None)
+        self.mac = None
+        if self.lorawan == 'on':
+            self.mac = LoRaWAN(loadKeys(self.lorawan_keys) if self.lorawan_keys else None)
+        self.link = None
+        if self.link_quality == 'on':
+            self.link = LinkQuality(linkBuckets[self.link_quality_bucket])
+        self.columns = ColumnWriter(self.columns_dir) if self.columns_dir else None
+        self.index = IndexWriter(self.index_dir) if self.index_dir else None
+        self.redundant = Redundant()
+        self.polling = PollRuns() if self.collapse_polling == 'on' else None
+        self.duty = None
+        if self.duty_cycle != 'off':
+            self.duty = DutyCycle(self.duty_cycle, float(self.duty_cycle_window) or 3600.0)
+        # dense dispatch table of bound handlers, indexed by opcode
+        self.cmdTable = [None] * 256
+        for opcode, (handler, mosi_min, miso_min) in self.cmdDict.items():
+            self.cmdTable[opcode] = (types.MethodType(handler, self), mosi_min, miso_min)
+        # results of the handlers without side effects are cached, except for
+        # commands without parameters where the lookup costs more than the handler
+        self.memo = LruCache(256)
+        self.memoTable = [0] * 256
+        if self.memoize == 'on':
+            for opcode, (handler, mosi_min, miso_min) in self.cmdDict.items():
+                if opcode not in self.sideEffectCmds and (mosi_min > 1 or miso_min > 0):
+                    self.memoTable[opcode] = MEMO | (MEMO_MISO if miso_min > 0 else 0) | \
+                        (MEMO_PT if opcode in self.ptCmds else 0)
+        # frames wanted per opcode; unknown opcodes are always shown
+        self.showTable = [True] * 256
+        for cls, opcodes in self.cmdClasses.items():
+            if getattr(self, 'show_' + cls) == 'off':
+                for opcode in opcodes:
+                    self.showTable[opcode] = False
+        self.brief = self.verbosity == 'brief'
+        # transactions worth collecting: hidden ones are skipped from their
+        # first byte on, unless their handler changes decoder state (or the
+        # mode timeline needs their status byte, or they are exported or indexed)
+        keepAll = self.timeline is not None or self.columns is not None or self.index is not None
+        self.keepTable = [show or opcode in self.stateCmds or keepAll
+                          for opcode, show in enumerate(self.showTable)]
+        # per-transaction accumulator, reused across transactions and grown
+        # (never resized in place) when a burst outgrows it
+        self.buf_len = 0
+        self.allocBuffers(512)
+        self.ba_mosi = self.mv_mosi[:1]
+        self.ba_miso = self.mv_miso[:1]
+
+    def allocBuffers(self, size):
+        mosi = bytearray(size)
+        miso = bytearray(size)
+        if self.buf_len > 0:
+            mosi[:self.buf_len] = self.mv_mosi[:self.buf_len]
+            miso[:self.buf_len] = self.mv_miso[:self.buf_len]
+        self.buf_mosi = mosi
+        self.buf_miso = miso
+        self.mv_mosi = memoryview(mosi)
+        self.mv_miso = memoryview(miso)
+
+    def runCmd(self, opcode):
+        # returns the frame type and data of the current transaction
+        cmd = self.cmdTable[opcode]
+        if cmd is None:
+            return 'cmdError', {'string': hex(opcode) + ', error:unknown opcode'}
+        if len(self.ba_mosi) < cmd[1] or len(self.ba_miso) < cmd[2]:
+            return self.truncated()
+        memo = self.memoTable[opcode]
+        if memo:
+            # handler without side effects: its result only depends on MOSI,
+            # the MISO after the status byte for reads, and the packet type
+            # for GetPacketStatus / SetModulationParams
+            key = self.ba_mosi.tobytes()
+            if memo & MEMO_MISO:
+                key += self.ba_miso[2:].tobytes()
+            if memo & MEMO_PT:
+                key = (self.pt, key)
+            hit = self.memo.get(key)
+            if hit is not None:
+                return hit[0], dict(hit[1])
+            frame_type, data = self.callCmd(cmd[0], opcode)
+            self.memo.put(key, (frame_type, dict(data)))
+            return frame_type, data
+        return self.callCmd(cmd[0], opcode)
+
+    def truncated(self):
+        # transaction too short for its handler
+        return 'cmdError', {'string': hex(self.ba_mosi[0]) + ', error:truncated ' + str(len(self.ba_mosi)) + 'bytes'}
+
+    def callCmd(self, handler, opcode):
+        try:
+            return handler()
+        except Exception as error:
+            # out-of-range parameter values, e.g. unknown fallback mode
+            return 'cmdError', {'string': hex(opcode) + ', error:' + str(error)}
+
+    def getState(self):
+        state = {name: getattr(self, name) for name in self.stateAttrs if hasattr(self, name)}
+        state['config'] = dict(self.shadow.current)
+        state['buffer'] = self.buffer.getState()
+        state['redundant'] = self.redundant.getState()
+        if self.mac is not None:
+            state['lorawan'] = self.mac.getState()
+        if self.duty is not None:
+            state['duty'] = self.duty.getState()
+        return state
+
+    def setState(self, state):
+        for name, value in state.items():
+            if name == 'config':
+                self.shadow.seed(value)
+            elif name == 'buffer':
+                self.buffer.setState(value)
+            elif name == 'redundant':
+                self.redundant.setState(value)
+            elif name == 'lorawan':
+                if self.mac is not None:
+                    self.mac.setState(value)
+            elif name == 'duty':
+                if self.duty is not None:
+                    self.duty.setState(value)
+            else:
+                setattr(self, name, value)
+
+    def seconds(self, time):
+        return float(time - self.t0)
+
+    def updateState(self, frame_type, data, duration):
+        # returns the configuration changes and a list of (frame type, data)
+        # events such as reconstructed packets, or None
+        t = self.seconds(self.nss_fall_time)
+        changes = self.shadow.update(t, frame_type, data)
+        if self.ba_mosi[0] in redundantOpcodes and frame_type != 'cmdError':
+            wasted = self.redundant.update(self.ba_mosi, duration)
+            if wasted:
+                data['redundant_bytes'] = wasted
+        events = None
+        packet = self.buffer.update(frame_type, data, self.ba_mosi, self.ba_miso, self.shadow.current)
+        if packet is not None:
+            events = [packet]
+            if self.mac is not None:
+                frame = self.mac.decode(packet[1]['payload'])
+                if frame is not None:
+                    events.append(frame)
+        if frame_type in latencyTypes:
+            self.latency.update(t, frame_type, data)
+        if self.link is not None and frame_type in linkTypes:
+            summary = self.link.update(t, frame_type, data)
+            if summary is not None:
+                events = (events or []) + [('LinkQuality', summary)]
+        events = self.trackTx(t, frame_type, data, packet, events)
+        if self.timeline is not None:
+            self.trackMode(frame_type, data, duration)
+        return changes, events
+
+    def seedState(self, frame_type, data):
+        # the part of updateState later transactions are decoded with (see seedCmds)
+        t = self.seconds(self.nss_fall_time)
+        self.shadow.update(t, frame_type, data)
+        if self.ba_mosi[0] in redundantOpcodes and frame_type != 'cmdError':
+            self.redundant.update(self.ba_mosi, 0.0)
+        packet = self.buffer.update(frame_type, data, self.ba_mosi, self.ba_miso, self.shadow.current)
+        if packet is not None and self.mac is not None:
+            self.mac.decode(packet[1]['payload'])
+        self.trackTx(t, frame_type, data, packet, None)
+
+    def trackTx(self, t, frame_type, data, packet, events):
+        # pending transmission from SetTx to its TxDone, returns the events
+        if frame_type == 'SetTx':
+            if self.tx_start is not None:
+                # previous transmission ended without a TxDone seen, count its computed airtime
+                events = self.accountTx(self.tx_toa, events)
+            self.tx_start = t
+            self.tx_toa = timeOnAir(self.shadow.current, packet[1]['length'] if packet is not None else None)
+            self.tx_freq = self.shadow.current.get('freq_hz')
+            self.addAirtime(data)
+            if packet is not None:
+                self.addAirtime(packet[1])
+        elif frame_type == 'GetIrqStatus' or frame_type == 'ClearIrqStatus':
+            if data['irq'] & IRQ_TX_DONE and self.tx_start is not None:
+                # expected against measured airtime, from SetTx to the first sight of TxDone
+                data['tx_ms'] = round((t - self.tx_start) * 1000, 3)
+                if self.tx_toa is not None:
+                    data['toa_ms'] = round(self.tx_toa * 1000, 3)
+                events = self.accountTx(t - self.tx_start, events)
+        return events
+
+    def trackMode(self, frame_type, data, duration):
+        # radio mode timeline, from every transaction (frame_type None when not decoded)
+        t = self.seconds(self.nss_fall_time)
+        chip_mode = (self.ba_miso[1] >> 4) & 7 if len(self.ba_miso) > 1 else None
+        self.timeline.update(t, t + duration, frame_type, data, chip_mode, self.shadow.current, self.tx_toa)
+
+    def accountTx(self, duration, events):
+        # ends the pending transmission, adds a DutyCycle event if it went over budget
+        if self.duty is not None:
+            over = self.duty.add(self.tx_start, duration, self.tx_freq)
+            if over is not None:
+                events = (events or []) + [('DutyCycle', over)]
+        self.tx_start = None
+        return events
+
+    def addAirtime(self, data):
+        # computed time on air of the pending transmission, left out while
+        # the modulation and packet parameters are not known
+        if self.tx_toa is None:
+            data['airtime'] = ''
+        else:
+            data['toa_ms'] = round(self.tx_toa * 1000, 3)
+            data['airtime'] = ' airtime ' + str(data['toa_ms']) + 'ms'
+
+    def nameOf(self, kind, key):
+        # command or register name for reports
+        if kind == 'cmd':
+            return self.cmdDict[key][0].__name__
+        name = self.registerString(key, True, b'')
+        return name[3:] if name.startswith('at ') else name
+
+    def seeds(self, opcode):
+        # whether trackState needs the transaction starting with opcode
+        return opcode in self.seedCmds or (self.tx_start is not None and opcode in self.txDoneCmds)
+
+    def trackState(self, frame):
+        # cheap alternative to decode(): only runs the handlers seeds() wants and
+        # produces no frames, used to find the decoder state at any point of a
+        # capture. Other transactions can be left out, except for the first one (t0)
+        if frame.type == 'disable':
+            self.idx = -1
+            self.ba_mosi = self.mv_mosi[:self.buf_len]
+            self.ba_miso = self.mv_miso[:self.buf_len]
+            if self.buf_len > 0 and self.seeds(self.ba_mosi[0]):
+                frame_type, data = self.runCmd(self.ba_mosi[0])
+                self.seedState(frame_type, data)
+        elif frame.type != 'error':
+            self.decode(frame)
 
     def decode(self, frame: AnalyzerFrame):
         if frame.type == 'result':
+            if self.idx == -2:  # transaction of no interest, see keepTable
+                return None
+            mosi = frame.data['mosi']
+            miso = frame.data['miso']
             if self.idx == 0:
-                self.ba_mosi = frame.data['mosi']
-                self.ba_miso = frame.data['miso']
+                self.buf_len = 0
+                if mosi and not self.keepTable[mosi[0]]:
+                    self.idx = -2
+                    return None
+            n = self.buf_len
+            end = n + len(mosi)
+            if end > len(self.buf_mosi):
+                self.allocBuffers(2 * end)
+            self.buf_mosi[n:end] = mosi
+            if len(miso) == end - n:
+                self.buf_miso[n:end] = miso
             else:
-                self.ba_mosi += frame.data['mosi']
-                self.ba_miso += frame.data['miso']
+                # MISO not captured: zeros, not what an earlier transaction
+                # left in the buffer
+                self.buf_miso[n:end] = miso[:end - n].ljust(end - n, b'\0')
+            self.buf_len = end
             self.idx += 1
         elif frame.type == 'enable':   # falling edge of nSS
-            self.ba_mosi = b'\x00'
-            self.ba_miso = b'\x00'
+            # an nSS pulse without any clocks decodes as a single 0x00 byte
+            self.buf_mosi[0] = 0
+            self.buf_miso[0] = 0
+            self.buf_len = 1
             self.nss_fall_time = frame.start_time
+            if self.t0 is None:
+                self.t0 = frame.start_time
             self.idx = 0
         elif frame.type == 'disable':   # rising edge of nSS
+            if self.idx == -2:
+                self.idx = -1
+                return None
             self.idx = -1
+            self.nss_rise_time = frame.end_time
+            # zero-copy views of this transaction, valid until the next one
+            self.ba_mosi = self.mv_mosi[:self.buf_len]
+            self.ba_miso = self.mv_miso[:self.buf_len]
             if len(self.ba_mosi) > 0:
-                if self.ba_mosi[0] == 0x00:
-                    print("0x00 cmd len " + str(len(self.ba_mosi)))
-                try:
-                    my_str = self.cmdDict[self.ba_mosi[0]](self)
-                except Exception as error:
-                    if self.ba_mosi[0] == 0:
-                        my_str = str(frame.end_time - self.nss_fall_time)
-                    else:
-                        my_str = hex(self.ba_mosi[0]) + ', error:' + str(error)
-
+                opcode = self.ba_mosi[0]
+                if opcode == 0x00:
+                    self.diag.log(WARNING, 'opcode0', self.seconds(self.nss_fall_time),
+                                  '0x00 cmd len %d', len(self.ba_mosi))
+                if (not self.showTable[opcode] or self.brief) and self.cmdTable[opcode] is not None:
+                    return self.filtered(opcode, frame)
+                frame_type, data = self.runCmd(opcode)
+                duration = float(frame.end_time - self.nss_fall_time)
+                changes, events = self.updateState(frame_type, data, duration)
+                if self.columns is not None:
+                    self.columns.add(self.seconds(self.nss_fall_time), duration, frame_type, data,
+                                     self.ba_mosi, self.ba_miso, self.shadow.current.get('freq_hz'))
+                if self.index is not None:
+                    self.index.add(self.seconds(self.nss_fall_time), frame_type, data, self.ba_mosi)
+                if changes is not None:
+                    data['changes'] = changesString(changes)
+                data['opcode'] = opcode
+                data['nss_duration'] = duration
                 if len(self.ba_mosi) > 1:
-                    my_str = my_str + ' ' + self.parseStatus(self.ba_miso[1])
-                return AnalyzerFrame('match', self.nss_fall_time, frame.end_time, {'string':my_str})
+                    status = self.ba_miso[1]
+                    data['status'] = self.parseStatus(status)
+                    data['chipMode'] = (status >> 4) & 7
+                    data['cmdStatus'] = (status >> 1) & 7
+                else:
+                    data['status'] = ''
+                out = AnalyzerFrame(frame_type, self.nss_fall_time, frame.end_time, data)
+                if self.polling is not None:
+                    frames = [out]
+                    if events is not None:
+                        frames += [AnalyzerFrame(event_type, self.nss_fall_time, frame.end_time, event)
+                                   for event_type, event in events]
+                    key = None
+                    # polls with news (TxDone seen first, events) are kept
+                    if opcode in pollOpcodes and events is None and 'tx_ms' not in data:
+                        key = bytes(self.ba_mosi) + bytes(self.ba_miso)
+                    return self.polling.add(frames, key, len(self.ba_mosi))
+                if events is not None:
+                    return [out] + [AnalyzerFrame(event_type, self.nss_fall_time, frame.end_time, event)
+                                    for event_type, event in events]
+                return out
             else:
-                return AnalyzerFrame('match', self.nss_fall_time, frame.end_time, {'string':'Wake'})
+                out = AnalyzerFrame('match', self.nss_fall_time, frame.end_time, {'string':'Wake'})
+                if self.polling is not None:
+                    return self.polling.add([out], None, 0)
+                return out
         elif frame.type == 'error':
-            print('error');
-
+            self.diag.log(ERROR, 'spi', self.seconds(frame.start_time) if self.t0 is not None else None,
+                          'SPI analyzer error frame')
+
+    def filtered(self, opcode, frame):
+        # transactions not shown in full: stateful handlers still run, then
+        # only a brief frame (if the class is shown) and the frames of their
+        # events (packets, ...) are returned
+        events = None
+        error = None
+        duration = float(frame.end_time - self.nss_fall_time)
+        if opcode in self.stateCmds or self.columns is not None or self.index is not None:
+            frame_type, data = self.runCmd(opcode)
+        if opcode in self.stateCmds:
+            if frame_type == 'cmdError':
+                error = data
+            else:
+                events = self.updateState(frame_type, data, duration)[1]
+        elif self.timeline is not None:
+            self.trackMode(None, None, duration)
+        if self.columns is not None:
+            self.columns.add(self.seconds(self.nss_fall_time), duration, frame_type, data,
+                             self.ba_mosi, self.ba_miso, self.shadow.current.get('freq_hz'))
+        if self.index is not None:
+            self.index.add(self.seconds(self.nss_fall_time), frame_type, data, self.ba_mosi)
+        frames = []
+        if self.showTable[opcode]:
+            status = self.parseStatus(self.ba_miso[1]) if len(self.ba_miso) > 1 else ''
+            if error is not None:
+                error['status'] = status
+                frames.append(AnalyzerFrame('cmdError', self.nss_fall_time, frame.end_time, error))
+            else:
+                frames.append(AnalyzerFrame('brief', self.nss_fall_time, frame.end_time,
+                                            {'string': self.cmdDict[opcode][0].__name__, 'status': status}))
+        if events is not None:
+            frames += [AnalyzerFrame(event_type, self.nss_fall_time, frame.end_time, event)
+                       for event_type, event in events]
+        if not frames:
+            return None
+        if self.polling is not None:
+            return self.polling.add(frames, None, 0)
+        return frames
+
+    def flush(self):
+        # frames held back at the end of the capture. Logic 2 has no end of
+        # capture call, for batch decoding only
+        self.diag.flush()
+        if self.columns is not None:
+            self.columns.close()
+        if self.index is not None:
+            self.index.close()
+        out = self.polling.flush() if self.polling is not None else None
+        if self.link is not None and self.link.bucket is not None:
+            # the LinkQuality bucket in progress, on the last transaction
+            data = self.link.frameData(self.link.bucket)
+            self.link.bucket = None
+            out = (out or []) + [AnalyzerFrame('LinkQuality', self.nss_fall_time, self.nss_rise_time, data)]
+        return out
+
+
+# Text of a frame from its result_types template, for use outside of Logic 2
+# (which renders the templates itself). Templates are compiled on first use
+# into literal text and data keys.
+_templates = {}
+
+def render(frame):
+    parts = _templates.get(frame.type)
+    if parts is None:
+        fmt = Hla.result_types[frame.type]['format']
+        parts = []
+        for i, piece in enumerate(re.split(r'{{\s*(data\.\w+|type)\s*}}', fmt)):
+            if i & 1:
+                parts.append((None, piece[5:] if piece.startswith('data.') else piece))
+            elif piece:
+                parts.append((piece, None))
+        _templates[frame.type] = parts
+    data = frame.data
+    out = []
+    for literal, key in parts:
+        if literal is not None:
+            out.append(literal)
+        elif key == 'type':
+            out.append(frame.type)
+        else:
+            out.append(str(data.get(key, '')))
+    return ''.join(out).rstrip()
@@ -0,0 +1,83 @@
+# Time on air from the Semtech SX126x formulas (as in sx126x_get_lora_time_on_air_numerator
+# and sx126x_get_gfsk_time_on_air_numerator of the SX126x driver).
+# Firmware reuses a few configurations, so results are kept in bounded caches
+# keyed by the modulation and packet parameters.
+
+from functools import lru_cache
+
+# SetModulationParams LoRa bandwidth code: Hz
+loraBandwidths = {
+    0x00: 7810,
+    0x08: 10420,
+    0x01: 15630,
+    0x09: 20830,
+    0x02: 31250,
+    0x0a: 41670,
+    0x03: 62500,
+    0x04: 125000,
+    0x05: 250000,
+    0x06: 500000,
+}
+
+# SetPacketParams GFSK crc type: CRC length in bytes
+gfskCrcLength = {
+    0x01: 0,    # OFF
+    0x00: 1,    # 1_BYTE
+    0x02: 2,    # 2_BYTE
+    0x04: 1,    # 1_BYTE_INV
+    0x06: 2,    # 2_BYTE_INV
+}
+
+
+@lru_cache(maxsize=128)
+def loraTimeOnAir(sf, bw, cr, ldro, preamble_len, header_type, payload_len, crc_on):
+    # seconds, None for parameters outside of the formula
+    bw_hz = loraBandwidths.get(bw)
+    if bw_hz is None or sf < 5 or sf > 12 or cr < 1 or cr > 4:
+        return None
+    numerator = 8 * payload_len + (16 if crc_on else 0) - 4 * sf + (0 if header_type == 1 else 20)
+    if sf <= 6:
+        denominator = 4 * sf
+    else:
+        numerator += 8
+        denominator = 4 * (sf - 2) if ldro else 4 * sf
+    numerator = max(numerator, 0)
+    symbols = -(-numerator // denominator) * (cr + 4) + preamble_len + 12
+    if sf <= 6:
+        symbols += 2
+    # symbols + 0.25, in units of 2^sf / bw
+    return (4 * symbols + 1) * (1 << (sf - 2)) / bw_hz
+
+
+@lru_cache(maxsize=128)
+def gfskTimeOnAir(bps, preamble_bits, var_len, sync_word_bits, addr_comp, payload_len, crc_type):
+    crc = gfskCrcLength.get(crc_type)
+    if crc is None or bps <= 0:
+        return None
+    bits = preamble_bits + (8 if var_len else 0) + sync_word_bits + \
+        8 * (payload_len + (1 if addr_comp else 0) + crc)
+    return bits / bps
+
+
+def timeOnAir(config, payload_len=None):
+    # seconds for the configuration in a ConfigShadow, None when it is not known
+    get = config.get
+    try:
+        if get('packet_type') == 'LoRa':
+            return loraTimeOnAir(get('lora.sf'), get('lora.bw'), get('lora.cr'), get('lora.ldro'),
+                                 get('lora.preamble_len'), get('lora.header_type'),
+                                 get('lora.payload_len') if payload_len is None else payload_len,
+                                 get('lora.crc_on'))
+        if get('packet_type') == 'FSK':
+            return gfskTimeOnAir(get('fsk.bps'), get('fsk.preamble_len'), get('fsk.var_len'),
+                                 get('fsk.sync_word_bits'), get('fsk.addr_comp'),
+                                 get('fsk.payload_len') if payload_len is None else payload_len,
+                                 get('fsk.crc_type'))
+    except TypeError:
+        # some parameters never captured
+        pass
+    return None
+
+
+def cacheInfo():
+    return {'lora': loraTimeOnAir.cache_info(), 'gfsk': gfskTimeOnAir.cache_info()}
@@ -0,0 +1,410 @@
+# Headless batch decoder: streams a Logic 2 SPI analyzer export through the
+# same Hla command decoders used inside Logic 2.
+#
+# In Logic 2, add the SPI analyzer, open its data table and export it to CSV
+# (columns name,type,start_time,duration,mosi,miso), then:
+#   python batch.py capture.csv -o decoded.csv
+#   python batch.py capture.csv --format jsonl > decoded.jsonl
+#   python batch.py capture.csv -j 8 -o decoded.csv   (sharded over 8 processes)
+
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import headless
+from HighLevelAnalyzer import Hla, render
+from latency import summaryLines
+from polling import pollOpcodes
+import energy
+import columns
+import index
+
+
+class CsvWriter:
+    def __init__(self, f, header=True):
+        self.writer = csv.writer(f)
+        if header:
+            self.writer.writerow(('start_time', 'end_time', 'type', 'string'))
+
+    def write(self, frame):
+        self.writer.writerow((repr(frame.start_time), repr(frame.end_time), frame.type, render(frame)))
+
+
+class JsonLinesWriter:
+    def __init__(self, f, header=True):
+        self.f = f
+
+    def write(self, frame):
+        data = {}
+        for key, value in frame.data.items():
+            if isinstance(value, (bytes, bytearray)):
+                value = value.hex()
+            data[key] = value
+        self.f.write(json.dumps({'start_time': frame.start_time, 'end_time': frame.end_time,
+                                 'type': frame.type, 'data': data}) + '\n')
+
+
+writers = {
+    'csv': CsvWriter,
+    'jsonl': JsonLinesWriter,
+}
+
+
+def decodeFrames(hla, frames):
+    # yields the analyzer frames produced by hla for a stream of SPI frames
+    for frame in frames:
+        out = hla.decode(frame)
+        if out is None:
+            continue
+        if isinstance(out, list):
+            yield from out
+        else:
+            yield out
+    out = hla.flush()
+    if out is not None:
+        yield from out
+
+
+def readLines(path, start, end):
+    # text lines of path between byte offsets start and end
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        for line in f:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield line.decode('utf-8')
+
+
+def startsPoll(f):
+    # whether the transaction after an enable row is a polling command, which
+    # could be part of a run collapsed across the shard boundary
+    pos = f.tell()
+    row = next(csv.reader([f.readline().decode('utf-8')]), None)
+    f.seek(pos)
+    return row is not None and len(row) > 4 and row[1] == 'result' and row[4] != '' and \
+        headless.byteValue(row[4]) in pollOpcodes
+
+
+def findShards(path, count):
+    # Splits the export at nSS falling edges (enable rows) into about count
+    # byte ranges. Returns the header line and the (start, end) offsets.
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        starts = [f.tell()]
+        for i in range(1, count):
+            target = max(size * i // count, starts[-1])
+            f.seek(target)
+            if target > 0:
+                f.readline()    # skip partial line
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                row = next(csv.reader([line.decode('utf-8')]))
+                if len(row) > 1 and row[1] == 'enable' and not startsPoll(f):
+                    break
+            if pos > starts[-1] and pos < size:
+                starts.append(pos)
+    ends = starts[1:] + [size]
+    return header.decode('utf-8'), list(zip(starts, ends))
+
+
+class ByteValues(dict):
+    # exported byte text: value, 0 for an empty field
+    def __missing__(self, text):
+        value = self[text] = headless.byteValue(text) if text else 0
+        return value
+
+
+def transactions(path, start, end, header, size=1 << 24):
+    # (opcode, text) of the transactions between byte offsets start and end,
+    # from an enable row up to the next one. Only the row after the enable row
+    # is looked at, for the opcode (None for a transaction without MOSI bytes):
+    # split from the right, the analyzer name (first) is the only text with commas.
+    i_type, i_start, i_dur, i_mosi, i_miso = headless.spiColumns(header)
+    splits = len(header) - 1
+    enable = re.compile(rb'(?:"[^"\n]*"|[^,\n]*),' * i_type + rb'"?enable"?,')
+    values = ByteValues()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        rest = b''
+        while pos < end:
+            chunk = f.read(min(size, end - pos))
+            if not chunk:
+                break
+            pos += len(chunk)
+            data = rest + chunk
+            starts = []
+            i = data.find(b'enable')
+            while i >= 0:
+                first = data.rfind(b'\n', 0, i) + 1
+                if enable.match(data, first):
+                    starts.append(first)
+                i = data.find(b'enable', i + 6)
+            rest = b''
+            if pos < end:
+                # the last transaction may go on in the next chunk
+                rest = data[starts.pop():] if starts else data
+            for first, last in zip(starts, starts[1:] + [len(data) - len(rest)]):
+                text = data[first:last]
+                lines = text.split(b'\n', 2)
+                row = lines[1].rstrip(b'\r').rsplit(b',', splits) if len(lines) > 1 else ()
+                opcode = None
+                if len(row) > i_mosi and row[i_type].strip(b'"') == b'result':
+                    mosi = row[i_mosi].strip(b'"')
+                    if mosi:
+                        opcode = values[mosi.decode('ascii')]
+                yield opcode, text
+
+
+def seedFrames(text, columns, values):
+    # enable, result and disable frames of the transaction in text, all of its
+    # bytes in the one result frame
+    i_type, i_start, i_dur, i_mosi, i_miso = columns
+    rows = csv.reader(text.decode('utf-8').splitlines())
+    start = float(next(rows)[i_start])
+    mosi = bytearray()
+    miso = bytearray()
+    for row in rows:
+        if len(row) > i_miso and row[i_type] == 'result' and row[i_mosi] != '':
+            mosi.append(values[row[i_mosi]])
+            miso.append(values[row[i_miso]])
+    data = {'mosi': bytes(mosi), 'miso': bytes(miso)}
+    return (headless.AnalyzerFrame('enable', start, start), headless.AnalyzerFrame('result', start, start, data),
+            headless.AnalyzerFrame('disable', start, start))
+
+
+def shardStates(path, header, shards, settings):
+    # first pass: decoder state at the start of each shard. Only the
+    # transactions the state is made of are parsed and decoded (Hla.seeds),
+    # and the first one for the capture start time.
+    hla = headless.create(Hla, settings)
+    header = next(csv.reader([header]))
+    columns = headless.spiColumns(header)
+    values = ByteValues()
+    states = []
+    first = True
+    with contextlib.redirect_stdout(io.StringIO()):
+        for start, end in shards:
+            states.append(hla.getState())
+            for opcode, text in transactions(path, start, end, header):
+                if first or (opcode is not None and hla.seeds(opcode)):
+                    first = False
+                    for frame in seedFrames(text, columns, values):
+                        hla.trackState(frame)
+    return states
+
+
+def analyses(hla):
+    # whole capture results of the decoder, merged over shards
+    if hla.link is not None:
+        hla.link.pyramid.finish()
+    return {'latency': hla.latency.hist, 'polling': hla.polling, 'redundant': hla.redundant,
+            'memo': hla.memo.info(), 'timeline': hla.timeline,
+            'sessions': hla.mac.sessions.info() if hla.mac is not None else None,
+            'link': hla.link.pyramid if hla.link is not None else None}
+
+
+def mergeAnalyses(results, other):
+    for name, hist in other['latency'].items():
+        results['latency'][name].merge(hist)
+    if results['polling'] is not None:
+        results['polling'].merge(other['polling'])
+    results['redundant'].merge(other['redundant'])
+    if results['timeline'] is not None:
+        results['timeline'].merge(other['timeline'])
+    memo = results['memo']
+    memo['hits'] += other['memo']['hits']
+    memo['misses'] += other['memo']['misses']
+    lookups = memo['hits'] + memo['misses']
+    memo['hit_rate'] = memo['hits'] / lookups if lookups else 0.0
+    if results['link'] is not None:
+        results['link'].merge(other['link'])
+    sessions = results['sessions']
+    if sessions is not None:
+        sessions['hits'] += other['sessions']['hits']
+        sessions['misses'] += other['sessions']['misses']
+
+
+def redundantLines(hla, redundant, limit=20):
+    lines = ['%-34s %8s %8s %10s' % ('redundant writes', 'count', 'bytes', 'bus ms')]
+    total_bytes = 0
+    total_s = 0.0
+    for (kind, key), (n, nbytes, seconds) in sorted(redundant.wasted.items(), key=lambda item: -item[1][1]):
+        if len(lines) <= limit:
+            lines.append('%-34s %8d %8d %10.3f' % (kind + ' ' + hla.nameOf(kind, key), n, nbytes, seconds * 1000))
+        total_bytes += nbytes
+        total_s += seconds
+    lines.append('%-34s %8s %8d %10.3f' % ('total', '', total_bytes, total_s * 1000))
+    return lines
+
+
+def decodeShard(job):
+    path, header, start, end, state, fmt, first, settings = job
+    hla = headless.create(Hla, settings)
+    hla.setState(state)
+    out = io.StringIO(newline='')
+    writer = writers[fmt](out, header=first)
+    count = 0
+    with contextlib.redirect_stdout(sys.stderr):
+        for frame in decodeFrames(hla, headless.readSpiCsv(itertools.chain([header], readLines(path, start, end)))):
+            writer.write(frame)
+            count += 1
+    return out.getvalue(), count, analyses(hla)
+
+
+# settings naming output directories: how to join the parts written by shards
+outputDirs = {
+    'columns_dir': columns.concat,
+    'index_dir': index.concat,
+}
+
+
+def decodeSharded(path, fout, fmt, jobs, settings):
+    # shards are contiguous ranges of a time ordered export, so writing the
+    # results in shard order keeps them in timestamp order
+    header, shards = findShards(path, jobs * 4)
+    states = shardStates(path, header, shards, dict(settings, **{name: '' for name in outputDirs}))
+    # each shard writes its columns and index to part directories, joined at the end
+    parts = {name: [os.path.join(settings[name], 'part%04d' % i) for i in range(len(shards))]
+             for name in outputDirs if settings.get(name)}
+    work = [(path, header, start, end, state, fmt, i == 0,
+             dict(settings, **{name: dirs[i] for name, dirs in parts.items()}))
+            for i, ((start, end), state) in enumerate(zip(shards, states))]
+    count = 0
+    results = None
+    with multiprocessing.Pool(jobs) as pool:
+        for text, n, shard_results in pool.imap(decodeShard, work):
+            fout.write(text)
+            count += n
+            if results is None:
+                results = shard_results
+            else:
+                mergeAnalyses(results, shard_results)
+    for name, dirs in parts.items():
+        outputDirs[name](dirs, settings[name])
+    return count, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Decode a Logic 2 SPI analyzer CSV export of SX126x traffic.')
+    parser.add_argument('capture', help='SPI analyzer export (CSV), - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='output file, default stdout')
+    parser.add_argument('-f', '--format', choices=sorted(writers), default='csv')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='decode in this many processes, 0 for one per core (capture must be a file)')
+    parser.add_argument('--config-at', type=float, action='append', default=[], metavar='SECONDS',
+                        help='print the radio configuration in effect this long after the first transaction (JSON, stderr)')
+    parser.add_argument('--latency', action='store_true',
+                        help='print IRQ service and turnaround latency percentiles (stderr)')
+    parser.add_argument('--redundant', action='store_true',
+                        help='print the bytes and bus time of writes which changed nothing, per register and command (stderr)')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help='print the hit rate of the decoded transaction and LoRaWAN session caches (stderr)')
+    parser.add_argument('--energy', action='store_true',
+                        help='print time and charge per radio mode (stderr), same as --set energy=on')
+    parser.add_argument('--timeline', metavar='FILE',
+                        help='write the radio mode timeline as CSV (start,end,mode,mA), implies --energy')
+    parser.add_argument('--link-quality', metavar='FILE',
+                        help='write RSSI/SNR/error min/mean/max per 1s, 10s, 1min, 10min and 1h bucket as CSV, '
+                             'same as --set link_quality=on')
+    parser.add_argument('--columns', metavar='DIR',
+                        help='also export the transactions as .npy columns to DIR')
+    parser.add_argument('--index', metavar='DIR',
+                        help='also build a search index in DIR (query with index.py)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='analyzer setting, e.g. duty_cycle=EU868 (repeatable)')
+    args = parser.parse_args(argv)
+
+    if args.energy or args.timeline:
+        args.set.append('energy=on')
+    if args.link_quality:
+        args.set.append('link_quality=on')
+    try:
+        settings = headless.parseSettings(Hla, args.set)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.columns:
+        settings['columns_dir'] = args.columns
+    if args.index:
+        settings['index_dir'] = args.index
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    if jobs > 1 and args.capture == '-':
+        parser.error('--jobs needs a capture file')
+    if jobs > 1 and args.config_at:
+        parser.error('--config-at needs a single process decode')
+    fout = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    t = time.perf_counter()
+    if jobs > 1:
+        count, results = decodeSharded(args.capture, fout, args.format, jobs, settings)
+    else:
+        fin = sys.stdin if args.capture == '-' else open(args.capture, newline='')
+        writer = writers[args.format](fout)
+        count = 0
+        hla = headless.create(Hla, settings)
+        # the decoders print diagnostics to stdout, keep them out of the output
+        with contextlib.redirect_stdout(sys.stderr):
+            for frame in decodeFrames(hla, headless.readSpiCsv(fin)):
+                writer.write(frame)
+                count += 1
+        if fin is not sys.stdin:
+            fin.close()
+        for at in args.config_at:
+            print(json.dumps({'time': at, 'config': hla.shadow.snapshot(at)}), file=sys.stderr)
+        results = analyses(hla)
+    fout.flush()
+    elapsed = time.perf_counter() - t
+    print('%d transactions in %.3fs' % (count, elapsed), file=sys.stderr)
+    if args.latency:
+        print('\n'.join(summaryLines(results['latency'])), file=sys.stderr)
+    if args.redundant:
+        print('\n'.join(redundantLines(Hla(), results['redundant'])), file=sys.stderr)
+    if args.cache_stats:
+        memo = results['memo']
+        print('transaction cache: %d hits, %d misses, %.1f%% hit rate' % (
+            memo['hits'], memo['misses'], 100 * memo['hit_rate']), file=sys.stderr)
+        sessions = results['sessions']
+        if sessions is not None:
+            print('LoRaWAN session cache: %d hits, %d key expansions' % (
+                sessions['hits'], sessions['misses']), file=sys.stderr)
+    timeline = results['timeline']
+    if timeline is not None:
+        print('\n'.join(energy.summaryLines(timeline)), file=sys.stderr)
+        if args.timeline:
+            with open(args.timeline, 'w', newline='') as f:
+                out = csv.writer(f)
+                out.writerow(('start', 'end', 'mode', 'mA'))
+                for start, end, mode, ma in timeline.intervals():
+                    out.writerow((repr(start), repr(end), mode, '%.6g' % ma))
+    if args.link_quality:
+        with open(args.link_quality, 'w', newline='') as f:
+            out = csv.writer(f)
+            out.writerow(('level_s', 'start_s', 'metric', 'count', 'min', 'mean', 'max', 'sum'))
+            for level, start, metric, n, lo, mean, hi, total in results['link'].rows():
+                out.writerow((level, start, metric, n, '%.6g' % lo, '%.6g' % mean, '%.6g' % hi, '%.6g' % total))
+    polling = results['polling']
+    if polling is not None:
+        s = polling.summary()
+        print('polling: %d runs, %d repeated polls, %d bytes and %.6fs of bus time wasted '
+              '(%.3f%% of %.3fs, %.1f bytes/s)' % (s['runs'], s['repeated_polls'], s['wasted_bytes'],
+              s['wasted_bus_s'], s['wasted_bus_percent'], s['capture_s'], s['wasted_bytes_per_s']), file=sys.stderr)
+    if fout is not sys.stdout:
+        fout.close()
+
+
+if __name__ == '__main__':
+    main()
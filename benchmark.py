@@ -0,0 +1,252 @@
+# Decoder benchmarks on synthetic traffic (traffic.py): Hla.decode end to end
+# for several traffic mixes, each cmdDict / regDict handler on its own, and
+# the memo cache hits of the handlers it keeps results of.
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --compare baseline.json --threshold 0.1
+# --compare exits with status 1 when anything got slower than the threshold
+# (--decode-threshold for the decode speed, and handlers also by more than
+# --floor seconds per call).
+
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import json
+import multiprocessing
+import statistics
+import sys
+import time
+import tracemalloc
+
+import headless
+from headless import AnalyzerFrame
+from HighLevelAnalyzer import Hla
+from traffic import TrafficGenerator, mixes
+
+
+def materialize(gen, count):
+    # traffic.py reuses frame objects, copy them so generation is not timed
+    return [AnalyzerFrame(f.type, f.start_time, f.end_time, f.data) for f in gen.frames(count)]
+
+
+@contextlib.contextmanager
+def gcDisabled():
+    # no garbage collection pauses in the timed code, as in timeit
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def timeDecode(frames, repeat):
+    # Seconds to decode the frames. Each run decodes them in about 20 chunks
+    # of whole transactions, and the total is the sum of the best time of each
+    # chunk: a fresh Hla decodes a chunk from the same state in every run, and
+    # a slow spell of the machine rarely hits the same chunk in all of them.
+    ends = [i + 1 for i, f in enumerate(frames) if f.type == 'disable']
+    step = max(1, len(ends) // 20)
+    cuts = [0] + ends[step - 1::step]
+    if cuts[-1] < len(frames):
+        cuts.append(len(frames))
+    chunks = [frames[first:last] for first, last in zip(cuts, cuts[1:])]
+    best = [None] * len(chunks)
+    for _ in range(repeat):
+        hla = Hla()
+        decode = hla.decode
+        with gcDisabled():
+            for i, chunk in enumerate(chunks):
+                t = time.perf_counter()
+                for frame in chunk:
+                    decode(frame)
+                elapsed = time.perf_counter() - t
+                if best[i] is None or elapsed < best[i]:
+                    best[i] = elapsed
+    return sum(best)
+
+
+def decodeTimes(job):
+    # timeDecode of every mix, run in a fresh process (see main)
+    count, seed, repeat = job
+    times = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mix in sorted(mixes):
+            times[mix] = timeDecode(materialize(TrafficGenerator(seed, mix), count), repeat)
+    return times
+
+
+def benchDecode(frames, count, seconds):
+    # throughput from the decode time, and transient heap use, measured in a
+    # separate pass since tracing is slow
+    nbytes = sum(1 for f in frames if f.type == 'result')
+    hla = Hla()
+    heap = 0
+    tracemalloc.start()
+    for frame in frames:
+        if frame.type == 'enable':
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        hla.decode(frame)
+        if frame.type == 'disable':
+            heap += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {
+        'tx_per_s': count / seconds,
+        'bytes_per_s': nbytes / seconds,
+        'heap_bytes_per_tx': heap / count,
+    }
+
+
+def timeSamples(hla, samples, loops, repeat):
+    # seconds per hla.runCmd call of each name, averaged over its (name,
+    # opcode, mosi, miso) samples. Each sample is the best of repeat batches of
+    # loops calls with the garbage collector off, as with timeit.repeat. The
+    # batches go round robin over the samples, so a slow spell of the machine
+    # does not hit all the batches of a sample.
+    best = [None] * len(samples)
+    with gcDisabled():
+        for _ in range(repeat):
+            for i, (name, opcode, mosi, miso) in enumerate(samples):
+                hla.ba_mosi = memoryview(mosi)
+                hla.ba_miso = memoryview(miso)
+                hla.runCmd(opcode)      # fills the memo cache, if on
+                runCmd = hla.runCmd
+                t = time.perf_counter()
+                for _ in itertools.repeat(None, loops):
+                    runCmd(opcode)
+                elapsed = (time.perf_counter() - t) / loops
+                if best[i] is None or elapsed < best[i]:
+                    best[i] = elapsed
+    times = {}
+    for (name, opcode, mosi, miso), seconds in zip(samples, best):
+        times.setdefault(name, []).append(seconds)
+    return {name: sum(values) / len(values) for name, values in times.items()}
+
+
+def sampleTransactions(count, samples, seed):
+    # a few sample transactions of every opcode
+    byOpcode = {}
+    for mosi, miso in TrafficGenerator(seed, 'mixed').transactions(count):
+        if mosi:
+            byOpcode.setdefault(mosi[0], [])
+            if len(byOpcode[mosi[0]]) < samples:
+                byOpcode[mosi[0]].append((mosi, miso))
+    return byOpcode
+
+
+def benchHandlers(byOpcode, loops, repeat):
+    # every handler timed through Hla.runCmd, with the memo cache off so each
+    # call runs the handler
+    samples = [(handler.__name__, opcode, mosi, miso)
+               for opcode, (handler, mosi_min, miso_min) in sorted(Hla.cmdDict.items())
+               for mosi, miso in byOpcode.get(opcode, ())]
+    return timeSamples(headless.create(Hla, {'memoize': 'off'}), samples, loops, repeat)
+
+
+def benchMemo(byOpcode, loops, repeat):
+    # Hla.runCmd of the memoized handlers when the result is in the cache
+    hla = Hla()
+    samples = [(handler.__name__, opcode, mosi, miso)
+               for opcode, (handler, mosi_min, miso_min) in sorted(Hla.cmdDict.items()) if hla.memoTable[opcode]
+               for mosi, miso in byOpcode.get(opcode, ())]
+    return timeSamples(hla, samples, loops, repeat)
+
+
+def benchRegisters(loops, repeat, seed):
+    # register decoders, on a read and a write of every regDict register
+    gen = TrafficGenerator(seed)
+    samples = []
+    for addr, obj in sorted(Hla.regDict.items()):
+        obj, size = obj if isinstance(obj, tuple) else (obj, 1)
+        name = '%s@%s' % (obj if isinstance(obj, str) else obj.__name__, hex(addr))
+        for mosi, miso in (gen.writeRegister(addr, gen.payload(size)), gen.readRegister(addr, gen.payload(size))):
+            samples.append((name, mosi[0], mosi, miso))
+    return timeSamples(headless.create(Hla, {'memoize': 'off'}), samples, loops, repeat)
+
+
+def compare(baseline, current, threshold, decode_threshold, floor=0.0):
+    # returns the regressions: (section, name, old, new), where larger is
+    # worse. A handler time must also grow by more than floor seconds: a
+    # sub-microsecond handler varies by more than the threshold between runs
+    regressions = []
+    for section, worse_if_larger in (('decode', False), ('handlers', True), ('memo', True), ('registers', True)):
+        for name, new in current[section].items():
+            old = baseline.get(section, {}).get(name)
+            if old is None:
+                continue
+            if isinstance(new, dict):
+                for key, value in new.items():
+                    prev = old.get(key)
+                    if prev is None:
+                        continue
+                    larger_is_worse = key == 'heap_bytes_per_tx'
+                    if (larger_is_worse and value > prev * (1 + threshold)) or \
+                            (not larger_is_worse and value < prev / (1 + decode_threshold)):
+                        regressions.append((section, name + '.' + key, prev, value))
+            elif worse_if_larger and new > old * (1 + threshold) and new - old > floor:
+                regressions.append((section, name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SX126x decoders on synthetic traffic.')
+    parser.add_argument('-n', '--count', type=int, default=10000, help='transactions per traffic mix')
+    parser.add_argument('-s', '--seed', type=int, default=1)
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='end to end runs per mix and call batches per handler sample, best is kept')
+    parser.add_argument('-p', '--processes', type=int, default=5,
+                        help='processes timing the end to end runs, the median is kept')
+    parser.add_argument('--loops', type=int, default=200, help='calls per handler sample')
+    parser.add_argument('--save', metavar='FILE', help='write results as a baseline')
+    parser.add_argument('--compare', metavar='FILE', help='baseline to check for slowdowns')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown, 0.1 is 10%%')
+    parser.add_argument('--decode-threshold', type=float, default=0.5,
+                        help='allowed decode speed drop, default 50%%: the spread between runs on a shared single core machine')
+    parser.add_argument('--floor', type=float, default=1e-6, metavar='SECONDS',
+                        help='handler slowdowns up to this much per call are noise, default 1us')
+    args = parser.parse_args(argv)
+
+    results = {'decode': {}, 'handlers': {}, 'memo': {}, 'registers': {}}
+    # Decode speed differs from one process to the next (memory layout, hash
+    # seed) whatever the number of runs in each: the median of a few fresh
+    # processes, one at a time, is kept
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        runs = pool.map(decodeTimes, [(args.count, args.seed, args.repeat)] * args.processes, chunksize=1)
+    with contextlib.redirect_stdout(io.StringIO()):     # decoder diagnostics
+        for mix in sorted(mixes):
+            frames = materialize(TrafficGenerator(args.seed, mix), args.count)
+            results['decode'][mix] = benchDecode(frames, args.count, statistics.median(run[mix] for run in runs))
+        byOpcode = sampleTransactions(args.count * 5, 8, args.seed)
+        results['handlers'] = benchHandlers(byOpcode, args.loops, args.repeat)
+        results['memo'] = benchMemo(byOpcode, args.loops, args.repeat)
+        results['registers'] = benchRegisters(args.loops, args.repeat, args.seed)
+
+    print('%-10s %12s %12s %10s' % ('mix', 'tx/s', 'bytes/s', 'heap B/tx'))
+    for mix, r in results['decode'].items():
+        print('%-10s %12.0f %12.0f %10.0f' % (mix, r['tx_per_s'], r['bytes_per_s'], r['heap_bytes_per_tx']))
+    for section in ('handlers', 'memo', 'registers'):
+        print()
+        for name, seconds in results[section].items():
+            print('%-40s %8.2fus' % (name if section != 'memo' else name + ' (cached)', seconds * 1e6))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.decode_threshold, args.floor)
+        print()
+        for section, name, old, new in regressions:
+            print('SLOWER %s %s: %.4g -> %.4g' % (section, name, old, new))
+        if regressions:
+            sys.exit(1)
+        print('no regression beyond %d%% (decode: %d%%, handlers: and %.2gus)' % (
+            args.threshold * 100, args.decode_threshold * 100, args.floor * 1e6))
+
+
+if __name__ == '__main__':
+    main()
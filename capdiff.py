@@ -0,0 +1,427 @@
+# Capture to capture diff, for firmware regression tests: decodes two SPI
+# analyzer exports of the same scenario with the Hla decoders, lines up the
+# transactions by opcode and parameters (MOSI) with Myers' O(ND) algorithm
+# and reports the removed, inserted and changed commands and register
+# writes, with their decoded text, then the timing shifts: gaps before the
+# matched commands, radio handling latencies, traffic per command class.
+#
+#   python capdiff.py before.csv after.csv
+#   python capdiff.py before.csv after.csv --polls --context 0 --set show_buffer=off
+#
+# The common prefix and suffix are skipped first; what remains costs
+# O((N+M)D) time for D differences and, with the linear space refinement,
+# O(N+M) memory. Decoded text is only rendered for the transactions reported
+# (second pass).
+
+import argparse
+import contextlib
+import multiprocessing
+import sys
+from array import array
+from collections import deque
+from hashlib import blake2b
+
+import headless
+from HighLevelAnalyzer import Hla, render
+from latency import metrics
+from polling import pollOpcodes
+
+# transaction classes for the traffic comparison
+opcodeClass = {opcode: cls for cls, opcodes in Hla.cmdClasses.items() for opcode in opcodes}
+
+
+def transactions(path, settings, polls):
+    # Yields (number, opcode, frame, hla) for the decoded transactions of a
+    # capture, the frames only valid until the next one
+    hla = headless.create(Hla, settings)
+    n = 0
+    with open(path, newline='') as f, contextlib.redirect_stdout(sys.stderr):
+        for frame in headless.readSpiCsv(f):
+            out = hla.decode(frame)
+            if frame.type != 'disable' or out is None or len(hla.ba_mosi) == 0:
+                continue
+            opcode = hla.ba_mosi[0]
+            if not polls and opcode in pollOpcodes:
+                continue
+            yield n, opcode, out[0] if isinstance(out, list) else out, hla
+            n += 1
+
+
+def digest(data):
+    # 64 bit digest, the same in every process (hash() of bytes and str is
+    # salted per process, and each capture is read by a worker process)
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+
+class Stream:
+    # compact per-transaction records of one capture
+    def __init__(self):
+        self.keys = array('q')      # digest of the MOSI bytes: opcode and parameters
+        self.texts = array('q')     # digest of the decoded text
+        self.times = array('d')
+        self.opcodes = array('B')
+        self.nbytes = array('I')
+        self.addrs = array('i')     # register address of register access, -1 for others
+        self.latency = None
+
+
+def comparedText(frame):
+    # decoded text without the configuration changes, which depend on the
+    # earlier transactions rather than on this one
+    changes = frame.data.pop('changes', None)
+    text = render(frame)
+    if changes is not None:
+        frame.data['changes'] = changes
+    return text
+
+
+def readStream(job):
+    path, settings, polls = job
+    s = Stream()
+    hla = None
+    for n, opcode, frame, hla in transactions(path, settings, polls):
+        s.keys.append(digest(hla.ba_mosi))
+        s.texts.append(digest(comparedText(frame).encode('utf-8')))
+        s.times.append(float(frame.start_time))
+        s.opcodes.append(opcode)
+        s.nbytes.append(len(hla.ba_mosi))
+        s.addrs.append(frame.data['addr'] if frame.type in ('WriteRegister', 'ReadRegister') else -1)
+    if hla is not None:
+        s.latency = hla.latency.hist
+    return s
+
+
+def readTexts(job):
+    # decoded text of the wanted transactions (second pass)
+    path, settings, polls, wanted = job
+    texts = {}
+    for n, opcode, frame, hla in transactions(path, settings, polls):
+        if n in wanted:
+            texts[n] = render(frame)
+    return texts
+
+
+def myers(a, b, max_d):
+    # Shortest edit script from a to b as (x, y, kind) steps, kind '-' removes
+    # a[x] and '+' inserts b[y]; None when more than max_d edits are needed
+    steps = []
+    if not editSteps(a, 0, len(a), b, 0, len(b), max_d, steps):
+        return None
+    return steps
+
+
+def editSteps(a, a0, a1, b, b0, b1, max_d, steps):
+    # linear space refinement (Myers 1986, 4b): split the script from
+    # a[a0:a1] to b[b0:b1] at its middle snake and solve both halves,
+    # appending the steps in order. False beyond max_d edits
+    n = a1 - a0
+    m = b1 - b0
+    if n == 0 or m == 0:
+        if n + m > max_d:
+            return False
+        steps.extend((a0, j, '+') for j in range(b0, b1))
+        steps.extend((i, b0, '-') for i in range(a0, a1))
+        return True
+    snake = middleSnake(a, a0, a1, b, b0, b1, max_d)
+    if snake is None:
+        return False
+    d, x, y, u, v = snake
+    if d > 1:
+        editSteps(a, a0, a0 + x, b, b0, b0 + y, d, steps)
+        editSteps(a, a0 + u, a1, b, b0 + v, b1, d, steps)
+    elif d == 1:
+        # one removal or insertion, at the first difference
+        i = 0
+        while i < n and i < m and a[a0 + i] == b[b0 + i]:
+            i += 1
+        steps.append((a0 + i, b0 + i, '-' if n > m else '+'))
+    return True
+
+
+def middleSnake(a, a0, a1, b, b0, b1, max_d):
+    # (d, x, y, u, v): an edit script of d edits, the fewest, goes along the
+    # diagonal from (x, y) to (u, v) halfway. Forward paths from (0, 0) and
+    # reverse paths from (n, m) are extended one edit at a time until they
+    # overlap; vf holds the furthest x per diagonal k = x - y, vb the
+    # furthest x from the end per diagonal c = (n - x) - (m - y)
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = delta & 1
+    half = min((n + m + 1) // 2, (max_d + 1) // 2)
+    off = half + 1
+    vf = array('q', bytes(8 * (2 * half + 3)))
+    vb = array('q', bytes(8 * (2 * half + 3)))
+    for d in range(half + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            sx, sy = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            c = delta - k
+            if odd and -d < c < d and x + vb[off + c] >= n:
+                return (2 * d - 1, sx, sy, x, y) if 2 * d - 1 <= max_d else None
+        for c in range(-d, d + 1, 2):
+            if c == -d or (c != d and vb[off + c - 1] < vb[off + c + 1]):
+                x = vb[off + c + 1]
+            else:
+                x = vb[off + c - 1] + 1
+            y = x - c
+            sx, sy = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + c] = x
+            k = delta - c
+            if not odd and -d <= k <= d and x + vf[off + k] >= n:
+                return (2 * d, n - x, m - y, n - sx, m - sy) if 2 * d <= max_d else None
+    return None
+
+
+def hunks(steps, base):
+    # consecutive edit steps as (i1, i2, j1, j2) replacements, offset by base
+    out = []
+    for x, y, kind in steps:
+        x += base
+        y += base
+        if out and out[-1][1] == x and out[-1][3] == y:
+            hunk = out[-1]
+        else:
+            hunk = [x, x, y, y]
+            out.append(hunk)
+        if kind == '-':
+            hunk[1] += 1
+        else:
+            hunk[3] += 1
+    return out
+
+
+def diff(a, b, max_d):
+    # hunks turning a into b, common prefix and suffix skipped first
+    n, m = len(a), len(b)
+    start = 0
+    while start < n and start < m and a[start] == b[start]:
+        start += 1
+    end_a, end_b = n, m
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    steps = myers(a[start:end_a], b[start:end_b], max_d)
+    return None if steps is None else hunks(steps, start)
+
+
+def pairChanged(hunk, a, b):
+    # removed and inserted transactions of a hunk with the same opcode, in
+    # order, are one changed command
+    i1, i2, j1, j2 = hunk
+    queues = {}
+    for j in range(j1, j2):
+        queues.setdefault(b.opcodes[j], deque()).append(j)
+    pairs = []
+    last = j1 - 1
+    for i in range(i1, i2):
+        queue = queues.get(a.opcodes[i])
+        while queue and queue[0] <= last:
+            queue.popleft()
+        if queue:
+            last = queue.popleft()
+            pairs.append((i, last))
+    return pairs
+
+
+def commandName(hla, stream, i):
+    opcode = stream.opcodes[i]
+    cmd = Hla.cmdDict.get(opcode)
+    if cmd is None:
+        return hex(opcode)
+    name = cmd[0].__name__
+    if stream.addrs[i] >= 0:
+        name += ' ' + hla.nameOf('reg', stream.addrs[i])
+    return name
+
+
+def matched(found, n, m):
+    # (i, j) pairs of the transactions lined up between the hunks
+    prev_i = prev_j = 0
+    for i1, i2, j1, j2 in found + [[n, n, m, m]]:
+        yield from zip(range(prev_i, i1), range(prev_j, j1))
+        prev_i, prev_j = i2, j2
+
+
+def report(a, b, found, context):
+    # (i or None, j or None, kind) in capture order, kind one of '-' removed,
+    # '+' inserted, '~' changed and ' ' context
+    items = []
+    runs = matched(found, len(a.keys), len(b.keys))
+    pair = next(runs, None)
+    for hunk in found + [None]:
+        # lined up transactions before the hunk: changed when the decoded
+        # text differs, the last ones as context
+        end = hunk[0] if hunk is not None else len(a.keys)
+        shown = end - context if hunk is not None else end
+        while pair is not None and pair[0] < end:
+            i, j = pair
+            if a.texts[i] != b.texts[j]:
+                items.append((i, j, '~'))
+            elif i >= shown:
+                items.append((i, j, ' '))
+            pair = next(runs, None)
+        if hunk is None:
+            break
+        i1, i2, j1, j2 = hunk
+        pairs = dict(pairChanged(hunk, a, b))
+        paired = set(pairs.values())
+        for i in range(i1, i2):
+            j = pairs.get(i)
+            items.append((i, j, '~' if j is not None else '-'))
+        for j in range(j1, j2):
+            if j not in paired:
+                items.append((None, j, '+'))
+    return items
+
+
+def gapShifts(a, b, found):
+    # per opcode: sum of the gaps from the previous transaction before the
+    # lined up transactions, in a and in b, and their count
+    shifts = {}
+    for i, j in matched(found, len(a.keys), len(b.keys)):
+        if i < 1 or j < 1:
+            continue
+        s = shifts.get(a.opcodes[i])
+        if s is None:
+            s = shifts[a.opcodes[i]] = [0.0, 0.0, 0]
+        s[0] += a.times[i] - a.times[i - 1]
+        s[1] += b.times[j] - b.times[j - 1]
+        s[2] += 1
+    return shifts
+
+
+def classTraffic(stream):
+    traffic = {}
+    for opcode, n in zip(stream.opcodes, stream.nbytes):
+        entry = traffic.setdefault(opcodeClass.get(opcode, 'other'), [0, 0])
+        entry[0] += 1
+        entry[1] += n
+    return traffic
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diff the decoded SPI transactions of two captures.')
+    parser.add_argument('before', help='Logic 2 SPI analyzer CSV export')
+    parser.add_argument('after', help='Logic 2 SPI analyzer CSV export')
+    parser.add_argument('--polls', action='store_true',
+                        help='include GetStatus/GetIrqStatus/GetDeviceErrors polls (skipped by default)')
+    parser.add_argument('--context', type=int, default=2, help='matched transactions shown before each hunk')
+    parser.add_argument('--max-diff', type=int, default=100000, metavar='D',
+                        help='give up beyond this many removed plus inserted transactions')
+    parser.add_argument('--limit', type=int, default=0, help='print at most this many differences')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='analyzer setting for both captures (repeatable)')
+    args = parser.parse_args(argv)
+    try:
+        settings = headless.parseSettings(Hla, args.set)
+    except ValueError as error:
+        parser.error(str(error))
+    # the same decoder warnings would come out of both captures twice
+    settings.setdefault('diagnostics', 'off')
+
+    jobs = [(path, settings, args.polls) for path in (args.before, args.after)]
+    with multiprocessing.Pool(2) as pool:
+        a, b = pool.map(readStream, jobs)
+    found = diff(a.keys, b.keys, args.max_diff)
+    if found is None:
+        print('captures differ by more than %d transactions' % args.max_diff, file=sys.stderr)
+        sys.exit(2)
+    items = report(a, b, found, args.context)
+    shown = items[:args.limit] if args.limit else items
+
+    wanted_a = {i for i, j, kind in shown if i is not None}
+    wanted_b = {j for i, j, kind in shown if j is not None and kind != ' '}
+    with multiprocessing.Pool(2) as pool:
+        texts_a, texts_b = pool.map(readTexts, [(args.before, settings, args.polls, wanted_a),
+                                                (args.after, settings, args.polls, wanted_b)])
+    print('--- %s (%d transactions)' % (args.before, len(a.keys)))
+    print('+++ %s (%d transactions)' % (args.after, len(b.keys)))
+    last = None
+    for i, j, kind in shown:
+        if i is not None:
+            if last is None or i != last + 1:
+                print('@@ %d,%d @@' % (i, j if j is not None else j_at(found, i)))
+            last = i
+        if kind == '~':
+            print('~ %8d %14.9f %s' % (i, a.times[i], texts_a[i]))
+            print('  %8d %14.9f %s' % (j, b.times[j], texts_b[j]))
+        elif kind == '+':
+            print('+ %8d %14.9f %s' % (j, b.times[j], texts_b[j]))
+        else:
+            print('%s %8d %14.9f %s' % (kind, i, a.times[i], texts_a[i]))
+
+    # summary, on stderr like the batch.py reports
+    hla = Hla()
+    counts = {}
+    for i, j, kind in items:
+        if kind == ' ':
+            continue
+        name = commandName(hla, a, i) if i is not None else commandName(hla, b, j)
+        entry = counts.setdefault(name, {'-': 0, '+': 0, '~': 0})
+        entry[kind] += 1
+    totals = {kind: sum(entry[kind] for entry in counts.values()) for kind in '-+~'}
+    out = sys.stderr
+    print('%d removed, %d inserted, %d changed' % (totals['-'], totals['+'], totals['~']), file=out)
+    if counts:
+        print('%-40s %8s %8s %8s' % ('command', 'removed', 'inserted', 'changed'), file=out)
+        for name, entry in sorted(counts.items(), key=lambda item: -sum(item[1].values())):
+            print('%-40s %8d %8d %8d' % (name, entry['-'], entry['+'], entry['~']), file=out)
+
+    traffic_a = classTraffic(a)
+    traffic_b = classTraffic(b)
+    print('%-10s %10s %10s %12s %12s' % ('traffic', 'before', 'after', 'bytes before', 'bytes after'), file=out)
+    for cls in list(Hla.cmdClasses) + ['other']:
+        na, ba = traffic_a.get(cls, (0, 0))
+        nb, bb = traffic_b.get(cls, (0, 0))
+        if na or nb:
+            print('%-10s %10d %10d %12d %12d' % (cls, na, nb, ba, bb), file=out)
+
+    if a.latency is not None and b.latency is not None:
+        print('%-10s %12s %12s %12s %12s' % ('latency', 'p50 before', 'p50 after', 'p99 before', 'p99 after'), file=out)
+        for name in metrics:
+            sa = a.latency[name].summary()
+            sb = b.latency[name].summary()
+            if sa['count'] or sb['count']:
+                print('%-10s %12s %12s %12s %12s' % (name, ms(sa['p50']), ms(sb['p50']), ms(sa['p99']), ms(sb['p99'])),
+                      file=out)
+
+    shifts = gapShifts(a, b, found)
+    rows = [(opcode, (sb - sa) / n, sa / n, sb / n, n) for opcode, (sa, sb, n) in shifts.items() if n]
+    rows.sort(key=lambda row: -abs(row[1]))
+    if rows:
+        print('%-28s %8s %14s %14s %14s' % ('gap before command', 'count', 'before ms', 'after ms', 'shift ms'),
+              file=out)
+        for opcode, shift, ga, gb, n in rows[:10]:
+            cmd = Hla.cmdDict.get(opcode)
+            print('%-28s %8d %14.3f %14.3f %+14.3f' % (cmd[0].__name__ if cmd else hex(opcode), n,
+                                                       ga * 1000, gb * 1000, shift * 1000), file=out)
+
+
+def j_at(found, i):
+    # position in b lined up with position i of a
+    shift = 0
+    for i1, i2, j1, j2 in found:
+        if i1 > i:
+            break
+        shift = j2 - i2 if i >= i2 else j1 - i1
+    return i + shift
+
+
+def ms(seconds):
+    return '%.3f' % (seconds * 1000) if seconds is not None else '-'
+
+
+if __name__ == '__main__':
+    main()
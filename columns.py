@@ -0,0 +1,152 @@
+# Columnar export of decoded transactions: one fixed width .npy file per
+# column, one row per transaction, and the variable length bytes (buffer and
+# register data) in payload.bin, with their lengths as a column (offsets are
+# their cumulative sum). Rows are buffered in arrays and written in chunks,
+# the .npy headers are rewritten with the row count after every chunk, so
+# the files are readable (np.load(..., mmap_mode='r')) while being written.
+
+import os
+import re
+import shutil
+import sys
+from array import array
+
+# name, array typecode, npy dtype
+columns = (
+    ('start', 'd', '<f8'),          # seconds since the first transaction
+    ('duration_us', 'f', '<f4'),    # nSS low time
+    ('opcode', 'B', '|u1'),
+    ('chip_mode', 'B', '|u1'),      # status byte, 255 without one
+    ('cmd_status', 'B', '|u1'),
+    ('irq', 'i', '<i4'),            # GetIrqStatus/ClearIrqStatus IRQ word, -1 for others
+    ('rssi', 'f', '<f4'),           # GetPacketStatus (FSK: average), GetRssiInst, NaN for others
+    ('snr', 'f', '<f4'),            # GetPacketStatus LoRa
+    ('signal_rssi', 'f', '<f4'),    # GetPacketStatus (FSK: at sync)
+    ('freq_hz', 'I', '<u4'),        # RF frequency in effect, 0 until known
+    ('reg_addr', 'i', '<i4'),       # first register of ReadRegister/WriteRegister, -1 for others
+    ('reg_value', 'h', '<i2'),      # and its value
+    ('payload_len', 'I', '<u4'),    # bytes of the transaction in payload.bin
+)
+
+HEADER_LEN = 128
+NAN = float('nan')
+
+# opcode: first data byte in MOSI, in MISO
+payloadOffsets = {
+    0x0d: (3, None),    # WriteRegister
+    0x1d: (None, 4),    # ReadRegister
+    0x0e: (2, None),    # WriteBuffer
+    0x1e: (None, 3),    # ReadBuffer
+}
+
+
+def npyHeader(descr, rows):
+    # version 1.0 header, padded to HEADER_LEN so that it can be rewritten in place
+    text = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (descr, rows)
+    text = text.ljust(HEADER_LEN - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(text).to_bytes(2, 'little') + text.encode('latin1')
+
+
+def npyRows(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_LEN)
+    return int(re.search(rb"'shape': \((\d+),", header).group(1))
+
+
+class ColumnWriter:
+    def __init__(self, directory, chunk=1 << 16):
+        self.directory = directory
+        self.chunk = chunk
+        self.rows = 0       # rows written
+        self.arrays = [array(code) for name, code, descr in columns]
+        self.payload = bytearray()
+        os.makedirs(directory, exist_ok=True)
+        self.files = []
+        for name, code, descr in columns:
+            f = open(os.path.join(directory, name + '.npy'), 'wb')
+            f.write(npyHeader(descr, 0))
+            self.files.append(f)
+        self.payload_file = open(os.path.join(directory, 'payload.bin'), 'wb')
+
+    def add(self, t, duration, frame_type, data, mosi, miso, freq_hz):
+        a = self.arrays
+        opcode = mosi[0]
+        a[0].append(t)
+        a[1].append(duration * 1e6)
+        a[2].append(opcode)
+        if len(miso) > 1:
+            a[3].append((miso[1] >> 4) & 7)
+            a[4].append((miso[1] >> 1) & 7)
+        else:
+            a[3].append(255)
+            a[4].append(255)
+        a[5].append(data.get('irq', -1))
+        if frame_type == 'GetPacketStatusFSK':
+            a[6].append(data['rssi_avg'])
+            a[7].append(NAN)
+            a[8].append(data['rssi_sync'])
+        else:
+            a[6].append(data.get('rssi', NAN))
+            a[7].append(data.get('snr', NAN))
+            a[8].append(data.get('signal_rssi', NAN))
+        a[9].append(freq_hz or 0)
+        if 'addr' in data:
+            a[10].append(data['addr'])
+            a[11].append(data['value'])
+        else:
+            a[10].append(-1)
+            a[11].append(-1)
+        offsets = payloadOffsets.get(opcode)
+        n = 0
+        if offsets is not None:
+            mosi_at, miso_at = offsets
+            payload = mosi[mosi_at:] if mosi_at is not None else miso[miso_at:]
+            n = len(payload)
+            self.payload += payload
+        a[12].append(n)
+        if len(a[0]) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        n = len(self.arrays[0])
+        if n == 0:
+            return
+        self.rows += n
+        for f, values, (name, code, descr) in zip(self.files, self.arrays, columns):
+            if sys.byteorder == 'big':
+                values.byteswap()
+            values.tofile(f)
+            f.seek(0)
+            f.write(npyHeader(descr, self.rows))
+            f.seek(0, os.SEEK_END)
+            f.flush()
+        self.payload_file.write(self.payload)
+        self.payload_file.flush()
+        self.arrays = [array(code) for name, code, descr in columns]
+        self.payload = bytearray()
+
+    def close(self):
+        self.flush()
+        for f in self.files:
+            f.close()
+        self.payload_file.close()
+
+
+def concat(parts, directory):
+    # joins the column directories of consecutive parts of a capture into
+    # directory, streaming, and removes the parts
+    os.makedirs(directory, exist_ok=True)
+    for name, code, descr in columns:
+        paths = [os.path.join(part, name + '.npy') for part in parts]
+        with open(os.path.join(directory, name + '.npy'), 'wb') as out:
+            out.write(npyHeader(descr, sum(npyRows(path) for path in paths)))
+            for path in paths:
+                with open(path, 'rb') as f:
+                    f.seek(HEADER_LEN)
+                    shutil.copyfileobj(f, out)
+    with open(os.path.join(directory, 'payload.bin'), 'wb') as out:
+        for part in parts:
+            with open(os.path.join(part, 'payload.bin'), 'rb') as f:
+                shutil.copyfileobj(f, out)
+    for part in parts:
+        shutil.rmtree(part)
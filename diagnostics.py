@@ -0,0 +1,85 @@
+# Decoder diagnostics instead of print(): messages below the level are
+# dropped before being formatted, each category is rate limited (in capture
+# time, so a flood in a long capture prints a few lines and a count of what
+# was suppressed), and the latest messages are kept in a ring buffer whatever
+# the rate. Output goes to the console (the Logic 2 console is synchronous,
+# every print slows decoding) or to a file, written in batches.
+
+import atexit
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+levels = {
+    'debug': DEBUG,
+    'info': INFO,
+    'warning': WARNING,
+    'error': ERROR,
+    'off': OFF,
+}
+levelNames = {value: name for name, value in levels.items()}
+
+
+class Diagnostics:
+    def __init__(self, level=WARNING, rate=10.0, ring=1000, path=None, batch=100):
+        self.level = level
+        self.rate = rate            # messages per category per second of capture, 0 for no limit
+        self.ring = deque(maxlen=ring)
+        self.path = path
+        self.batch = batch
+        self.pending = []           # lines not written yet
+        self.buckets = {}           # category: [tokens, time of last refill, suppressed]
+        self.counts = {}            # category: messages at or above the level
+        if path is not None:
+            atexit.register(self.flush)
+
+    def log(self, level, category, t, fmt, *args):
+        if level < self.level:
+            return
+        message = fmt % args if args else fmt
+        self.ring.append((t, level, category, message))
+        self.counts[category] = self.counts.get(category, 0) + 1
+        suppressed = 0
+        if self.rate > 0:
+            bucket = self.buckets.get(category)
+            if bucket is None:
+                bucket = self.buckets[category] = [self.rate, t, 0]
+            elif t is not None and bucket[1] is not None and t > bucket[1]:
+                bucket[0] = min(self.rate, bucket[0] + (t - bucket[1]) * self.rate)
+            if t is not None:
+                bucket[1] = t
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return
+            bucket[0] -= 1
+            suppressed = bucket[2]
+            bucket[2] = 0
+        line = '%s %s: %s' % (levelNames.get(level, level), category, message)
+        if t is not None:
+            line = '%.9f ' % t + line
+        if suppressed:
+            line += ' (%d more suppressed)' % suppressed
+        self.emit(line)
+
+    def emit(self, line):
+        if self.path is None:
+            print(line)
+            return
+        self.pending.append(line + '\n')
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with open(self.path, 'a') as f:
+                f.writelines(self.pending)
+            self.pending = []
+
+    def recent(self, count=None):
+        # latest (time, level, category, message) entries, oldest first
+        entries = list(self.ring)
+        return entries if count is None else entries[-count:]
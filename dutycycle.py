@@ -0,0 +1,103 @@
+# Transmit duty cycle per frequency band over a sliding window, e.g. the
+# ETSI EN 300 220 sub-band limits of EU868 (1% of any hour in most of them).
+# Transmissions of a band are kept in time order with a running total, so
+# adding one and expiring the ones which left the window is O(1) amortized.
+
+from collections import deque
+
+# (low Hz, high Hz, limit, band name)
+eu868Bands = (
+    (863000000, 865000000, 0.001, 'EU868 863-865'),
+    (865000000, 868000000, 0.01, 'EU868 865-868'),
+    (868000000, 868600000, 0.01, 'EU868 g1'),
+    (868700000, 869200000, 0.001, 'EU868 g2'),
+    (869400000, 869650000, 0.1, 'EU868 g3'),
+    (869700000, 870000000, 0.01, 'EU868 g4'),
+)
+
+# Hla duty_cycle setting: bands, or a limit applied to each channel frequency
+plans = {
+    'EU868': eu868Bands,
+    '0.1% per channel': 0.001,
+    '1% per channel': 0.01,
+    '10% per channel': 0.1,
+}
+
+
+class Band:
+    __slots__ = ('name', 'limit', 'tx', 'total', 'over')
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.tx = deque()   # (start, end) of transmissions, oldest first
+        self.total = 0.0    # sum of their durations
+        self.over = False   # budget exceeded at the last transmission
+
+
+class DutyCycle:
+    def __init__(self, plan, window=3600.0):
+        self.plan = plans[plan]
+        self.window = window
+        self.bands = {}     # band name: Band
+
+    def getState(self):
+        return {name: (band.limit, tuple(band.tx), band.total, band.over) for name, band in self.bands.items()}
+
+    def setState(self, state):
+        self.bands = {}
+        for name, (limit, tx, total, over) in state.items():
+            band = self.bands[name] = Band(name, limit)
+            band.tx.extend(tx)
+            band.total = total
+            band.over = over
+
+    def band(self, freq_hz):
+        if isinstance(self.plan, float):
+            name = '%.6gMHz' % (freq_hz / 1e6)
+            limit = self.plan
+        else:
+            for low, high, limit, name in self.plan:
+                if low <= freq_hz < high:
+                    break
+            else:
+                return None     # not regulated by this plan
+        band = self.bands.get(name)
+        if band is None:
+            band = self.bands[name] = Band(name, limit)
+        return band
+
+    def add(self, start, duration, freq_hz):
+        # accounts one transmission, returns a DutyCycle frame data dict when the
+        # band goes over its budget with it (or None)
+        if freq_hz is None or duration is None:
+            return None
+        band = self.band(freq_hz)
+        if band is None:
+            return None
+        end = start + duration
+        band.tx.append((start, end))
+        band.total += duration
+        window_start = end - self.window
+        tx = band.tx
+        while tx[0][1] <= window_start:
+            s, e = tx.popleft()
+            band.total -= e - s
+        # only the oldest one can straddle the start of the window
+        used = band.total - max(0.0, window_start - tx[0][0])
+        budget = band.limit * self.window
+        if used <= budget:
+            band.over = False
+            return None
+        if band.over:
+            return None
+        band.over = True
+        return {
+            'band': band.name,
+            'freq_mhz': freq_hz / 1e6,
+            'used_s': round(used, 6),
+            'budget_s': round(budget, 6),
+            'percent': round(100 * used / self.window, 4),
+            'limit_percent': 100 * band.limit,
+            'window_s': self.window,
+        }
@@ -0,0 +1,181 @@
+# Radio mode timeline and charge estimate. The mode follows the mode setting
+# commands (SetSleep, SetStandby, SetFs, SetRx, SetTx, SetCad...) and is
+# corrected from the chip mode in the status byte of every transaction (end of
+# TX/RX, fallback modes). The timeline is kept as parallel arrays of
+# transitions: time, mode, supply current.
+
+import json
+from array import array
+
+SLEEP = 0
+STBY_RC = 1
+STBY_XOSC = 2
+FS = 3
+RX = 4
+TX = 5
+CAD = 6
+RX_DUTY_CYCLE = 7
+
+modeNames = ('SLEEP', 'STBY_RC', 'STBY_XOSC', 'FS', 'RX', 'TX', 'CAD', 'RX_DUTY_CYCLE')
+
+# status byte chipMode: mode
+chipModes = {2: STBY_RC, 3: STBY_XOSC, 4: FS, 5: RX, 6: TX}
+
+# frame type: mode entered at the end of the command
+commandModes = {
+    'SetStandby': None,     # from the data
+    'SetFs': FS,
+    'SetRx': RX,
+    'SetRxContinuous': RX,
+    'SetRxSingle': RX,
+    'SetTx': TX,
+    'SetTxContinuousWave': TX,
+    'SetTxInfinitePreamble': TX,
+    'SetCad': CAD,
+    'SetSleep': SLEEP,
+    'SetRxDutyCycle': RX_DUTY_CYCLE,
+}
+
+# typical SX1262 supply currents in mA, per regulator mode; TX is per output
+# power (dBm, mA), interpolated
+defaultCurrents = {
+    'DC-DC': {'SLEEP': 0.0006, 'SLEEP_COLD': 0.00016, 'STBY_RC': 0.6, 'STBY_XOSC': 0.8,
+              'FS': 2.1, 'RX': 4.6, 'CAD': 4.6},
+    'LDO': {'SLEEP': 0.0006, 'SLEEP_COLD': 0.00016, 'STBY_RC': 0.6, 'STBY_XOSC': 1.5,
+            'FS': 3.5, 'RX': 8.8, 'CAD': 8.8},
+    'TX': [[-9, 16.0], [10, 25.0], [14, 45.0], [17, 58.0], [20, 84.0], [22, 118.0]],
+}
+
+
+def loadCurrents(path):
+    # a JSON file shaped like defaultCurrents, missing entries are defaults
+    with open(path) as f:
+        table = json.load(f)
+    currents = {key: dict(value) if isinstance(value, dict) else value for key, value in defaultCurrents.items()}
+    for key, value in table.items():
+        if isinstance(value, dict):
+            currents.setdefault(key, {}).update(value)
+        else:
+            currents[key] = value
+    return currents
+
+
+def txCurrent(points, dbm):
+    if dbm <= points[0][0]:
+        return points[0][1]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        if dbm <= x1:
+            return y0 + (y1 - y0) * (dbm - x0) / (x1 - x0)
+    return points[-1][1]
+
+
+class Energy:
+    def __init__(self, currents=None):
+        self.currents = currents or defaultCurrents
+        self.times = array('d')     # transition times, seconds
+        self.modes = array('B')     # mode from that time on
+        self.ma = array('f')        # supply current from that time on
+        self.mode = None            # current mode, None until known
+        self.current = 0.0
+        self.cold = False           # sleeping without configuration retention
+        self.duty = None            # (rx, sleep) periods of SetRxDutyCycle
+        self.tx_end = None          # expected end of the transmission, from its airtime
+        self.end = None             # end of the last transaction
+
+    def supply(self, mode, config):
+        # the chip starts with the LDO regulator
+        table = self.currents.get(config.get('regulator'), self.currents['LDO'])
+        if mode == TX:
+            return txCurrent(self.currents['TX'], config.get('tx.power_dbm', 14))
+        if mode == SLEEP:
+            return table['SLEEP_COLD'] if self.cold else table['SLEEP']
+        if mode == RX_DUTY_CYCLE:
+            rx, sleep = self.duty
+            return (rx * table['RX'] + sleep * table['SLEEP']) / (rx + sleep) if rx + sleep else table['RX']
+        return table[modeNames[mode]]
+
+    def enter(self, t, mode, config):
+        current = self.supply(mode, config)
+        if mode == self.mode and current == self.current:
+            return
+        self.mode = mode
+        self.current = current
+        self.times.append(t)
+        self.modes.append(mode)
+        self.ma.append(current)
+
+    def update(self, start, end, frame_type, data, chip_mode, config, toa):
+        # one transaction from start to end (seconds); chip_mode is the status
+        # byte chipMode, None for transactions without a status byte
+        self.end = end
+        if self.mode == SLEEP:
+            # nSS low wakes the chip up
+            self.enter(start, STBY_RC, config)
+        mode = chipModes.get(chip_mode)
+        if mode is not None and mode != self.mode and \
+                not (self.mode in (RX_DUTY_CYCLE, CAD) and mode in (RX, STBY_RC)):
+            t = start
+            if self.mode == TX and self.tx_end is not None and self.tx_end < start:
+                # TX ended by itself, at the end of its airtime
+                t = self.tx_end
+            self.enter(t, mode, config)
+        if frame_type in commandModes:
+            mode = commandModes[frame_type]
+            if frame_type == 'SetStandby':
+                mode = STBY_XOSC if data['standby'] == 'STDBY_XOSC' else STBY_RC
+            elif frame_type == 'SetSleep':
+                self.cold = not data['warm_start']
+            elif frame_type == 'SetRxDutyCycle':
+                self.duty = (data['rx_period'], data['sleep_period'])
+            self.tx_end = end + toa if frame_type == 'SetTx' and toa is not None else None
+            self.enter(end, mode, config)
+        elif frame_type == 'SetTxParams' or frame_type == 'SetRegulatorMode':
+            if self.mode is not None:
+                self.enter(end, self.mode, config)
+
+    def merge(self, other):
+        # timeline of the next part of the capture
+        self.times.extend(other.times)
+        self.modes.extend(other.modes)
+        self.ma.extend(other.ma)
+        if other.end is not None:
+            self.end = other.end
+
+    def intervals(self):
+        # (start, end, mode name, mA), the last one ends with the last transaction
+        n = len(self.times)
+        for i in range(n):
+            start = self.times[i]
+            end = self.times[i + 1] if i + 1 < n else self.end
+            yield start, max(end, start), modeNames[self.modes[i]], self.ma[i]
+
+    def summary(self):
+        # per mode: seconds and charge (mC), and the totals
+        modes = {}
+        total_s = 0.0
+        total_mc = 0.0
+        for start, end, mode, ma in self.intervals():
+            entry = modes.setdefault(mode, [0.0, 0.0])
+            entry[0] += end - start
+            entry[1] += (end - start) * ma
+            total_s += end - start
+            total_mc += (end - start) * ma
+        return {
+            'modes': {mode: {'seconds': s, 'charge_mC': mc} for mode, (s, mc) in modes.items()},
+            'seconds': total_s,
+            'charge_mC': total_mc,
+            'average_mA': total_mc / total_s if total_s else 0.0,
+        }
+
+
+def summaryLines(energy):
+    s = energy.summary()
+    lines = ['%-14s %12s %8s %12s' % ('mode', 'seconds', 'share', 'charge mC')]
+    for mode in modeNames:
+        entry = s['modes'].get(mode)
+        if entry is not None:
+            lines.append('%-14s %12.6f %7.2f%% %12.6f' % (mode, entry['seconds'],
+                         100 * entry['seconds'] / s['seconds'] if s['seconds'] else 0, entry['charge_mC']))
+    lines.append('%-14s %12.6f %8s %12.6f  (%.4f mAh, average %.3f mA)' % (
+        'total', s['seconds'], '', s['charge_mC'], s['charge_mC'] / 3600, s['average_mA']))
+    return lines
@@ -0,0 +1,142 @@
+# Stand-ins for the saleae.analyzers classes used by HighLevelAnalyzer.py, and a
+# reader for Logic 2 SPI analyzer exports, so the Hla decoders can run outside
+# of Logic 2 (see batch.py).
+
+import csv
+
+
+class HighLevelAnalyzer:
+    def __new__(cls, *args, **kwargs):
+        # Logic 2 sets the setting values as instance attributes before
+        # __init__, do the same with their defaults
+        self = object.__new__(cls)
+        for name, setting in settingsOf(cls).items():
+            setattr(self, name, setting.default())
+        return self
+
+
+class AnalyzerFrame:
+    __slots__ = ('type', 'start_time', 'end_time', 'data')
+
+    def __init__(self, type, start_time, end_time, data=None):
+        self.type = type
+        self.start_time = start_time
+        self.end_time = end_time
+        self.data = data if data is not None else {}
+
+
+class Setting:
+    def __init__(self, label=None, **kwargs):
+        self.label = label
+        self.kwargs = kwargs
+
+
+class StringSetting(Setting):
+    def default(self):
+        return ''
+
+    def parse(self, text):
+        return text
+
+
+class NumberSetting(Setting):
+    def __init__(self, label=None, min_value=None, max_value=None, **kwargs):
+        Setting.__init__(self, label, **kwargs)
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def default(self):
+        return float(self.min_value) if self.min_value is not None else 0.0
+
+    def parse(self, text):
+        value = float(text)
+        if (self.min_value is not None and value < self.min_value) or \
+                (self.max_value is not None and value > self.max_value):
+            raise ValueError('%s is outside of %s..%s' % (text, self.min_value, self.max_value))
+        return value
+
+
+class ChoicesSetting(Setting):
+    def __init__(self, choices, label=None, **kwargs):
+        Setting.__init__(self, label, **kwargs)
+        self.choices = choices
+
+    def default(self):
+        return self.choices[0]
+
+    def parse(self, text):
+        if text not in self.choices:
+            raise ValueError('%s is not one of %s' % (text, ', '.join(self.choices)))
+        return text
+
+
+def settingsOf(cls):
+    return {name: value for name in dir(cls) for value in (getattr(cls, name),) if isinstance(value, Setting)}
+
+
+def parseSettings(cls, items):
+    # NAME=VALUE strings (batch.py --set) into setting values
+    settings = settingsOf(cls)
+    values = {}
+    for item in items:
+        name, sep, text = item.partition('=')
+        if not sep or name not in settings:
+            raise ValueError('unknown setting %s, one of %s' % (name, ', '.join(sorted(settings))))
+        values[name] = settings[name].parse(text)
+    return values
+
+
+def create(cls, values):
+    # analyzer instance with some settings changed from their defaults
+    self = cls.__new__(cls)
+    for name, value in values.items():
+        setattr(self, name, value)
+    self.__init__()
+    return self
+
+
+def byteValue(text):
+    # Logic 2 exports data in the radix selected for the analyzer: 0x8A, 0b10001010 or 138
+    if text[:2] in ('0x', '0X', '0b', '0B'):
+        return int(text, 0)
+    return int(text, 10)
+
+
+def spiColumns(header):
+    # indexes of the type, start_time, duration, mosi and miso columns of an
+    # export, from its header row
+    header = [h.strip().lower() for h in header]
+    return tuple(header.index(name) for name in ('type', 'start_time', 'duration', 'mosi', 'miso'))
+
+
+def readSpiCsv(f, columns=None):
+    # Yields enable/result/disable/error frames from a Logic 2 SPI analyzer
+    # table export (columns name,type,start_time,duration,mosi,miso), with
+    # times in seconds as floats. With columns (see spiColumns), f has no
+    # header row.
+    # The same frame object is reused for every row: it is only valid until the
+    # next one is read, which is all Hla.decode needs.
+    reader = csv.reader(f)
+    i_type, i_start, i_dur, i_mosi, i_miso = columns or spiColumns(next(reader))
+    values = {}     # exported text -> 1 byte bytes object
+    data = {'mosi': b'', 'miso': b''}
+    frame = AnalyzerFrame(None, 0.0, 0.0, data)
+    for row in reader:
+        if not row:
+            continue
+        start = float(row[i_start])
+        frame.type = row[i_type]
+        frame.start_time = start
+        frame.end_time = start + float(row[i_dur])
+        if frame.type == 'result':
+            text = row[i_mosi]
+            mosi = values.get(text)
+            if mosi is None:
+                mosi = values[text] = bytes((byteValue(text),)) if text else b''
+            text = row[i_miso]
+            miso = values.get(text)
+            if miso is None:
+                miso = values[text] = bytes((byteValue(text),)) if text else b''
+            data['mosi'] = mosi
+            data['miso'] = miso
+        yield frame
@@ -0,0 +1,310 @@
+# On-disk secondary index of decoded transactions, built while decoding:
+# posting lists (ascending transaction numbers) per opcode, register address
+# read or written, GetIrqStatus IRQ bit, SetRfFrequency frequency, packet
+# type and SetSleep start mode, plus the start time of every transaction.
+# Transaction numbers are the rows of the columnar export.
+#
+#   times.npy     float64 seconds since the first transaction, one per transaction
+#   postings.npy  uint32 transaction numbers, one list after the other
+#   keys.json     {"rows": count, "segments": [{key: [first, count]}, ...]} into postings.npy
+#
+# The posting lists are written in segments, one per chunk of transactions,
+# so memory use stays flat; a key's list is the concatenation of its parts
+# in every segment. keys.json is rewritten after each segment.
+#
+# Queries read only the posting lists they need:
+#   python index.py DIR op=WriteRegister reg=0x8e7
+#   python index.py DIR freq=868.1~0.05
+#   python index.py DIR irq=CrcErr
+#   python index.py DIR op=SetTx --after sleep=cold --first
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from columns import HEADER_LEN, npyHeader
+
+irqNames = ('TxDone', 'RxDone', 'PreambleDetected', 'SyncWordValid', 'HeaderValid', 'HeaderErr',
+            'CrcErr', 'CadDone', 'CadDetected', 'Timeout', None, None, None, None, 'LrFhssHop', None)
+
+
+class IndexWriter:
+    def __init__(self, directory, chunk=1 << 16):
+        self.directory = directory
+        self.chunk = chunk
+        self.row = 0            # number of the next transaction
+        self.times = array('d')
+        self.postings = {}      # key: array of transaction numbers, current segment
+        self.segments = []      # written segments, key: [first, count] in postings.npy
+        self.written = 0        # transaction numbers in postings.npy
+        os.makedirs(directory, exist_ok=True)
+        self.times_file = open(os.path.join(directory, 'times.npy'), 'wb')
+        self.times_file.write(npyHeader('<f8', 0))
+        self.postings_file = open(os.path.join(directory, 'postings.npy'), 'wb')
+        self.postings_file.write(npyHeader('<u4', 0))
+
+    def post(self, key):
+        rows = self.postings.get(key)
+        if rows is None:
+            rows = self.postings[key] = array('I')
+        rows.append(self.row)
+
+    def add(self, t, frame_type, data, mosi):
+        self.post('op:0x%02x' % mosi[0])
+        if frame_type == 'WriteRegister' or frame_type == 'ReadRegister':
+            # every register of a burst
+            prefix = 'wreg:' if frame_type == 'WriteRegister' else 'rreg:'
+            addr = data['addr']
+            for i in range(max(data['length'], 1)):
+                self.post(prefix + '0x%x' % (addr + i))
+        elif frame_type == 'GetIrqStatus':
+            irq = data['irq']
+            for bit, name in enumerate(irqNames):
+                if irq >> bit & 1 and name is not None:
+                    self.post('irq:' + name)
+        elif frame_type == 'SetRfFrequency':
+            self.post('freq:%d' % data['freq_hz'])
+        elif frame_type == 'SetPacketType' or frame_type == 'GetPacketType':
+            self.post('pt:' + data['packet_type'])
+        elif frame_type == 'SetSleep':
+            self.post('sleep:warm' if data['warm_start'] else 'sleep:cold')
+        self.times.append(t)
+        self.row += 1
+        if len(self.times) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        # writes the times and posting lists of the current segment
+        if not self.times:
+            return
+        f = self.times_file
+        if sys.byteorder == 'big':
+            self.times.byteswap()
+        self.times.tofile(f)
+        f.seek(0)
+        f.write(npyHeader('<f8', self.row))
+        f.seek(0, os.SEEK_END)
+        f.flush()
+        self.times = array('d')
+        keys, self.written = writeSegment(self.postings_file, self.postings, self.written)
+        self.segments.append(keys)
+        self.postings = {}
+        writeKeys(self.directory, self.row, self.segments)
+
+    def close(self):
+        self.flush()
+        self.times_file.close()
+        self.postings_file.close()
+        if not self.segments:
+            writeKeys(self.directory, 0, [])
+
+
+def writeSegment(f, postings, first):
+    # appends the posting lists of a segment to postings.npy, returns their
+    # key: [first, count] and the new total
+    keys = {}
+    for key in sorted(postings):
+        p = postings[key]
+        if sys.byteorder == 'big':
+            p.byteswap()
+        p.tofile(f)
+        keys[key] = [first, len(p)]
+        first += len(p)
+    f.seek(0)
+    f.write(npyHeader('<u4', first))
+    f.seek(0, os.SEEK_END)
+    f.flush()
+    return keys, first
+
+
+def writeKeys(directory, rows, segments):
+    # replaced in one step, for queries while the index is being written
+    path = os.path.join(directory, 'keys.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'rows': rows, 'segments': segments}, f)
+    os.replace(path + '.tmp', path)
+
+
+def concat(parts, directory):
+    # joins the indexes of consecutive parts of a capture into directory,
+    # renumbering their transactions, and removes the parts
+    # segment by segment
+    os.makedirs(directory, exist_ok=True)
+    segments = []
+    rows = 0
+    total = 0
+    with open(os.path.join(directory, 'times.npy'), 'wb') as out, \
+            open(os.path.join(directory, 'postings.npy'), 'wb') as postings_file:
+        out.write(npyHeader('<f8', 0))
+        postings_file.write(npyHeader('<u4', 0))
+        for part in parts:
+            index = Index(part)
+            for segment in index.segments:
+                postings = {key: array('I', (row + rows for row in index.slice(first, n)))
+                            for key, (first, n) in segment.items()}
+                keys, total = writeSegment(postings_file, postings, total)
+                segments.append(keys)
+            index.close()
+            with open(os.path.join(part, 'times.npy'), 'rb') as f:
+                f.seek(HEADER_LEN)
+                shutil.copyfileobj(f, out)
+            rows += index.count
+        out.seek(0)
+        out.write(npyHeader('<f8', rows))
+    writeKeys(directory, rows, segments)
+    for part in parts:
+        shutil.rmtree(part)
+
+
+class Index:
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'keys.json')) as f:
+            meta = json.load(f)
+        self.count = meta['rows']
+        self.segments = meta['segments']
+        self.keys = {}      # key: transactions over all segments
+        for segment in self.segments:
+            for key, (first, n) in segment.items():
+                self.keys[key] = self.keys.get(key, 0) + n
+        self.files = []
+        self.postings = self.map(os.path.join(directory, 'postings.npy'))
+        self.times = self.map(os.path.join(directory, 'times.npy'))
+
+    def map(self, path):
+        f = open(path, 'rb')
+        self.files.append(f)
+        if os.path.getsize(path) <= HEADER_LEN:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        for m in (self.postings, self.times):
+            if isinstance(m, mmap.mmap):
+                m.close()
+        for f in self.files:
+            f.close()
+
+    def slice(self, first, n):
+        rows = array('I')
+        start = HEADER_LEN + 4 * first
+        rows.frombytes(self.postings[start:start + 4 * n])
+        if sys.byteorder == 'big':
+            rows.byteswap()
+        return rows
+
+    def rows(self, key):
+        # ascending transaction numbers of one key, segments are in order
+        rows = array('I')
+        for segment in self.segments:
+            entry = segment.get(key)
+            if entry is not None:
+                rows.extend(self.slice(*entry))
+        return rows
+
+    def union(self, keys):
+        rows = array('I')
+        for key in keys:
+            rows.extend(self.rows(key))
+        return sorted(set(rows)) if len(keys) > 1 else rows
+
+    def time(self, row):
+        return struct.unpack_from('<d', self.times, HEADER_LEN + 8 * row)[0]
+
+
+def intersect(a, b):
+    # both ascending: look the shorter one up in the longer one
+    if len(a) > len(b):
+        a, b = b, a
+    out = []
+    for row in a:
+        i = bisect_left(b, row)
+        if i < len(b) and b[i] == row:
+            out.append(row)
+    return out
+
+
+def termKeys(index, term, opcodes):
+    # keys of the posting lists a query term stands for
+    name, _, value = term.partition('=')
+    if name == 'op':
+        opcode = opcodes.get(value)
+        if opcode is None:
+            opcode = int(value, 0)
+        return ['op:0x%02x' % opcode]
+    if name in ('reg', 'wreg', 'rreg'):
+        addr = '0x%x' % int(value, 16)
+        return [prefix + ':' + addr for prefix in (('wreg', 'rreg') if name == 'reg' else (name,))]
+    if name == 'freq':
+        # MHz, optionally ~tolerance in MHz
+        center, _, tolerance = value.partition('~')
+        lo = (float(center) - float(tolerance or 0.01)) * 1e6
+        hi = (float(center) + float(tolerance or 0.01)) * 1e6
+        return [key for key in index.keys if key.startswith('freq:') and lo <= int(key[5:]) <= hi]
+    if name in ('irq', 'pt', 'sleep'):
+        return [name + ':' + value]
+    raise ValueError('unknown query term ' + term)
+
+
+def query(index, terms, after=None, first=False, opcodes=None):
+    # transactions matching all terms; with after, only the first of them
+    # following each transaction matching after
+    opcodes = opcodes or {}
+    rows = None
+    for term in terms:
+        matches = index.union(termKeys(index, term, opcodes))
+        rows = matches if rows is None else intersect(rows, matches)
+    if rows is None:
+        rows = range(index.count)
+    if after is not None:
+        starts = index.union(termKeys(index, after, opcodes))
+        found = []
+        for row in starts:
+            i = bisect_right(rows, row)
+            if i < len(rows) and (not found or rows[i] != found[-1]):
+                found.append(rows[i])
+        rows = found
+    if first:
+        rows = rows[:1]
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query an index written by batch.py --index.')
+    parser.add_argument('index', help='index directory')
+    parser.add_argument('terms', nargs='*', metavar='TERM',
+                        help='op=NAME|0xNN, reg=|wreg=|rreg=0xADDR, irq=NAME, freq=MHZ[~MHZ], '
+                             'pt=LoRa|FSK|..., sleep=cold|warm; all must match')
+    parser.add_argument('--after', metavar='TERM', help='first match after each transaction matching TERM')
+    parser.add_argument('--first', action='store_true', help='first match only')
+    parser.add_argument('--limit', type=int, default=0, help='print at most this many matches')
+    parser.add_argument('--keys', action='store_true', help='list the keys and their counts')
+    args = parser.parse_args(argv)
+
+    # command names, from the decoder's dispatch table
+    from HighLevelAnalyzer import Hla
+    opcodes = {handler.__name__: opcode for opcode, (handler, mosi_min, miso_min) in Hla.cmdDict.items()}
+    index = Index(args.index)
+    if args.keys:
+        for key, n in sorted(index.keys.items()):
+            print('%-24s %d' % (key, n))
+        return
+    try:
+        rows = query(index, args.terms, args.after, args.first, opcodes)
+    except ValueError as error:
+        parser.error(str(error))
+    print('%d matches' % len(rows), file=sys.stderr)
+    for i, row in enumerate(rows):
+        if args.limit and i >= args.limit:
+            break
+        print('%d,%r' % (row, index.time(row)))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# Host side latencies of the radio handling, from the decoded transactions:
+#   irq_clear  IRQ first seen in GetIrqStatus until the ClearIrqStatus clearing it
+#   rx_read    RxDone first seen until the first ReadBuffer
+#   rx_to_tx   SetRx until the next SetTx
+#   tx_to_rx   TxDone first seen until the next SetRx
+# Each one is annotated on the transaction which ends it (<name>_ms) and
+# collected in a streaming histogram.
+
+import math
+
+IRQ_TX_DONE = 0x0001
+IRQ_RX_DONE = 0x0002
+
+metrics = ('irq_clear', 'rx_read', 'rx_to_tx', 'tx_to_rx')
+
+# frame types Latency.update looks at
+frameTypes = frozenset(('GetIrqStatus', 'ClearIrqStatus', 'ReadBuffer', 'SetTx',
+                        'SetRx', 'SetRxContinuous', 'SetRxSingle'))
+
+SUB_BUCKETS = 32    # per power of two, about 3% resolution
+
+
+class Histogram:
+    # log-linear buckets: constant memory whatever the number of samples
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        if value > 0:
+            mantissa, exponent = math.frexp(value)
+            key = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        else:
+            key = None
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for key in sorted(k for k in self.buckets if k is not None):
+            seen += self.buckets[key]
+            if seen >= rank:
+                exponent, sub = divmod(key, SUB_BUCKETS)
+                # middle of the bucket, never above the largest sample
+                return min(math.ldexp(0.5 + (sub + 0.5) / (2 * SUB_BUCKETS), exponent), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.max if self.count else None,
+            'mean': self.total / self.count if self.count else None,
+        }
+
+
+class Latency:
+    def __init__(self):
+        self.hist = {name: Histogram() for name in metrics}
+        self.irq_seen = {}      # IRQ bit: time first seen set
+        self.rx_done = None     # RxDone first seen, waiting for a ReadBuffer
+        self.rx_start = None    # SetRx waiting for a SetTx
+        self.tx_done = None     # TxDone first seen, waiting for a SetRx
+
+    def record(self, name, seconds, data):
+        self.hist[name].add(seconds)
+        data[name + '_ms'] = round(seconds * 1000, 3)
+
+    def update(self, t, frame_type, data):
+        if frame_type == 'GetIrqStatus':
+            irq = data['irq']
+            seen = self.irq_seen
+            while irq:
+                bit = irq & -irq
+                irq ^= bit
+                if bit not in seen:
+                    seen[bit] = t
+                    if bit == IRQ_RX_DONE:
+                        self.rx_done = t
+                    elif bit == IRQ_TX_DONE:
+                        self.tx_done = t
+        elif frame_type == 'ClearIrqStatus':
+            mask = data['irq']
+            oldest = None
+            for bit in [bit for bit in self.irq_seen if bit & mask]:
+                first = self.irq_seen.pop(bit)
+                self.hist['irq_clear'].add(t - first)
+                if oldest is None or first < oldest:
+                    oldest = first
+            if oldest is not None:
+                # one annotation per clear: the longest waiting IRQ
+                data['irq_clear_ms'] = round((t - oldest) * 1000, 3)
+        elif frame_type == 'ReadBuffer':
+            if self.rx_done is not None:
+                self.record('rx_read', t - self.rx_done, data)
+                self.rx_done = None
+        elif frame_type == 'SetTx':
+            if self.rx_start is not None:
+                self.record('rx_to_tx', t - self.rx_start, data)
+                self.rx_start = None
+        else:   # SetRx
+            if self.tx_done is not None:
+                self.record('tx_to_rx', t - self.tx_done, data)
+                self.tx_done = None
+            self.rx_start = t
+
+
+def summaryLines(hist):
+    lines = ['%-10s %8s %10s %10s %10s' % ('latency', 'count', 'p50 ms', 'p99 ms', 'max ms')]
+    for name in metrics:
+        s = hist[name].summary()
+        if s['count']:
+            lines.append('%-10s %8d %10.3f %10.3f %10.3f' % (name, s['count'], s['p50'] * 1000,
+                                                             s['p99'] * 1000, s['max'] * 1000))
+        else:
+            lines.append('%-10s %8d %10s %10s %10s' % (name, 0, '-', '-', '-'))
+    return lines
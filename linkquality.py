@@ -0,0 +1,175 @@
+# Link quality time series: RSSI, SNR and signal RSSI from GetPacketStatus,
+# instantaneous RSSI from GetRssiInst, FSK RX status errors and the GetStats
+# counters, aggregated while decoding into min/mean/max per time bucket at
+# several resolutions. Only the finest level takes samples, each bucket is
+# rolled up into its parent when it closes, and each level keeps its latest
+# buckets only (a day of 1 s buckets, a year of 1 h buckets), so the levels
+# plot any span of a capture without going through the packets again.
+
+from collections import OrderedDict
+
+# bucket seconds, each level a multiple of the previous one
+levels = (1, 10, 60, 600, 3600)
+levelNames = {'1s': 1, '10s': 10, '1min': 60, '10min': 600, '1h': 3600}
+
+# FskRxStatus error bits
+fskErrors = ((0x04, 'fsk_abort_err'), (0x08, 'fsk_length_err'), (0x10, 'fsk_crc_err'),
+             (0x20, 'fsk_adrs_err'), (0x40, 'fsk_sync_err'), (0x80, 'fsk_preamble_err'))
+# metrics counted (sum) rather than measured (min/mean/max)
+counters = frozenset(name for bit, name in fskErrors)
+
+# frame types LinkQuality.update looks at
+frameTypes = frozenset(('GetPacketStatusLoRa', 'GetPacketStatusFSK', 'GetRssiInst', 'GetStats'))
+
+
+def samples(frame_type, data):
+    # (metric, value) of one decoded transaction
+    if frame_type == 'GetPacketStatusLoRa':
+        return (('rssi', data['rssi']), ('snr', data['snr']), ('signal_rssi', data['signal_rssi']))
+    if frame_type == 'GetPacketStatusFSK':
+        status = data['rx_status']
+        return (('rssi', data['rssi_avg']), ('signal_rssi', data['rssi_sync'])) + \
+            tuple((name, 1 if status & bit else 0) for bit, name in fskErrors)
+    if frame_type == 'GetRssiInst':
+        return (('rssi_inst', data['rssi']),)
+    if frame_type == 'GetStats':
+        return (('num_pkt_received', data['num_pkt_received']),
+                ('num_pkt_crc_errors', data['num_pkt_crc_errors']))
+    return ()
+
+
+def accumulate(stats, metric, value):
+    s = stats.get(metric)
+    if s is None:
+        stats[metric] = [value, value, value, 1]    # min, sum, max, count
+    else:
+        if value < s[0]:
+            s[0] = value
+        s[1] += value
+        if value > s[2]:
+            s[2] = value
+        s[3] += 1
+
+
+def combine(into, stats):
+    for metric, (lo, total, hi, n) in stats.items():
+        s = into.get(metric)
+        if s is None:
+            into[metric] = [lo, total, hi, n]
+        else:
+            s[0] = min(s[0], lo)
+            s[1] += total
+            s[2] = max(s[2], hi)
+            s[3] += n
+
+
+def statsString(stats):
+    parts = []
+    for metric in sorted(stats):
+        lo, total, hi, n = stats[metric]
+        if metric in counters:
+            if total:
+                parts.append('%s %d/%d' % (metric[4:], total, n))
+        else:
+            parts.append('%s %.1f/%.1f/%.1f' % (metric, lo, total / n, hi))
+    return ' '.join(parts)
+
+
+class Pyramid:
+    def __init__(self, levels=levels, keep=86400):
+        self.levels = levels
+        self.keep = keep
+        self.ratios = [levels[k + 1] // levels[k] for k in range(len(levels) - 1)]
+        self.closed = [OrderedDict() for level in levels]  # per level: bucket index: stats
+        self.open = [None] * len(levels)                    # per level: [bucket index, stats]
+
+    def add(self, t, samples):
+        i = int(t // self.levels[0])
+        bucket = self.open[0]
+        if bucket is None or bucket[0] != i:
+            self.roll(i)
+            bucket = self.open[0] = [i, {}]
+        stats = bucket[1]
+        for metric, value in samples:
+            accumulate(stats, metric, value)
+
+    def roll(self, i):
+        # closes the buckets finer level bucket i is not in, finest first:
+        # a bucket still open has all its parents open
+        for k in range(len(self.levels)):
+            bucket = self.open[k]
+            if bucket is None or bucket[0] == i:
+                return
+            self.open[k] = None
+            self.store(k, bucket[0], bucket[1])
+            if k + 1 < len(self.levels):
+                parent = self.open[k + 1]
+                if parent is None:
+                    parent = self.open[k + 1] = [bucket[0] // self.ratios[k], {}]
+                combine(parent[1], bucket[1])
+            if i is not None and k + 1 < len(self.levels):
+                i //= self.ratios[k]
+
+    def store(self, k, index, stats):
+        closed = self.closed[k]
+        if index in closed:
+            combine(closed[index], stats)
+        else:
+            closed[index] = stats
+            if len(closed) > self.keep:
+                closed.popitem(last=False)
+
+    def finish(self):
+        # closes the buckets in progress, at the end of the (part of the) capture
+        self.roll(None)
+
+    def merge(self, other):
+        # finished pyramid of the next part of the capture
+        for k, closed in enumerate(other.closed):
+            for index, stats in closed.items():
+                self.store(k, index, {metric: list(s) for metric, s in stats.items()})
+
+    def rows(self):
+        # (level seconds, bucket start seconds, metric, count, min, mean, max, sum)
+        for level, closed in zip(self.levels, self.closed):
+            for index, stats in closed.items():
+                for metric in sorted(stats):
+                    lo, total, hi, n = stats[metric]
+                    yield level, index * level, metric, n, lo, total / n, hi, total
+
+
+class LinkQuality:
+    def __init__(self, bucket=None, keep=86400):
+        self.pyramid = Pyramid(keep=keep)
+        self.bucket_s = bucket      # seconds of the LinkQuality frames, None for none
+        self.bucket = None          # [bucket index, stats] of the frame in progress
+
+    def update(self, t, frame_type, data):
+        # returns the data of a LinkQuality frame when a bucket ends, or None
+        values = samples(frame_type, data)
+        self.pyramid.add(t, values)
+        if self.bucket_s is None:
+            return None
+        out = None
+        i = int(t // self.bucket_s)
+        bucket = self.bucket
+        if bucket is not None and bucket[0] != i:
+            out = self.frameData(bucket)
+            bucket = None
+        if bucket is None:
+            bucket = self.bucket = [i, {}]
+        for metric, value in values:
+            accumulate(bucket[1], metric, value)
+        return out
+
+    def frameData(self, bucket):
+        index, stats = bucket
+        data = {'bucket_s': self.bucket_s, 'start_s': index * self.bucket_s, 'summary': statsString(stats)}
+        for metric, (lo, total, hi, n) in stats.items():
+            if metric in counters:
+                data[metric] = total
+            else:
+                data[metric + '_min'] = lo
+                data[metric + '_mean'] = round(total / n, 3)
+                data[metric + '_max'] = hi
+        return data
@@ -0,0 +1,305 @@
+# LoRaWAN (1.0.x) frames in the reconstructed TX/RX packets: MAC header, frame
+# header (DevAddr, FCtrl, FCnt, FOpts MAC commands), FPort and MIC. With the
+# session keys of a DevAddr, FRMPayload is decrypted and the MIC checked.
+# AES-128 is pure Python (encryption only: the payload cipher is a counter
+# mode and the MIC is AES-CMAC); keys are expanded once per session, and the
+# sessions are kept in a bounded LRU cache.
+
+import json
+import struct
+from memo import LruCache
+
+mtypes = ('JoinRequest', 'JoinAccept', 'UnconfirmedDataUp', 'UnconfirmedDataDown',
+          'ConfirmedDataUp', 'ConfirmedDataDown', 'RejoinRequest', 'Proprietary')
+JOIN_REQUEST = 0
+uplinkTypes = (2, 4)
+dataTypes = (2, 3, 4, 5)
+
+# CID: (uplink command, its payload length, downlink command, its payload length)
+macCommands = {
+    0x01: ('ResetInd', 1, 'ResetConf', 1),
+    0x02: ('LinkCheckReq', 0, 'LinkCheckAns', 2),
+    0x03: ('LinkADRAns', 1, 'LinkADRReq', 4),
+    0x04: ('DutyCycleAns', 0, 'DutyCycleReq', 1),
+    0x05: ('RXParamSetupAns', 1, 'RXParamSetupReq', 4),
+    0x06: ('DevStatusAns', 2, 'DevStatusReq', 0),
+    0x07: ('NewChannelAns', 1, 'NewChannelReq', 5),
+    0x08: ('RXTimingSetupAns', 0, 'RXTimingSetupReq', 1),
+    0x09: ('TxParamSetupAns', 0, 'TxParamSetupReq', 1),
+    0x0a: ('DlChannelAns', 1, 'DlChannelReq', 4),
+    0x0d: ('DeviceTimeReq', 0, 'DeviceTimeAns', 5),
+}
+
+# FCtrl bits above FOptsLen, uplink and downlink
+fctrlUplink = ((0x80, 'ADR'), (0x40, 'ADRACKReq'), (0x20, 'ACK'), (0x10, 'ClassB'))
+fctrlDownlink = ((0x80, 'ADR'), (0x20, 'ACK'), (0x10, 'FPending'))
+
+# largest frame counter step taken from a frame whose MIC can not be checked
+# (MAX_FCNT_GAP of LoRaWAN 1.0), and the devices first seen that way kept
+MAX_FCNT_GAP = 16384
+MAX_UNVERIFIED = 1024
+
+
+def _sbox():
+    # multiplicative inverse in GF(2^8) followed by the affine transformation
+    sbox = [0] * 256
+    p = q = 1
+    while True:
+        p = p ^ ((p << 1) & 0xff) ^ (0x1b if p & 0x80 else 0)
+        q ^= q << 1
+        q ^= q << 2
+        q ^= q << 4
+        q &= 0xff
+        if q & 0x80:
+            q ^= 0x09
+        x = q
+        for shift in (1, 2, 3, 4):
+            x ^= ((q << shift) | (q >> (8 - shift))) & 0xff
+        sbox[p] = x ^ 0x63
+        if p == 1:
+            break
+    sbox[0] = 0x63
+    return sbox
+
+
+sbox = _sbox()
+
+
+def _xtime(a):
+    return ((a << 1) ^ 0x1b) & 0xff if a & 0x80 else a << 1
+
+
+# round tables: SubBytes, ShiftRows and MixColumns of one byte as a column word
+_te0 = [(_xtime(s) << 24) | (s << 16) | (s << 8) | (_xtime(s) ^ s) for s in sbox]
+_te1 = [((t >> 8) | (t << 24)) & 0xffffffff for t in _te0]
+_te2 = [((t >> 16) | (t << 16)) & 0xffffffff for t in _te0]
+_te3 = [((t >> 24) | (t << 8)) & 0xffffffff for t in _te0]
+
+
+def expandKey(key):
+    w = list(struct.unpack('>4I', key))
+    rcon = 1
+    for i in range(4, 44):
+        t = w[i - 1]
+        if i % 4 == 0:
+            t = ((sbox[(t >> 16) & 0xff] << 24) | (sbox[(t >> 8) & 0xff] << 16) |
+                 (sbox[t & 0xff] << 8) | sbox[t >> 24]) ^ (rcon << 24)
+            rcon = _xtime(rcon)
+        w.append(w[i - 4] ^ t)
+    return w
+
+
+def _cmacSubkey(k):
+    k <<= 1
+    if k >> 128:
+        k = (k ^ 0x87) & ((1 << 128) - 1)
+    return k
+
+
+class Aes:
+    # AES-128 encryption with the key expanded once, and AES-CMAC
+    def __init__(self, key):
+        self.rk = expandKey(key)
+        l = int.from_bytes(self.encrypt(bytes(16)), 'big')
+        self.k1 = _cmacSubkey(l)
+        self.k2 = _cmacSubkey(self.k1)
+
+    def encrypt(self, block):
+        rk = self.rk
+        te0, te1, te2, te3 = _te0, _te1, _te2, _te3
+        s0, s1, s2, s3 = struct.unpack('>4I', block)
+        s0 ^= rk[0]
+        s1 ^= rk[1]
+        s2 ^= rk[2]
+        s3 ^= rk[3]
+        for k in range(4, 40, 4):
+            s0, s1, s2, s3 = (
+                te0[s0 >> 24] ^ te1[(s1 >> 16) & 0xff] ^ te2[(s2 >> 8) & 0xff] ^ te3[s3 & 0xff] ^ rk[k],
+                te0[s1 >> 24] ^ te1[(s2 >> 16) & 0xff] ^ te2[(s3 >> 8) & 0xff] ^ te3[s0 & 0xff] ^ rk[k + 1],
+                te0[s2 >> 24] ^ te1[(s3 >> 16) & 0xff] ^ te2[(s0 >> 8) & 0xff] ^ te3[s1 & 0xff] ^ rk[k + 2],
+                te0[s3 >> 24] ^ te1[(s0 >> 16) & 0xff] ^ te2[(s1 >> 8) & 0xff] ^ te3[s2 & 0xff] ^ rk[k + 3])
+        return struct.pack(
+            '>4I',
+            ((sbox[s0 >> 24] << 24) | (sbox[(s1 >> 16) & 0xff] << 16) |
+             (sbox[(s2 >> 8) & 0xff] << 8) | sbox[s3 & 0xff]) ^ rk[40],
+            ((sbox[s1 >> 24] << 24) | (sbox[(s2 >> 16) & 0xff] << 16) |
+             (sbox[(s3 >> 8) & 0xff] << 8) | sbox[s0 & 0xff]) ^ rk[41],
+            ((sbox[s2 >> 24] << 24) | (sbox[(s3 >> 16) & 0xff] << 16) |
+             (sbox[(s0 >> 8) & 0xff] << 8) | sbox[s1 & 0xff]) ^ rk[42],
+            ((sbox[s3 >> 24] << 24) | (sbox[(s0 >> 16) & 0xff] << 16) |
+             (sbox[(s1 >> 8) & 0xff] << 8) | sbox[s2 & 0xff]) ^ rk[43])
+
+    def cmac(self, msg):
+        n = (len(msg) + 15) // 16
+        if n and len(msg) % 16 == 0:
+            last = int.from_bytes(msg[-16:], 'big') ^ self.k1
+        else:
+            n = max(n, 1)
+            tail = msg[(n - 1) * 16:] + b'\x80'
+            last = int.from_bytes(tail + bytes(16 - len(tail)), 'big') ^ self.k2
+        x = 0
+        for i in range(n - 1):
+            x = int.from_bytes(self.encrypt((x ^ int.from_bytes(msg[16 * i:16 * i + 16], 'big')).to_bytes(16, 'big')), 'big')
+        return self.encrypt((x ^ last).to_bytes(16, 'big'))
+
+
+class Session:
+    # AES contexts of one device, expanded once
+    def __init__(self, keys):
+        self.nwk = Aes(keys['nwk_s_key']) if 'nwk_s_key' in keys else None
+        self.app = Aes(keys['app_s_key']) if 'app_s_key' in keys else None
+        self.join = Aes(keys['app_key']) if 'app_key' in keys else None
+
+
+def loadKeys(path):
+    # JSON object: DevAddr (8 hex digits) with nwk_s_key and app_s_key, or
+    # DevEUI (16 hex digits) with app_key, keys as 32 hex digits
+    with open(path) as f:
+        table = json.load(f)
+    return {ident.lower(): {name: bytes.fromhex(value) for name, value in keys.items()}
+            for ident, keys in table.items()}
+
+
+def macString(data, uplink):
+    parts = []
+    i = 0
+    while i < len(data):
+        cmd = macCommands.get(data[i])
+        if cmd is None:
+            parts.append('CID 0x%02x %s' % (data[i], data[i + 1:].hex()))
+            break
+        name, n = (cmd[0], cmd[1]) if uplink else (cmd[2], cmd[3])
+        args = data[i + 1:i + 1 + n]
+        parts.append(name + '(' + args.hex() + ')' if n else name)
+        i += 1 + n
+    return ' '.join(parts)
+
+
+class LoRaWAN:
+    def __init__(self, keys=None, sessions=64):
+        self.keys = keys or {}          # DevAddr or DevEUI hex: key name: key
+        self.sessions = LruCache(sessions)
+        self.fcnts = {}                 # (DevAddr, uplink): last 32 bit frame counter
+        self.unverified = {}            # (DevAddr, uplink): frame counter of a first frame without MIC check
+
+    def getState(self):
+        return {'fcnts': dict(self.fcnts), 'unverified': dict(self.unverified)}
+
+    def setState(self, state):
+        self.fcnts = dict(state['fcnts'])
+        self.unverified = dict(state['unverified'])
+
+    def session(self, ident):
+        if ident not in self.keys:
+            return None
+        session = self.sessions.get(ident)
+        if session is None:
+            session = Session(self.keys[ident])
+            self.sessions.put(ident, session)
+        return session
+
+    def fcnt32(self, key, fcnt):
+        # the upper 16 bits are not sent, they follow the rollovers seen
+        last = self.fcnts.get(key, self.unverified.get(key))
+        if last is not None:
+            fcnt |= last & ~0xffff
+            if fcnt + 0x8000 < last:
+                fcnt += 0x10000
+        return fcnt
+
+    def keepFcnt(self, key, fcnt, verified):
+        # a frame counter is followed from frames with a good MIC, or without
+        # keys from a device seen before and a plausible step: any payload
+        # that happens to parse would otherwise apply a false rollover
+        if verified:
+            self.fcnts[key] = fcnt
+            self.unverified.pop(key, None)
+            return
+        last = self.fcnts.get(key, self.unverified.get(key))
+        if last is not None and 0 < fcnt - last <= MAX_FCNT_GAP:
+            self.fcnts[key] = fcnt
+            self.unverified.pop(key, None)
+        elif key not in self.fcnts:
+            self.unverified.pop(key, None)
+            if len(self.unverified) >= MAX_UNVERIFIED:
+                del self.unverified[next(iter(self.unverified))]
+            self.unverified[key] = fcnt
+
+    def decode(self, payload):
+        # (frame type, data) of a LoRaWAN frame, None if the payload is not one
+        # (major version and RFU bits of the MAC header must be 0)
+        if len(payload) < 5 or payload[0] & 0x1f:
+            return None
+        mtype = payload[0] >> 5
+        if mtype == JOIN_REQUEST:
+            if len(payload) != 23:
+                return None
+            return 'LoRaWANJoin', self.joinRequest(payload)
+        if mtype not in dataTypes:
+            return 'LoRaWANOther', {'mtype': mtypes[mtype], 'length': len(payload), 'mic': payload[-4:].hex()}
+        fopts_len = payload[5] & 0x0f if len(payload) > 5 else 0
+        if len(payload) < 12 + fopts_len:
+            return None
+        return 'LoRaWAN', self.dataFrame(payload, mtype, fopts_len)
+
+    def joinRequest(self, payload):
+        dev_eui = payload[9:17][::-1].hex()
+        data = {
+            'mtype': mtypes[JOIN_REQUEST],
+            'join_eui': payload[1:9][::-1].hex(),
+            'dev_eui': dev_eui,
+            'dev_nonce': payload[17] | (payload[18] << 8),
+            'mic': payload[19:].hex(),
+            'mic_check': 'no key',
+        }
+        session = self.session(dev_eui)
+        if session is not None and session.join is not None:
+            data['mic_check'] = 'ok' if session.join.cmac(payload[:19])[:4] == payload[19:] else 'bad'
+        return data
+
+    def dataFrame(self, payload, mtype, fopts_len):
+        uplink = mtype in uplinkTypes
+        addr = struct.unpack_from('<I', payload, 1)[0]
+        dev_addr = '%08x' % addr
+        fctrl = payload[5]
+        fcnt_key = (dev_addr, uplink)
+        fcnt = self.fcnt32(fcnt_key, payload[6] | (payload[7] << 8))
+        fopts = payload[8:8 + fopts_len]
+        mic = payload[-4:]
+        frm = payload[8 + fopts_len:-4]
+        fport = frm[0] if frm else None
+        frm = frm[1:]
+        data = {
+            'mtype': mtypes[mtype],
+            'dev_addr': dev_addr,
+            'fctrl': ' '.join(name for bit, name in (fctrlUplink if uplink else fctrlDownlink) if fctrl & bit),
+            'fcnt': fcnt,
+            'fopts': macString(fopts, uplink),
+            'fport': fport if fport is not None else '',
+            'frm_payload': frm.hex(),
+            'crypt': 'encrypted' if frm else '',
+            'mic': mic.hex(),
+            'mic_check': 'no key',
+        }
+        session = self.session(dev_addr)
+        if session is None or session.nwk is None:
+            self.keepFcnt(fcnt_key, fcnt, False)
+        if session is None:
+            return data
+        # B0 and Ai blocks: direction, DevAddr and the full frame counter
+        block = struct.pack('<BIIB', 0 if uplink else 1, addr, fcnt, 0)
+        if session.nwk is not None:
+            b0 = b'\x49\x00\x00\x00\x00' + block + bytes((len(payload) - 4,))
+            data['mic_check'] = 'ok' if session.nwk.cmac(b0 + payload[:-4])[:4] == mic else 'bad'
+            if data['mic_check'] == 'ok':
+                self.keepFcnt(fcnt_key, fcnt, True)
+        aes = session.nwk if fport == 0 else session.app
+        if frm and aes is not None:
+            stream = b''.join(aes.encrypt(b'\x01\x00\x00\x00\x00' + block + bytes((i,)))
+                              for i in range(1, (len(frm) + 15) // 16 + 1))
+            plain = bytes(a ^ b for a, b in zip(frm, stream))
+            data['frm_payload'] = plain.hex()
+            data['crypt'] = 'decrypted'
+            if fport == 0:
+                data['fopts'] = macString(plain, uplink)
+        return data
@@ -0,0 +1,107 @@
+# Collapses runs of repeated polling transactions (same MOSI, same MISO, e.g.
+# GetIrqStatus returning the same IRQs) into one PollRun frame covering the
+# run, and counts the bus time and bytes spent on the repeats: what moving
+# the firmware to DIO interrupts would save.
+# A loop may poll a few commands in turn (GetIrqStatus, GetStatus, ...): the
+# polls of a run before its first repeat make up the loop, one per opcode,
+# after that any other transaction ends the run. A command coming back with
+# another result (IRQs, chip mode) always ends it, so the change is shown.
+# Polls are held back until the run ends.
+
+try:
+    from saleae.analyzers import AnalyzerFrame
+except ImportError:
+    from headless import AnalyzerFrame
+
+# GetIrqStatus, GetDeviceErrors, GetStatus
+pollOpcodes = frozenset((0x12, 0x17, 0xc0))
+
+
+# distinct transactions in one polling loop
+MAX_LOOP = 4
+
+
+class PollRuns:
+    def __init__(self):
+        self.run = None     # [frames of the first loop, their keys by opcode, last frame, count, bus seconds]
+        self.runs = 0       # runs with repeats
+        self.repeats = 0    # transactions repeating one of the first loop of their run
+        self.bytes = 0      # and their bytes
+        self.bus_s = 0.0    # and their nSS low time
+        self.first = None   # start of the first transaction seen
+        self.last = None    # end of the last one
+
+    def add(self, frames, key, nbytes):
+        # frames of one transaction, key is None for transactions which never
+        # collapse. Returns the frames to output now, or None.
+        frame = frames[0]
+        duration = float(frame.end_time - frame.start_time)
+        if self.first is None:
+            self.first = frame.start_time
+        self.last = frame.end_time
+        run = self.run
+        if key is not None and run is not None:
+            loop_key = run[1].get(key[0])
+            if loop_key == key:
+                run[2] = frame
+                run[3] += 1
+                run[4] += duration
+                self.repeats += 1
+                self.bytes += nbytes
+                self.bus_s += duration
+                return None
+            if loop_key is None and run[3] == len(run[0]) and len(run[0]) < MAX_LOOP:
+                # no repeat yet, still in the first loop
+                run[0].append(frame)
+                run[1][key[0]] = key
+                run[2] = frame
+                run[3] += 1
+                run[4] += duration
+                return None
+        out = self.flush()
+        if key is not None:
+            self.run = [[frame], {key[0]: key}, frame, 1, duration]
+            return out
+        return out + frames if out is not None else frames
+
+    def flush(self):
+        # frames of the run in progress, if any
+        run = self.run
+        if run is None:
+            return None
+        self.run = None
+        loop, keys, last, count, bus_s = run
+        if count == len(loop):
+            return loop
+        self.runs += 1
+        first = loop[0]
+        span = float(last.end_time - first.start_time)
+        data = dict(first.data)
+        data['poll_type'] = '+'.join(f.type for f in loop)
+        data['count'] = count
+        period = float(last.start_time - first.start_time)
+        data['rate_hz'] = round((count - 1) / period, 3) if period > 0 else 0.0
+        data['span_ms'] = round(span * 1000, 3)
+        data['bus_percent'] = round(100 * bus_s / span, 3) if span > 0 else 0.0
+        return [AnalyzerFrame('PollRun', first.start_time, last.end_time, data)]
+
+    def merge(self, other):
+        self.runs += other.runs
+        self.repeats += other.repeats
+        self.bytes += other.bytes
+        self.bus_s += other.bus_s
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = other.last if self.last is None else max(self.last, other.last)
+
+    def summary(self):
+        span = float(self.last - self.first) if self.first is not None else 0.0
+        return {
+            'runs': self.runs,
+            'repeated_polls': self.repeats,
+            'wasted_bytes': self.bytes,
+            'wasted_bus_s': self.bus_s,
+            'capture_s': span,
+            'wasted_bus_percent': 100 * self.bus_s / span if span > 0 else 0.0,
+            'wasted_bytes_per_s': self.bytes / span if span > 0 else 0.0,
+        }
@@ -0,0 +1,102 @@
+# Writes which change nothing: register bytes written with the value they
+# already had, and configuration commands sent again with the same
+# parameters. Keeps the last value written per register address and per
+# command, and the bytes and bus time spent on redundant writes.
+
+# configuration commands: sending the same parameters again changes nothing
+configOpcodes = frozenset((
+    0x08,   # SetDioIrqParams
+    0x86,   # SetRfFrequency
+    0x88,   # SetCadParams
+    0x8a,   # SetPacketType
+    0x8b,   # SetModulationParams
+    0x8c,   # SetPacketParams
+    0x8e,   # SetTxParams
+    0x8f,   # SetBufferBaseAddress
+    0x93,   # SetRxTxFallbackMode
+    0x95,   # SetPaConfig
+    0x96,   # SetRegulatorMode
+    0x97,   # SetDIO3AsTcxoCtrl
+    0x9d,   # SetDIO2AsRfSwitchCtrl
+    0x9f,   # StopTimerOnPreamble
+    0xa0,   # SetLoRaSymbNumTimeout
+))
+
+WRITE_REGISTER = 0x0d
+SET_SLEEP = 0x84
+SET_PACKET_TYPE = 0x8a
+# parameters interpreted according to the packet type
+packetTypeOpcodes = (0x8b, 0x8c)
+
+# opcodes Redundant.update looks at
+opcodes = configOpcodes | {WRITE_REGISTER, SET_SLEEP}
+
+
+class Redundant:
+    def __init__(self):
+        self.regs = {}      # register address: last value written
+        self.cmds = {}      # opcode: last parameters sent
+        self.wasted = {}    # ('reg', address) or ('cmd', opcode): [redundant writes, bytes, seconds]
+
+    def getState(self):
+        return dict(self.regs), dict(self.cmds)
+
+    def setState(self, state):
+        regs, cmds = state
+        self.regs = dict(regs)
+        self.cmds = dict(cmds)
+
+    def waste(self, key, count, nbytes, seconds):
+        entry = self.wasted.get(key)
+        if entry is None:
+            entry = self.wasted[key] = [0, 0, 0.0]
+        entry[0] += count
+        entry[1] += nbytes
+        entry[2] += seconds
+
+    def update(self, mosi, duration):
+        # returns the number of redundant bytes of this transaction
+        opcode = mosi[0]
+        if opcode == WRITE_REGISTER:
+            if len(mosi) < 4:
+                return 0
+            addr = (mosi[1] << 8) | mosi[2]
+            regs = self.regs
+            per_byte = duration / len(mosi)
+            same = 0
+            for i, value in enumerate(mosi[3:]):
+                if regs.get(addr + i) == value:
+                    same += 1
+                    self.waste(('reg', addr + i), 1, 1, per_byte)
+                else:
+                    regs[addr + i] = value
+            if same == len(mosi) - 3:
+                # opcode and address were wasted too
+                self.waste(('reg', addr), 0, 3, 3 * per_byte)
+                return len(mosi)
+            return same
+        if opcode == SET_SLEEP:
+            if len(mosi) > 1 and not mosi[1] & 0x04:
+                # cold start: the configuration is lost
+                self.regs.clear()
+                self.cmds.clear()
+            return 0
+        params = bytes(mosi[1:])
+        if self.cmds.get(opcode) == params:
+            self.waste(('cmd', opcode), 1, len(mosi), duration)
+            return len(mosi)
+        if opcode == SET_PACKET_TYPE:
+            for op in packetTypeOpcodes:
+                self.cmds.pop(op, None)
+        self.cmds[opcode] = params
+        return 0
+
+    def merge(self, other):
+        for key, (count, nbytes, seconds) in other.wasted.items():
+            entry = self.wasted.get(key)
+            if entry is None:
+                self.wasted[key] = [count, nbytes, seconds]
+            else:
+                entry[0] += count
+                entry[1] += nbytes
+                entry[2] += seconds
@@ -0,0 +1,195 @@
+# Shadow copy of the SX126x configuration, updated from decoded commands.
+# Each configuration item keeps the times it changed at, so the complete
+# configuration at any time is one binary search per item.
+
+from bisect import bisect_right
+
+# frame type: (key prefix, data fields which are configuration)
+configFields = {
+    'SetPacketType': ('', ('packet_type',)),
+    'GetPacketType': ('', ('packet_type',)),
+    'SetRfFrequency': ('', ('freq_hz',)),
+    'SetModulationParamsLoRa': ('lora.', ('sf', 'bw', 'bw_khz', 'cr', 'ldro')),
+    'SetModulationParamsFSK': ('fsk.', ('bps', 'pulse_shape', 'bw_hz', 'fdev_hz')),
+    'SetModulationParamsBPSK': ('bpsk.', ('bps', 'pulse_shape')),
+    'SetPacketParamsLoRa': ('lora.', ('preamble_len', 'header_type', 'payload_len', 'crc_on', 'iq')),
+    'SetPacketParamsFSK': ('fsk.', ('preamble_len', 'detect', 'sync_word_bits', 'addr_comp', 'var_len',
+                                   'payload_len', 'crc_type', 'dc_free')),
+    'SetPacketParamsBPSK': ('bpsk.', ('payload_len',)),
+    'SetTxParams': ('tx.', ('power_dbm', 'ramp_us')),
+    'SetPaConfig': ('pa.', ('pa_duty', 'hp_max', 'device_sel', 'pa_lut')),
+    'SetDioIrqParams': ('', ('irq_mask', 'dio1_mask', 'dio2_mask', 'dio3_mask')),
+    'SetBufferBaseAddress': ('', ('tx_base', 'rx_base')),
+    'SetRxTxFallbackMode': ('', ('fallback',)),
+    'SetRegulatorMode': ('', ('regulator',)),
+    'SetDIO3AsTcxoCtrl': ('tcxo.', ('voltage', 'delay')),
+    'SetDIO2AsRfSwitchCtrl': ('dio2_rf_switch.', ('enable',)),
+    'SetCadParams': ('cad.', ('cad_symbol_num', 'cad_det_peak', 'cad_det_min', 'exit', 'timeout')),
+    'StopTimerOnPreamble': ('', ('stop_on',)),
+    'SetLoRaSymbNumTimeout': ('lora.', ('symb_num',)),
+}
+
+
+def registerKey(addr):
+    return 'reg.' + format(addr, '#05x')
+
+
+class ConfigShadow:
+    def __init__(self):
+        self.current = {}
+        self.history = {}   # key: ([times], [values]), times ascending
+
+    def seed(self, config):
+        # configuration known from before the first decoded transaction
+        for key, value in config.items():
+            self.set(float('-inf'), key, value)
+
+    def set(self, t, key, value):
+        # returns True if the value changed
+        if key in self.current and self.current[key] == value:
+            return False
+        self.current[key] = value
+        entry = self.history.get(key)
+        if entry is None:
+            entry = self.history[key] = ([], [])
+        entry[0].append(t)
+        entry[1].append(value)
+        return True
+
+    def reset(self, t):
+        # cold start sleep: the configuration is lost, items are None from t on
+        for key in self.current:
+            entry = self.history[key]
+            entry[0].append(t)
+            entry[1].append(None)
+        self.current.clear()
+
+    def update(self, t, frame_type, data):
+        # apply one decoded transaction, returns what changed (or None)
+        if frame_type == 'SetSleep':
+            if not data['warm_start']:
+                self.reset(t)
+            return None
+        if frame_type == 'WriteRegister':
+            changes = {}
+            addr = data['addr']
+            for i, value in enumerate(bytes.fromhex(data['data'])):
+                key = registerKey(addr + i)
+                if self.set(t, key, value):
+                    changes[key] = value
+            return changes
+        fields = configFields.get(frame_type)
+        if fields is None:
+            return None
+        prefix, names = fields
+        changes = {}
+        for name in names:
+            if name in data and self.set(t, prefix + name, data[name]):
+                changes[prefix + name] = data[name]
+        return changes
+
+    def snapshot(self, t):
+        # complete configuration in effect at time t
+        config = {}
+        for key, (times, values) in self.history.items():
+            i = bisect_right(times, t)
+            if i > 0 and values[i - 1] is not None:
+                config[key] = values[i - 1]
+        return config
+
+    def valueAt(self, key, t, default=None):
+        entry = self.history.get(key)
+        if entry is None:
+            return default
+        i = bisect_right(entry[0], t)
+        if i == 0 or entry[1][i - 1] is None:
+            return default
+        return entry[1][i - 1]
+
+
+def changesString(changes):
+    return ' '.join(key + '=' + str(value) for key, value in changes.items())
+
+
+def rangeMask(offset, n):
+    # bit i set for each buffer address offset..offset+n-1, wrapping at 256
+    if n >= 256:
+        return (1 << 256) - 1
+    mask = ((1 << n) - 1) << offset
+    return (mask | (mask >> 256)) & ((1 << 256) - 1)
+
+
+class BufferShadow:
+    # Shadow of the 256 byte data buffer, from WriteBuffer (MOSI) and ReadBuffer
+    # (MISO from index 3). Returns a packet event when SetTx sends a packet, and
+    # when the bytes announced by GetRxBufferStatus have all been read.
+    def __init__(self):
+        self.buf = bytearray(256)
+        self.tx_base = 0
+        self.rx_base = 0
+        self.tx_written = 0     # bytes written from tx_base, used when the payload length is unknown
+        self.rx_pending = None  # (start, length) from GetRxBufferStatus
+        self.rx_mask = 0        # addresses read since GetRxBufferStatus
+
+    def getState(self):
+        return (bytes(self.buf), self.tx_base, self.rx_base, self.tx_written, self.rx_pending, self.rx_mask)
+
+    def setState(self, state):
+        buf, self.tx_base, self.rx_base, self.tx_written, self.rx_pending, self.rx_mask = state
+        self.buf[:] = buf
+
+    def write(self, offset, data):
+        n = len(data)
+        if n > 256:
+            offset = (offset + n - 256) & 0xff
+            data = data[n - 256:]
+            n = 256
+        first = min(n, 256 - offset)
+        self.buf[offset:offset + first] = data[:first]
+        if first < n:
+            self.buf[:n - first] = data[first:]
+
+    def read(self, offset, n):
+        if offset + n <= 256:
+            return bytes(self.buf[offset:offset + n])
+        return bytes(self.buf[offset:]) + bytes(self.buf[:offset + n - 256])
+
+    def update(self, frame_type, data, mosi, miso, config):
+        if frame_type == 'WriteBuffer':
+            offset = mosi[1]
+            self.write(offset, mosi[2:])
+            if offset == self.tx_base:
+                self.tx_written = len(mosi) - 2
+            elif (offset - self.tx_base) & 0xff < self.tx_written:
+                self.tx_written = max(self.tx_written, ((offset - self.tx_base) & 0xff) + len(mosi) - 2)
+        elif frame_type == 'ReadBuffer':
+            if len(mosi) > 3:
+                offset = mosi[1]
+                self.write(offset, miso[3:])
+                if self.rx_pending is not None:
+                    self.rx_mask |= rangeMask(offset, len(miso) - 3)
+                    start, length = self.rx_pending
+                    region = rangeMask(start, length)
+                    if self.rx_mask & region == region:
+                        self.rx_pending = None
+                        return 'RxPacket', self.packet(start, length)
+        elif frame_type == 'GetRxBufferStatus':
+            self.rx_pending = (data['rx_start'], data['payload_len'])
+            self.rx_mask = 0
+        elif frame_type == 'SetBufferBaseAddress':
+            self.tx_base = data['tx_base']
+            self.rx_base = data['rx_base']
+        elif frame_type == 'SetTx':
+            packet_type = config.get('packet_type')
+            if packet_type == 'LoRa':
+                length = config.get('lora.payload_len', self.tx_written)
+            elif packet_type == 'FSK':
+                length = config.get('fsk.payload_len', self.tx_written)
+            else:
+                length = self.tx_written
+            return 'TxPacket', self.packet(self.tx_base, length)
+        return None
+
+    def packet(self, offset, length):
+        payload = self.read(offset, length)
+        return {'offset': offset, 'length': length, 'payload': payload, 'payload_hex': payload.hex()}
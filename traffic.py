@@ -0,0 +1,308 @@
+# Synthetic SX126x SPI traffic: scripted radio sessions rendered as the
+# enable/result/disable frames the Logic 2 SPI analyzer feeds to Hla.decode,
+# or as a Logic 2 SPI analyzer CSV export (readable by batch.py).
+#   python traffic.py -n 1000000 --seed 1 --mix irq-poll -o synthetic.csv
+
+import argparse
+import itertools
+import random
+import sys
+
+from headless import AnalyzerFrame
+
+# chipMode field of the status byte
+STBY_RC = 2
+STBY_XOSC = 3
+FS = 4
+RX = 5
+TX = 6
+
+RFU = 0xa2      # first MISO byte, not driven by the radio
+
+IRQ_TX_DONE = 0x0001
+IRQ_RX_DONE = 0x0002
+IRQ_PREAMBLE_DETECTED = 0x0004
+IRQ_HEADER_VALID = 0x0010
+IRQ_CRC_ERR = 0x0040
+IRQ_TIMEOUT = 0x0200
+
+# LoRa (sf, bw, ldro) and FSK (bit rate register, bandwidth) configurations
+loraModems = ((7, 0x04, 0), (9, 0x04, 0), (10, 0x05, 0), (12, 0x04, 1), (8, 0x06, 0))
+fskModems = ((0x001a0a, 0x1a), (0x0d0555, 0x0b), (0x00d555, 0x13))
+frequencies = (868100000, 868300000, 868500000, 869525000, 902300000, 915000000)
+registers = (0x0740, 0x0741, 0x06c0, 0x08e7, 0x0911, 0x0912, 0x0889, 0x08d8, 0x0736, 0x0703, 0x0704, 0x0797, 0x0798, 0x0799)
+
+# relative weight of each session in a traffic mix
+mixes = {
+    'mixed': {'init': 1, 'loraConfig': 2, 'fskConfig': 1, 'txCycle': 4, 'rxCycle': 4, 'irqPoll': 2,
+              'registerAccess': 2, 'bufferAccess': 1, 'misc': 1},
+    'irq-poll': {'irqPoll': 20, 'txCycle': 1, 'rxCycle': 1},
+    'buffer': {'bufferAccess': 10, 'txCycle': 2, 'rxCycle': 2},
+    'config': {'init': 2, 'loraConfig': 6, 'fskConfig': 3, 'registerAccess': 6, 'misc': 2},
+}
+
+HEX = tuple('0x%02X' % b for b in range(256))
+ONE_BYTE = tuple(bytes((b,)) for b in range(256))
+
+
+class TrafficGenerator:
+    def __init__(self, seed=None, mix='mixed', sck_hz=8000000, gap_s=20e-6):
+        self.rng = random.Random(seed)
+        weights = mixes[mix]
+        self.sessions = [getattr(self, name) for name in weights]
+        self.weights = list(weights.values())
+        self.byte_s = 8 / sck_hz
+        self.gap_s = gap_s
+        self.mode = STBY_RC
+        self.irq = 0
+        self.rx_len = 0
+        self.rx_start = 0x80
+        self.data = [None] * 65536  # mosi << 8 | miso -> result frame data, shared between frames
+        self.cached = {}    # (mode, MOSI) -> (MOSI, MISO) of a command, built once
+        self.statuses = {}  # (mode, n) -> RFU and n status bytes
+        self.cum_weights = list(itertools.accumulate(self.weights))
+
+    def status(self, cmdStatus=1):
+        return (self.mode << 4) | (cmdStatus << 1)
+
+    def payload(self, n):
+        return self.rng.getrandbits(8 * n).to_bytes(n, 'little') if n > 0 else b''
+
+    def statusBytes(self, n):
+        # MISO of a write: RFU then n status bytes
+        key = (self.mode, n)
+        miso = self.statuses.get(key)
+        if miso is None:
+            miso = self.statuses[key] = bytes((RFU,) + (self.status(),) * n)
+        return miso
+
+    def cmd(self, *mosi):
+        # write-only command: MISO is RFU then status. Sessions send commands
+        # from small sets of parameters, each one is only built once per mode
+        key = (self.mode, mosi)
+        transaction = self.cached.get(key)
+        if transaction is None:
+            transaction = self.cached[key] = bytes(mosi), self.statusBytes(len(mosi) - 1)
+        return transaction
+
+    def get(self, opcode, response, nop=1):
+        # read command: opcode, nop status bytes, then the response
+        n = 1 + nop + len(response)
+        return bytes((opcode,) + (0,) * (n - 1)), self.statusBytes(nop) + bytes(response)
+
+    def setRfFrequency(self, hz):
+        frf = (hz << 14) // 15625
+        return self.cmd(0x86, *frf.to_bytes(4, 'big'))
+
+    def writeRegister(self, addr, data):
+        return bytes((0x0d, addr >> 8, addr & 0xff)) + data, self.statusBytes(2 + len(data))
+
+    def readRegister(self, addr, data):
+        mosi = bytes((0x1d, addr >> 8, addr & 0xff, 0)) + bytes(len(data))
+        return mosi, self.statusBytes(3) + data
+
+    def writeBuffer(self, offset, data):
+        return bytes((0x0e, offset)) + data, self.statusBytes(1 + len(data))
+
+    def readBuffer(self, offset, data):
+        return bytes((0x1e, offset, 0)) + bytes(len(data)), self.statusBytes(2) + data
+
+    def getIrqStatus(self):
+        key = (self.mode, 0x12, self.irq)
+        transaction = self.cached.get(key)
+        if transaction is None:
+            transaction = self.cached[key] = self.get(0x12, self.irq.to_bytes(2, 'big'))
+        return transaction
+
+    # sessions
+
+    def init(self):
+        rng = self.rng
+        self.mode = STBY_RC
+        yield self.cmd(0x84, rng.choice((0x00, 0x04)))          # SetSleep
+        yield b'', b''                                          # wake up pulse
+        yield self.cmd(0x80, 0)                                 # SetStandby
+        yield self.cmd(0x96, 1)                                 # SetRegulatorMode
+        yield self.cmd(0x97, 2, 0x00, 0x01, 0x40)               # SetDIO3AsTcxoCtrl
+        yield self.cmd(0x89, 0x7f)                              # Calibrate
+        yield self.cmd(0x98, *rng.choice(((0xd7, 0xd8), (0xe1, 0xe9))))  # CalImg
+        yield self.cmd(0x9d, 1)                                 # SetDIO2AsRfSwitchCtrl
+        yield self.cmd(0x93, rng.choice((0x20, 0x30, 0x40)))    # SetRxTxFallbackMode
+        yield self.get(0x17, (0, 0))                            # GetDeviceErrors
+        yield self.cmd(0x07, 0, 0)                              # ClearDeviceErrors
+        self.mode = STBY_XOSC
+        yield self.cmd(0x80, 1)
+
+    def loraConfig(self):
+        rng = self.rng
+        sf, bw, ldro = rng.choice(loraModems)
+        yield self.cmd(0x8a, 1)                                 # SetPacketType
+        yield self.setRfFrequency(rng.choice(frequencies))
+        yield self.cmd(0x8b, sf, bw, rng.randint(1, 4), ldro)   # SetModulationParams
+        yield self.cmd(0x8c, 0, 8, 0, rng.randint(1, 255), 1, 0)  # SetPacketParams
+        yield self.cmd(0x8f, 0x00, 0x80)                        # SetBufferBaseAddress
+        yield self.cmd(0x95, 4, 7, 0, 1)                        # SetPaConfig
+        yield self.cmd(0x8e, rng.choice((0x0e, 0x16, 0xf7)), 4)  # SetTxParams
+        yield self.cmd(0x08, 0x02, 0x43, 0x02, 0x43, 0, 0, 0, 0)  # SetDioIrqParams
+        yield self.writeRegister(0x0740, rng.choice((b'\x34\x44', b'\x14\x24')))
+        yield self.writeRegister(0x08e7, b'\x38')
+
+    def fskConfig(self):
+        rng = self.rng
+        br, bw = rng.choice(fskModems)
+        yield self.cmd(0x8a, 0)
+        yield self.setRfFrequency(rng.choice(frequencies))
+        yield self.cmd(0x8b, *br.to_bytes(3, 'big'), 0x09, bw, 0x00, 0x0c, 0xcc)
+        yield self.cmd(0x8c, 0, 32, 5, 16, 0, 1, rng.randint(1, 255), 2, 1)
+        yield self.writeRegister(0x06c0, self.payload(8))
+        yield self.cmd(0x8f, 0x00, 0x80)
+
+    def poll(self, n, done):
+        self.irq = 0
+        for _ in range(n):
+            yield self.getIrqStatus()
+        self.irq = done
+        yield self.getIrqStatus()
+        yield self.cmd(0x02, (done >> 8) & 0xff, done & 0xff)  # ClearIrqStatus
+        self.irq = 0
+
+    def txCycle(self):
+        rng = self.rng
+        n = rng.randint(1, 255)
+        yield self.writeBuffer(0, self.payload(n))
+        yield self.cmd(0x83, 0, 0, 0)                           # SetTx
+        self.mode = TX
+        yield from self.poll(rng.randint(0, 20), IRQ_TX_DONE)
+        self.mode = STBY_RC
+
+    def rxCycle(self):
+        rng = self.rng
+        yield self.cmd(0x82, *rng.choice(((0xff, 0xff, 0xff), (0, 0x3e, 0x80), (0, 0, 0))))  # SetRx
+        self.mode = RX
+        if rng.random() < 0.1:
+            yield from self.poll(rng.randint(0, 20), IRQ_TIMEOUT)
+            self.mode = STBY_RC
+            return
+        done = IRQ_RX_DONE | IRQ_PREAMBLE_DETECTED | IRQ_HEADER_VALID
+        if rng.random() < 0.05:
+            done |= IRQ_CRC_ERR
+        self.irq = 0
+        for _ in range(rng.randint(0, 20)):
+            yield self.getIrqStatus()
+        self.irq = done
+        yield self.getIrqStatus()
+        self.rx_len = rng.randint(1, 255)
+        yield self.get(0x13, (self.rx_len, self.rx_start))      # GetRxBufferStatus
+        yield self.readBuffer(self.rx_start, self.payload(self.rx_len))
+        yield self.get(0x14, (rng.randint(40, 240), rng.randint(0, 80), rng.randint(40, 240)))  # GetPacketStatus
+        yield self.cmd(0x02, (done >> 8) & 0xff, done & 0xff)
+        self.irq = 0
+        self.mode = STBY_RC
+
+    def irqPoll(self):
+        for _ in range(self.rng.randint(50, 500)):
+            yield self.getIrqStatus()
+            yield self.get(0xc0, (), nop=0)                     # GetStatus
+
+    def registerAccess(self):
+        rng = self.rng
+        for _ in range(rng.randint(1, 8)):
+            addr = rng.choice(registers)
+            n = rng.randint(1, 4)
+            if rng.random() < 0.5:
+                yield self.writeRegister(addr, self.payload(n))
+            else:
+                yield self.readRegister(addr, self.payload(n))
+
+    def bufferAccess(self):
+        rng = self.rng
+        yield self.writeBuffer(0, self.payload(255))
+        yield self.readBuffer(0, self.payload(255))
+        offset = rng.randint(0, 255)
+        yield self.writeBuffer(offset, self.payload(rng.randint(1, 255 - offset + 1)))
+
+    def misc(self):
+        rng = self.rng
+        yield self.get(0x10, (rng.randint(0, 255), rng.randint(0, 5), 0, 0, 0, 0))  # GetStats
+        yield self.cmd(0x00, 0, 0, 0, 0, 0, 0)                  # ResetStats
+        yield self.get(0x15, (rng.randint(40, 240),))           # GetRssiInst
+        yield self.get(0x11, (rng.choice((0, 1)),))             # GetPacketType
+        yield self.cmd(0x88, 2, 22, 10, 0, 0, 0)                # SetCadParams
+        yield self.cmd(0xc5)                                    # SetCad
+        yield self.cmd(0xc1)                                    # SetFs
+        yield self.cmd(0x94, 0, 0x10, 0, 0, 0x40, 0)            # SetRxDutyCycle
+        yield self.cmd(0x9f, rng.choice((0, 1)))                # StopTimerOnPreamble
+        yield self.cmd(0xa0, rng.randint(0, 20))                # SetLoRaSymbNumTimeout
+        yield self.cmd(0xd1)                                    # SetTxContinuousWave
+        yield self.cmd(0xd2)                                    # SetTxInfinitePreamble
+        yield self.cmd(0x80, 0)
+
+    def transactions(self, count):
+        # yields count (mosi, miso) transactions from randomly chosen sessions
+        choices = self.rng.choices
+        sessions = self.sessions
+        cum_weights = self.cum_weights
+        while True:
+            session = choices(sessions, cum_weights=cum_weights)[0]
+            for transaction in session():
+                yield transaction
+                count -= 1
+                if count <= 0:
+                    return
+
+    def frames(self, count, t=0.0):
+        # Yields the SPI analyzer frames for count transactions. As with
+        # headless.readSpiCsv, frame objects are reused and only valid until the
+        # next one is produced.
+        data = self.data
+        byte_s = self.byte_s
+        enable = AnalyzerFrame('enable', t, t)
+        result = AnalyzerFrame('result', t, t)
+        disable = AnalyzerFrame('disable', t, t)
+        jitter = self.rng.random
+        gap_s = self.gap_s
+        for mosi, miso in self.transactions(count):
+            enable.start_time = enable.end_time = t
+            yield enable
+            for m, s in zip(mosi, miso):
+                d = data[m << 8 | s]
+                if d is None:
+                    d = data[m << 8 | s] = {'mosi': ONE_BYTE[m], 'miso': ONE_BYTE[s]}
+                result.start_time = t
+                t += byte_s
+                result.end_time = t
+                result.data = d
+                yield result
+            disable.start_time = disable.end_time = t
+            yield disable
+            t += gap_s * (0.5 + jitter())
+
+    def writeCsv(self, f, count):
+        # Logic 2 SPI analyzer table export, as read by batch.py
+        write = f.write
+        write('name,type,start_time,duration,"mosi","miso"\n')
+        dur = repr(self.byte_s)
+        for frame in self.frames(count):
+            if frame.type == 'result':
+                write('"SPI","result",%r,%s,%s,%s\n' % (frame.start_time, dur,
+                      HEX[frame.data['mosi'][0]], HEX[frame.data['miso'][0]]))
+            else:
+                write('"SPI","%s",%r,0.0,,\n' % (frame.type, frame.start_time))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate synthetic SX126x SPI traffic as a Logic 2 SPI analyzer CSV export.')
+    parser.add_argument('-n', '--count', type=int, default=100000, help='number of SPI transactions')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('-m', '--mix', choices=sorted(mixes), default='mixed')
+    parser.add_argument('-o', '--output', default='-', help='output file, default stdout')
+    args = parser.parse_args(argv)
+
+    f = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    TrafficGenerator(args.seed, args.mix).writeCsv(f, args.count)
+    if f is not sys.stdout:
+        f.close()
+
+
+if __name__ == '__main__':
+    main()